@@ -3,26 +3,50 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 import math
-import pickle
 import select
+import signal
+import socket
 import struct
+import asyncio
 import hashlib
 import argparse
+import multiprocessing
 import util.bt_utils as bt_utils
 import util.simsocket as simsocket
+import util.piece_picker as piece_picker
+import util.timer_queue as timer_queue
+import util.packet as packet
+import util.congestion as congestion
+import util.chunk_sink as chunk_sink
 from typing import Dict
-from time import time
-from collections import deque
+from time import time  # a module global, util/virtual_swarm.py swaps in its virtual clock
 
 BUF_SIZE = 1400
 CHUNK_DATA_SIZE = 512 * 1024
-FORMAT = '!HBBHHII'
-HEADER_LEN = struct.calcsize(FORMAT)
-MAX_PAYLOAD = 1024
-MAGIC = 52305
-TEAM = 15
+FORMAT = packet.FORMAT
+HEADER_LEN = packet.HEADER_LEN
+MAX_PAYLOAD = packet.MAX_PAYLOAD
+CHUNK_PKT_NUM = math.ceil(CHUNK_DATA_SIZE / MAX_PAYLOAD)
+SHA1_LEN = 20
+HASHES_PER_PKT = MAX_PAYLOAD // SHA1_LEN
+MAGIC = packet.MAGIC
+TEAM = packet.TEAM
 ALPHA = 0.125
 BETA = 0.25
+DENIED_BACKOFF = 1
+MAX_SOURCES = 4
+MIN_STEAL_PKTS = 32
+WHOHAS_INTERVAL = 60
+MAX_DRAIN = 64
+ACK_DELAY = 0.01
+DEFAULT_TIMEOUT = 10
+MIN_TIMEOUT = 0.05
+SAVE_EVERY = 64  # pkts of a chunk in progress received between saves to its partial file, a crash loses fewer
+CRASH_RTOS = 4  # with an RTT estimate, a source that sent nothing for this many RTOs is considered gone
+PACE_QUANTUM = 0.001  # a paced sender may run this far ahead of its schedule, i.e. send small bursts
+SHARD_STOP_WAIT = 1  # on SIGINT, how long a --shards peer waits for its workers to stop
+FORWARD_HEADER = struct.Struct("!4sH")  # sender ip and port put before a pkt the dispatcher hands to a shard
+DUP_THRESH = 3  # with SACK a hole is lost once this many seqs above it arrived (RFC 6675)
 
 config = None
 downloading = False
@@ -33,8 +57,13 @@ class RTT_Info:
         self.estimated_rtt = None
         self.dev_rtt = None
         self.timeout_interval = None
+        self.min_rtt = None
+        self.ts_recent = None  # with --timestamps, the last timestamp the peer sent us, echoed back
+        self.ts_recent_time = 0
 
     def update_info(self, sample_rtt):
+        if self.min_rtt is None or sample_rtt < self.min_rtt:
+            self.min_rtt = sample_rtt
         if self.estimated_rtt is None:
             self.estimated_rtt = sample_rtt
             self.dev_rtt = 0
@@ -44,7 +73,12 @@ class RTT_Info:
             self.estimated_rtt = (1 - ALPHA) * self.estimated_rtt + ALPHA * sample_rtt
             self.dev_rtt = (1 - BETA) * self.dev_rtt + BETA * abs(sample_rtt - self.estimated_rtt)
             if config.timeout is None:
-                self.timeout_interval = self.estimated_rtt + 4 * self.dev_rtt
+                deviation = 4 * self.dev_rtt
+                if config.pace:
+                    # never below MIN_TIMEOUT (RFC 6298's clock granularity): paced ACKs come back so evenly
+                    # that dev_rtt falls to ~0 and any jitter would time out
+                    deviation = max(deviation, MIN_TIMEOUT)
+                self.timeout_interval = self.estimated_rtt + deviation
 
 
 class Ack_Record:
@@ -53,39 +87,163 @@ class Ack_Record:
         self.sending_chunk_hash = ''
         self.sending_time = dict()
         self.max_seq = 0
-        self.ack_packet = set()
+        self.ack_packet = set()  # seqs the receiver has, ACKed or SACKed
+        self.high_sacked = 0
+        self.last_sack = b''
+        self.recovery_point = 0  # max_seq when a SACK recovery began, 0 outside of one
+        self.retransmitted = set()  # holes resent in the current recovery
+        self.next_send_time = 0  # with --pace, when the next new DATA pkt is due
+        self.pace_timer = None
         self.cwnd = 1.0
-        self.ssthresh = 64
-        self.mode = 0
+        self.ssthresh = congestion.INIT_SSTHRESH
+        self.mode = 0  # the controller's phase, for Reno 0 slow start, 1 congestion avoidance, 2 fast recovery
         self.duplicated_ack = 0
+        self.cc = congestion.Reno()  # sets cwnd, ssthresh, mode and duplicated_ack
         self.transfer_num: Dict[int, int] = dict()
         self.next_seq_num = 1
+        self.last_seq = CHUNK_PKT_NUM
+        self.chunk_tag = 0
+
+
+class Chunk_Buffer:
+    # one per chunk being downloaded, shared by every peer sending a range of it
+    def __init__(self, chunk_hash: str):
+        self.chunk_hash = chunk_hash
+        self.tag = chunk_tag(chunk_hash)
+        # preallocated receive buffer, DATA seq n is written at (n - 1) * MAX_PAYLOAD
+        self.received_chunk = bytearray(CHUNK_DATA_SIZE)
+        self.received_view = memoryview(self.received_chunk)
+        self.received_map = bytearray(CHUNK_PKT_NUM)  # received_map[seq - 1] == 1 once seq arrived
+        self.unsaved = []  # seqs received since the last save to the output's partial file
+        if sink is not None:
+            # with the pkts an earlier attempt saved, if any
+            sink.load_partial(chunk_hash, self.received_chunk, self.received_map)
+        # in-order frontier over the whole chunk
+        first_missing = self.received_map.find(0)
+        self.ack = CHUNK_PKT_NUM if first_missing < 0 else first_missing
+        # fed as the in-order ack frontier advances, so the digest is ready with the last byte
+        self.sha1 = hashlib.sha1(self.received_view[:min(self.ack * MAX_PAYLOAD, CHUNK_DATA_SIZE)])
+        self.block_sums = None  # per-block SHA-1 from the sender, only while locating bad blocks
+        self.block_checked = False
+        self.orphans = []  # (first, last) ranges left over by peers that stopped sending
+
+    def missing(self):
+        # the first and last seq not received yet
+        return self.ack + 1, self.received_map.rfind(0) + 1
+
+    def save(self):
+        # write the unsaved pkts, coalesced into runs, and the map to the partial file
+        if sink is None:
+            return
+        ranges = []
+        for seq in sorted(self.unsaved):
+            left = (seq - 1) * MAX_PAYLOAD
+            right = min(seq * MAX_PAYLOAD, CHUNK_DATA_SIZE)
+            if len(ranges) > 0 and ranges[-1][1] == left:
+                ranges[-1][1] = right
+            else:
+                ranges.append([left, right])
+        sink.save_partial(self.chunk_hash, self.received_view, ranges, self.received_map)
+        self.unsaved = []
 
 
 class Data_Info:
-    def __init__(self):
-        self.received_chunk = b''
-        self.buffer: Dict[int, bytes] = dict()
-        self.ack = 0
-        self.received_pkt = set()
-        self.downloading_chunk_hash = ''
-        self.last_receive_time = None
+    # one per peer we are downloading from, it sends the DATA seqs [first_seq, last_seq] of chunk
+    def __init__(self, chunk: Chunk_Buffer, first_seq=1, last_seq=CHUNK_PKT_NUM):
+        self.chunk = chunk
+        self.downloading_chunk_hash = chunk.chunk_hash
+        self.first_seq = first_seq
+        self.last_seq = last_seq
+        self.ack = first_seq - 1  # in-order frontier within the range, this is what the sender is ACKed
+        self.steal_end = last_seq  # seqs after steal_end were also handed to another peer
+        self.last_receive_time = time()
+        self.unacked = 0  # in-order DATA pkts received since the last ACK
+        self.last_data_seq = 0
+        self.ack_timer = None
 
 
 ack_records: Dict[tuple, Ack_Record] = dict()
 data_info: Dict[tuple, Data_Info] = dict()
-hash_peer_list: Dict[str, deque] = dict()
+picker = piece_picker.PiecePicker()  # who has which hash, and which wanted hash to GET next
+denied_until: Dict[tuple, float] = dict()
+block_sums: Dict[str, list] = dict()
 rtt_info: Dict[tuple, RTT_Info] = dict()
+controllers = dict()  # {receiver addr: congestion controller}
 received_hash = dict()
-unfetch_hash = set()
+sink = None  # the output file of the current DOWNLOAD, verified chunks are written to it as they complete
+shard = None  # with --shards, which of the worker processes this one is
+upload_counts = None  # with --shards, len(ack_records) of every shard in shared memory
 target_hash = set()
 last_who_has = None
+# retransmission, crash detection, DENIED backoff and the WHOHAS refresh all run off these timers
+timers = timer_queue.TimerQueue()
+whohas_timer = None
+
+
+def chunk_tag(chunk_hash: str):
+    # DATA carries the first 4 bytes of its chunk hash in the ack field
+    return int(chunk_hash[:8], 16)
+
+
+def pack_hash_pkts(type_code: int, hash_list: list, addr: tuple):
+    # |header| hash1 (20 bytes) | hash2 | ... , at most HASHES_PER_PKT hashes per pkt
+    pkts = []
+    for i in range(0, len(hash_list), HASHES_PER_PKT):
+        payload = b''.join(bytes.fromhex(hash_str) for hash_str in hash_list[i:i + HASHES_PER_PKT])
+        pkts.append(packet.encode(type_code, payload, stamp=stamp(addr)))
+    return pkts
+
+
+def clock_us():
+    # 0 means no echo, so no timestamp is 0
+    return round(time() * 1e6) % packet.TS_MOD or 1
+
+
+def stamp(addr: tuple):
+    # the timestamp extension of a pkt to addr, None without --timestamps
+    if not config.timestamps:
+        return None
+    info = rtt_info.get(addr)
+    if info is None or info.ts_recent is None:
+        return clock_us(), 0, 0
+    return clock_us(), info.ts_recent, min(round((time() - info.ts_recent_time) * 1e6), packet.TS_MOD - 1)
+
+
+def take_stamp(addr: tuple, pkt: bytes):
+    # keep addr's timestamp to echo it, and sample the RTT if the pkt echoes one of ours. Any pkt
+    # gives a sample, the time the echo waited at addr is left out
+    info = rtt_info.get(addr)
+    ts = packet.parse_stamp(pkt)
+    if info is None or ts is None:
+        return None
+    value, echo, delay = ts
+    info.ts_recent = value
+    info.ts_recent_time = time()
+    if echo == 0:
+        return None
+    elapsed = (clock_us() - echo) % packet.TS_MOD - delay
+    if elapsed < 0:
+        return None
+    sample_rtt = elapsed / 1e6
+    info.update_info(sample_rtt)
+    return sample_rtt
+
+
+def unpack_hashes(data: bytes):
+    return [data[i:i + SHA1_LEN].hex() for i in range(0, len(data) - SHA1_LEN + 1, SHA1_LEN)]
 
 
 def process_download(sock, chunkfile, outputfile):
-    global downloading
+    global downloading, sink
     downloading = True
     config.output_file = outputfile
+    # chunks an interrupted run of the same DOWNLOAD already wrote are not fetched again
+    sink = chunk_sink.ChunkSink(outputfile)
+    for chunk_hash in sink.resumed:
+        config.haschunks[chunk_hash] = received_hash[chunk_hash] = sink[chunk_hash]
+    # the output holds every chunk received, also those of an earlier DOWNLOAD
+    for chunk_hash, chunk_data in received_hash.items():
+        sink.add(chunk_hash, chunk_data)
     with open(chunkfile, 'r') as cf:
         while True:
             line = cf.readline().strip()
@@ -93,94 +251,411 @@ def process_download(sock, chunkfile, outputfile):
                 break
             _, hash_str = line.split(" ")
             target_hash.add(hash_str)
-            unfetch_hash.add(hash_str)
+            if hash_str not in received_hash and not take_cached(hash_str):
+                picker.want(hash_str)
     send_whohas(sock)
 
 
+def take_cached(chunk_hash: str):
+    # a chunk another peer on this host already has in the shared cache is not downloaded at all
+    if config.cache is None:
+        return False
+    chunk_data = config.cache.get(chunk_hash)
+    if chunk_data is None or hashlib.sha1(chunk_data).hexdigest() != chunk_hash:
+        return False
+    sink.add(chunk_hash, chunk_data)
+    config.haschunks[chunk_hash] = received_hash[chunk_hash] = chunk_data
+    return True
+
+
 def process_inbound_udp(sock):
     # Receive pkt
     pkt, from_addr = sock.recvfrom(BUF_SIZE)
-    magic, team, type_code, hlen, plen, seq, ack = struct.unpack(FORMAT, pkt[:HEADER_LEN])
-    if magic != MAGIC:
+    process_pkt(sock, pkt, from_addr)
+
+
+def drain_inbound_udp(sock):
+    # every pkt already queued on the socket, at most MAX_DRAIN so timers and stdin are not starved.
+    # With --batch-io that is one recvmmsg
+    for pkt, from_addr in sock.recvfrom_many(BUF_SIZE, MAX_DRAIN):
+        process_pkt(sock, pkt, from_addr)
+
+
+def process_pkt(sock, pkt: bytes, from_addr: tuple):
+    parsed = packet.parse(pkt)
+    if parsed is None:
         return
-    data = pkt[HEADER_LEN:]
-    if type_code == 0:
-        chunk_hash = data.decode()
-        if chunk_hash in config.haschunks:
-            ihave_header = struct.pack(FORMAT, MAGIC, TEAM, 1, HEADER_LEN, HEADER_LEN + len(chunk_hash), 0, 0)
-            ihave_pkt = ihave_header + chunk_hash.encode()
+    # data is a view into pkt, it is copied only where it is kept
+    type_code, seq, ack, data = parsed
+    sample_rtt = take_stamp(from_addr, pkt) if config.timestamps else None
+    if type_code == packet.WHOHAS:
+        # WHOHAS and IHAVE carry up to HASHES_PER_PKT raw 20-byte hashes
+        has_hashes = [chunk_hash for chunk_hash in unpack_hashes(data) if chunk_hash in config.haschunks]
+        for ihave_pkt in pack_hash_pkts(packet.IHAVE, has_hashes, from_addr):
             sock.sendto(ihave_pkt, from_addr)
-    elif type_code == 1:
-        chunk_hash = data.decode()
-        if chunk_hash not in hash_peer_list:
-            hash_peer_list[chunk_hash] = deque()
-        if from_addr not in hash_peer_list[chunk_hash]:
-            hash_peer_list[chunk_hash].append(from_addr)
-    elif type_code == 2:
-        sending_chunk_hash = data.decode()
-        if len(ack_records) >= config.max_conn:
-            denied_header = struct.pack(FORMAT, MAGIC, TEAM, 5, HEADER_LEN, HEADER_LEN + len(sending_chunk_hash), 0, 0)
-            sock.sendto(denied_header + sending_chunk_hash.encode(), from_addr)
+    elif type_code == packet.IHAVE:
+        for chunk_hash in unpack_hashes(data):
+            picker.add_holder(chunk_hash, from_addr)
+    elif type_code == packet.GET:
+        sending_chunk_hash = data[:SHA1_LEN].hex()
+        # seq and ack of a GET carry an optional [first, last] range of DATA seqs, 0 for the whole chunk
+        first_seq, last_seq = (seq, ack) if seq > 0 else (1, CHUNK_PKT_NUM)
+        if not 1 <= first_seq <= last_seq <= CHUNK_PKT_NUM:
+            return
+        if from_addr not in ack_records and uploads() >= config.max_conn:
+            sock.sendto(packet.encode(packet.DENIED, bytes.fromhex(sending_chunk_hash), stamp=stamp(from_addr)), from_addr)
             return
         record = Ack_Record()
+        # one controller per receiver, what it learned carries over to the next chunk
+        if from_addr not in controllers:
+            controllers[from_addr] = congestion.CONTROLLERS[config.congestion]()
+        record.cc = controllers[from_addr]
+        record.cc.start(record)
         record.sending_chunk_hash = sending_chunk_hash
-        record.next_seq_num = 2
+        record.chunk_tag = chunk_tag(sending_chunk_hash)
+        record.ack = first_seq - 1
+        record.last_seq = last_seq
+        record.next_seq_num = first_seq + 1
         ack_records[from_addr] = record
-        send_data(sock, from_addr, 1)
-    elif type_code == 3:
-        process_data(sock, from_addr, data, seq)
-    elif type_code == 4:
-        process_ack(sock, from_addr, seq, ack)
-    elif type_code == 5:
-        chunk_hash = data.decode()
-        if chunk_hash in hash_peer_list:
-            hash_peer_list[chunk_hash].append(hash_peer_list[chunk_hash].popleft())
-            unfetch_hash.add(chunk_hash)
-            if from_addr in data_info:
-                del data_info[from_addr]
+        send_data(sock, from_addr, first_seq)
+    elif type_code == packet.DATA:
+        # DATA still in flight from a cancelled GET must not land in the next chunk asked from that peer.
+        # Senders that do not tag their DATA put 0 in the ack field as the protocol says, that is accepted
+        record = data_info.get(from_addr)
+        if record is not None and (ack == 0 or record.chunk.tag == ack):
+            process_data(sock, from_addr, data, seq)
+    elif type_code == packet.ACK:
+        process_ack(sock, from_addr, seq, ack, data, sample_rtt)
+    elif type_code == packet.DENIED:
+        chunk_hash = data[:SHA1_LEN].hex()
+        if from_addr in data_info and data_info[from_addr].downloading_chunk_hash == chunk_hash:
+            # let other holders serve it for a while before asking this peer again
+            denied_until[from_addr] = time() + DENIED_BACKOFF
+            drop_source(from_addr)
+            timers.schedule(denied_until[from_addr], send_get, sock)
+    elif type_code == packet.BLOCKSUM_REQUEST:
+        send_block_sums(sock, from_addr, data[:SHA1_LEN].hex())
+    elif type_code == packet.BLOCKSUM:
+        process_block_sums(sock, from_addr, data, seq)
+    elif type_code == packet.CANCEL:
+        # CANCEL: the receiver got the chunk elsewhere
+        record = ack_records.get(from_addr)
+        if record is not None and record.sending_chunk_hash == data[:SHA1_LEN].hex():
+            del ack_records[from_addr]
+
+
+def uploads():
+    # max_conn holds for all the shards of a peer together
+    if upload_counts is None:
+        return len(ack_records)
+    upload_counts[shard] = len(ack_records)
+    return sum(upload_counts)
 
 
 def process_data(sock: simsocket.SimSocket, addr: tuple, data: bytes, seq: int):
     record = data_info.get(addr)
     if record is None:
         return
+    left = (seq - 1) * MAX_PAYLOAD
+    right = min(seq * MAX_PAYLOAD, CHUNK_DATA_SIZE)
+    if seq < 1 or seq > CHUNK_PKT_NUM or len(data) != right - left:
+        return
     record.last_receive_time = time()
-    if seq not in record.received_pkt:
-        record.buffer[seq] = data
-        record.received_pkt.add(seq)
-        while record.ack + 1 in record.received_pkt:
-            record.ack += 1
-            record.received_chunk += record.buffer[record.ack]
-            del record.buffer[record.ack]
-        pkt = struct.pack(FORMAT, MAGIC, TEAM, 4, HEADER_LEN, HEADER_LEN, seq, record.ack)
-        if len(record.received_chunk) == CHUNK_DATA_SIZE:
-            sha1 = hashlib.sha1()
-            sha1.update(record.received_chunk)
-            received_chunk_hash_str = sha1.hexdigest()
-            if received_chunk_hash_str == record.downloading_chunk_hash:
-                config.haschunks[record.downloading_chunk_hash] = record.received_chunk
-                received_hash[record.downloading_chunk_hash] = record.received_chunk
-            else:
-                unfetch_hash.add(record.downloading_chunk_hash)
-            del data_info[addr]
+    chunk = record.chunk
+    completed = False
+    if not chunk.received_map[seq - 1]:
+        chunk.received_view[left:right] = data
+        chunk.received_map[seq - 1] = 1
+        hashed = chunk.ack
+        while chunk.ack < CHUNK_PKT_NUM and chunk.received_map[chunk.ack]:
+            chunk.ack += 1
+        if chunk.ack > hashed:
+            chunk.sha1.update(chunk.received_view[hashed * MAX_PAYLOAD:min(chunk.ack * MAX_PAYLOAD, CHUNK_DATA_SIZE)])
+        completed = chunk.ack == CHUNK_PKT_NUM
+        if sink is not None:
+            chunk.unsaved.append(seq)
+            if len(chunk.unsaved) >= SAVE_EVERY:
+                chunk.save()
+    # seqs delivered by other peers count as received, the ack never passes the end of this peer's range
+    acked = record.ack
+    while record.ack < record.last_seq and chunk.received_map[record.ack]:
+        record.ack += 1
+    record.unacked += 1
+    record.last_data_seq = seq
+    # in-order pkts may share one cumulative ACK, anything that opens or fills a gap is ACKed at once
+    # so that the sender still sees duplicate ACKs
+    in_order = acked == seq - 1 and record.ack == seq
+    if in_order and record.unacked < config.ack_every and record.ack < record.last_seq:
+        if record.ack_timer is None:
+            record.ack_timer = timers.schedule(time() + ACK_DELAY, send_delayed_ack, sock, addr, record)
     else:
-        pkt = struct.pack(FORMAT, MAGIC, TEAM, 4, HEADER_LEN, HEADER_LEN, seq, record.ack)
-    sock.sendto(pkt, addr)
+        send_ack(sock, addr, record)
+    if completed:
+        finish_chunk(sock, addr, chunk)
+    elif record.ack == record.last_seq and chunk.ack < CHUNK_PKT_NUM and chunk.block_sums is None:
+        # this peer is done with its range while others are still sending
+        del data_info[addr]
+        if config.multi_source:
+            assign_range(sock, addr, chunk)
+
+
+def send_ack(sock: simsocket.SimSocket, addr: tuple, record: Data_Info):
+    timers.cancel(record.ack_timer)
+    record.ack_timer = None
+    record.unacked = 0
+    payload = b''
+    if config.sack and record.ack < record.last_seq:
+        payload = packet.encode_sack(sack_blocks(record))
+    sock.sendto(packet.encode(packet.ACK, payload, seq=record.last_data_seq, ack=record.ack, stamp=stamp(addr)), addr)
+
+
+def sack_blocks(record: Data_Info):
+    # (first, last) runs of seqs above the ack that are in the chunk buffer, within this peer's range
+    received_map = record.chunk.received_map
+    blocks = []
+    start = record.ack  # received_map index of seq ack + 1
+    while len(blocks) < packet.MAX_SACK_BLOCKS:
+        first = received_map.find(1, start, record.last_seq)
+        if first < 0:
+            break
+        last = received_map.find(0, first, record.last_seq)
+        if last < 0:
+            last = record.last_seq
+        blocks.append((first + 1, last))
+        start = last
+    return blocks
+
+
+def send_delayed_ack(sock: simsocket.SimSocket, addr: tuple, record: Data_Info):
+    record.ack_timer = None
+    if data_info.get(addr) is record and record.unacked > 0:
+        send_ack(sock, addr, record)
+
+
+def finish_chunk(sock: simsocket.SimSocket, addr: tuple, chunk: Chunk_Buffer):
+    sources = [a for a in data_info if data_info[a].chunk is chunk]
+    if chunk.sha1.hexdigest() == chunk.chunk_hash:
+        keep_chunk(chunk)
+    elif config.block_check and not chunk.block_checked:
+        # ask the sender for per-block checksums to find the bad blocks instead of dropping the chunk
+        chunk.block_checked = True
+        chunk.block_sums = [None] * CHUNK_PKT_NUM
+        sock.sendto(packet.encode(packet.BLOCKSUM_REQUEST, bytes.fromhex(chunk.chunk_hash), stamp=stamp(addr)), addr)
+        # the repair is done with addr alone
+        for source in sources:
+            if source != addr:
+                send_cancel(sock, source, chunk.chunk_hash)
+                del data_info[source]
+        return
+    else:
+        drop_partial(chunk.chunk_hash)
+        picker.want(chunk.chunk_hash)
+    for source in sources:
+        if source != addr:
+            # duplicate (end-game) or overlapping (stolen) ranges are still being sent
+            send_cancel(sock, source, chunk.chunk_hash)
+        del data_info[source]
+
+
+def keep_chunk(chunk: Chunk_Buffer):
+    if sink is not None:
+        # written out at once and served from the file, the buffer goes away with the chunk
+        sink.add(chunk.chunk_hash, chunk.received_view)
+        sink.drop_partial(chunk.chunk_hash)
+        chunk_data = sink[chunk.chunk_hash]
+    else:
+        chunk_data = bytes(chunk.received_chunk)
+    if config.cache is not None:
+        config.cache.put(chunk.chunk_hash, chunk.received_view)
+    config.haschunks[chunk.chunk_hash] = chunk_data
+    received_hash[chunk.chunk_hash] = chunk_data
+
+
+def drop_partial(chunk_hash: str):
+    # the pkts received so far are no good, the next attempt starts from nothing
+    if sink is not None:
+        sink.drop_partial(chunk_hash)
+
+
+def open_chunk(chunk_hash: str):
+    # the receive buffer of a chunk, with the pkts of an earlier attempt unless they were all there and wrong
+    chunk = Chunk_Buffer(chunk_hash)
+    if chunk.ack == CHUNK_PKT_NUM and chunk.sha1.hexdigest() != chunk_hash:
+        drop_partial(chunk_hash)
+        chunk = Chunk_Buffer(chunk_hash)
+    return chunk
+
+
+def send_cancel(sock: simsocket.SimSocket, addr: tuple, chunk_hash: str):
+    sock.sendto(packet.encode(packet.CANCEL, bytes.fromhex(chunk_hash), stamp=stamp(addr)), addr)
+
+
+def send_block_sums(sock: simsocket.SimSocket, addr: tuple, chunk_hash: str):
+    if chunk_hash not in config.haschunks:
+        return
+    if chunk_hash not in block_sums:
+        chunk_data = memoryview(config.haschunks[chunk_hash])
+        block_sums[chunk_hash] = [hashlib.sha1(chunk_data[i * MAX_PAYLOAD:(i + 1) * MAX_PAYLOAD]).digest()
+                                  for i in range(CHUNK_PKT_NUM)]
+    sums = block_sums[chunk_hash]
+    # seq is the DATA seq of the first block whose checksum the packet carries
+    for i in range(0, CHUNK_PKT_NUM, HASHES_PER_PKT):
+        payload = b''.join(sums[i:i + HASHES_PER_PKT])
+        sock.sendto(packet.encode(packet.BLOCKSUM, payload, seq=i + 1, stamp=stamp(addr)), addr)
+
+
+def process_block_sums(sock: simsocket.SimSocket, addr: tuple, data: bytes, seq: int):
+    record = data_info.get(addr)
+    if record is None or record.chunk.block_sums is None:
+        return
+    record.last_receive_time = time()
+    chunk = record.chunk
+    for i in range(len(data) // SHA1_LEN):
+        if 1 <= seq + i <= CHUNK_PKT_NUM:
+            chunk.block_sums[seq + i - 1] = bytes(data[i * SHA1_LEN:(i + 1) * SHA1_LEN])
+    if None in chunk.block_sums:
+        return
+    bad_seqs = [i + 1 for i in range(CHUNK_PKT_NUM)
+                if hashlib.sha1(chunk.received_view[i * MAX_PAYLOAD:(i + 1) * MAX_PAYLOAD]).digest() != chunk.block_sums[i]]
+    chunk.block_sums = None
+    if len(bad_seqs) == 0:
+        # every block matches the sender's copy, so the sender's chunk itself is bad
+        drop_partial(chunk.chunk_hash)
+        picker.want(chunk.chunk_hash)
+        del data_info[addr]
+        return
+    for bad_seq in bad_seqs:
+        chunk.received_map[bad_seq - 1] = 0
+    chunk.ack = bad_seqs[0] - 1
+    chunk.sha1 = hashlib.sha1(chunk.received_view[:chunk.ack * MAX_PAYLOAD])
+    chunk.save()
+    request_range(sock, addr, chunk, bad_seqs[0], bad_seqs[-1])
+
+
+def request_range(sock: simsocket.SimSocket, addr: tuple, chunk: Chunk_Buffer, first_seq: int, last_seq: int):
+    # the whole chunk is asked for with a plain GET, a part of it with GET seq=first ack=last
+    if first_seq == 1 and last_seq == CHUNK_PKT_NUM:
+        get_pkt = packet.encode(packet.GET, bytes.fromhex(chunk.chunk_hash), stamp=stamp(addr))
+    else:
+        get_pkt = packet.encode(packet.GET, bytes.fromhex(chunk.chunk_hash), seq=first_seq, ack=last_seq, stamp=stamp(addr))
+    sock.sendto(get_pkt, addr)
+    record = Data_Info(chunk, first_seq, last_seq)
+    data_info[addr] = record
+    timers.schedule(record.last_receive_time + crash_timeout(addr), handle_crash, sock, addr, record)
+
+
+def assign_range(sock: simsocket.SimSocket, addr: tuple, chunk: Chunk_Buffer):
+    # addr finished its range early: it takes over a range left by a failed peer,
+    # or the upper half of the largest range still outstanding
+    if len(chunk.orphans) > 0:
+        first_seq, last_seq = chunk.orphans.pop()
+    else:
+        victims = [record for record in data_info.values()
+                   if record.chunk is chunk and record.steal_end - record.ack >= MIN_STEAL_PKTS]
+        if len(victims) == 0:
+            return
+        victim = max(victims, key=lambda record: record.steal_end - record.ack)
+        first_seq = victim.steal_end - (victim.steal_end - victim.ack) // 2 + 1
+        last_seq = victim.steal_end
+        # the victim is not told, whichever peer delivers a seq first wins and the other is ACKed past it
+        victim.steal_end = first_seq - 1
+    request_range(sock, addr, chunk, first_seq, last_seq)
+
+
+def drop_source(addr: tuple):
+    record = data_info.pop(addr)
+    chunk = record.chunk
+    if any(other.chunk is chunk for other in data_info.values()):
+        # other peers are still sending this chunk, the first to finish its range takes over
+        if record.ack < record.steal_end:
+            chunk.orphans.append((record.ack + 1, record.steal_end))
+    else:
+        # abandoned for now, whoever sends it next starts where this peer stopped
+        chunk.save()
+        picker.want(chunk.chunk_hash)
+
+
+def save_partials():
+    # on the way out, so that a restart misses none of the pkts received
+    for chunk in {record.chunk for record in data_info.values()}:
+        chunk.save()
+
+
+def is_idle(addr: tuple):
+    return addr not in data_info and denied_until.get(addr, 0) <= time()
 
 
 def send_get(sock: simsocket.SimSocket):
-    for chunk_hash in list(unfetch_hash):
-        if hash_peer_list.get(chunk_hash) is not None and len(hash_peer_list[chunk_hash]) > 0:
-            addr = hash_peer_list[chunk_hash][0]
-            if addr in data_info:
-                hash_peer_list[chunk_hash].append(hash_peer_list[chunk_hash].popleft())
+    # every idle holder proposes the rarest wanted hash it has, rarest proposals are served first
+    proposals = []
+    for addr in picker.peers():
+        if not is_idle(addr):
+            continue
+        chunk_hash = picker.pick(addr)
+        if chunk_hash is not None:
+            proposals.append((picker.replicas(chunk_hash), chunk_hash, addr))
+    for _, chunk_hash, addr in sorted(proposals):
+        if addr in data_info:
+            # already enlisted as an extra source for an earlier chunk
+            continue
+        if chunk_hash not in picker.wanted:
+            chunk_hash = picker.pick(addr)
+            if chunk_hash is None:
+                continue
+        sources = [addr]
+        if config.multi_source:
+            sources += [holder for holder in sorted(picker.holders[chunk_hash]) if holder != addr and is_idle(holder)]
+            sources = sources[:MAX_SOURCES]
+        chunk = open_chunk(chunk_hash)
+        picker.unwant(chunk_hash)
+        if chunk.ack == CHUNK_PKT_NUM:
+            # an earlier attempt got every pkt but stopped before the hash check
+            keep_chunk(chunk)
+            continue
+        # only the seqs an earlier attempt left out are asked for, split among the sources
+        first_seq, last_seq = chunk.missing()
+        pkts = last_seq - first_seq + 1
+        sources = sources[:pkts]
+        for i, source in enumerate(sources):
+            request_range(sock, source, chunk, first_seq + i * pkts // len(sources), first_seq + (i + 1) * pkts // len(sources) - 1)
+    if config.multi_source:
+        # holders that are still idle (e.g. their IHAVE came late) join chunks already in progress
+        sources_of = dict()
+        for record in data_info.values():
+            sources_of.setdefault(record.chunk, []).append(record)
+        for addr in picker.peers():
+            if not is_idle(addr):
                 continue
-            get_header = struct.pack(FORMAT, MAGIC, TEAM, 2, HEADER_LEN, HEADER_LEN + len(chunk_hash), 0, 0)
-            sock.sendto(get_header + chunk_hash.encode(), addr)
-            data_info[addr] = Data_Info()
-            data_info[addr].last_receive_time = time()
-            data_info[addr].downloading_chunk_hash = chunk_hash
-            unfetch_hash.remove(chunk_hash)
+            for chunk, records in sources_of.items():
+                if len(records) < MAX_SOURCES and chunk.block_sums is None and addr in picker.holders[chunk.chunk_hash]:
+                    assign_range(sock, addr, chunk)
+                    if addr in data_info:
+                        records.append(data_info[addr])
+                        break
+    if config.endgame > 0 and len(picker.wanted) == 0:
+        send_duplicate_gets(sock)
+
+
+def send_duplicate_gets(sock: simsocket.SimSocket):
+    # end-game: once every remaining chunk is in progress and at most config.endgame of them are left,
+    # idle holders are asked for the unreceived part again. The first copy of each seq is kept and
+    # the other senders get a CANCEL when the chunk completes.
+    sources_of = dict()
+    for record in data_info.values():
+        sources_of.setdefault(record.chunk, []).append(record)
+    if len(sources_of) == 0 or len(sources_of) > config.endgame:
+        return
+    for addr in picker.peers():
+        if not is_idle(addr):
+            continue
+        chunks = [chunk for chunk, records in sources_of.items()
+                  if len(records) < MAX_SOURCES and chunk.block_sums is None and addr in picker.holders[chunk.chunk_hash]]
+        if len(chunks) == 0:
+            continue
+        # the chunk with the fewest sources, then the one furthest behind
+        chunk = min(chunks, key=lambda chunk: (len(sources_of[chunk]), chunk.ack))
+        request_range(sock, addr, chunk, chunk.ack + 1, CHUNK_PKT_NUM)
+        sources_of[chunk].append(data_info[addr])
 
 
 def send_data(sock: simsocket.SimSocket, addr: tuple, seq: int):
@@ -188,116 +663,208 @@ def send_data(sock: simsocket.SimSocket, addr: tuple, seq: int):
     right = min(seq * MAX_PAYLOAD, CHUNK_DATA_SIZE)
     if left >= right:
         return
-    next_data = config.haschunks[ack_records[addr].sending_chunk_hash][left:right]
-    data_header = struct.pack(FORMAT, MAGIC, TEAM, 3, HEADER_LEN, HEADER_LEN + len(next_data), seq, 0)
-    ack_records[addr].sending_time[seq] = time()
-    if ack_records[addr].transfer_num.get(seq) is None:
-        ack_records[addr].transfer_num[seq] = 0
-    ack_records[addr].transfer_num[seq] += 1
-    ack_records[addr].max_seq = max(ack_records[addr].max_seq, seq)
-    sock.sendto(data_header + next_data, addr)
-
-
-def timeout_retransmission(sock: simsocket.SimSocket):
-    for addr in ack_records:
-        record = ack_records[addr]
-        timeout_interval = rtt_info[addr].timeout_interval if rtt_info[addr].timeout_interval is not None else 10
-        for seq in list(record.sending_time.keys()):
-            if seq in record.ack_packet:
-                del record.sending_time[seq]
-            elif time() - record.sending_time[seq] > timeout_interval:
-                record.ssthresh = max(math.floor(record.cwnd / 2), 2)
-                record.cwnd = 1
-                record.duplicated_ack = 0
-                record.mode = 0
-                send_data(sock, addr, seq)
+    # slice through a memoryview so the payload is not copied out of the chunk (or the mmap'ed store)
+    record = ack_records[addr]
+    next_data = memoryview(config.haschunks[record.sending_chunk_hash])[left:right]
+    sending_time = time()
+    record.sending_time[seq] = sending_time
+    if record.transfer_num.get(seq) is None:
+        record.transfer_num[seq] = 0
+    record.transfer_num[seq] += 1
+    record.max_seq = max(record.max_seq, seq)
+    sock.sendto(packet.encode(packet.DATA, next_data, seq, record.chunk_tag, stamp=stamp(addr)), addr)
+    timers.schedule(sending_time + get_timeout(addr), timeout_retransmission, sock, addr, record, seq, sending_time)
 
 
-def send_whohas(sock: simsocket):
-    if len(unfetch_hash) == 0:
+def get_timeout(addr: tuple):
+    timeout_interval = rtt_info[addr].timeout_interval
+    if timeout_interval is None:
+        return DEFAULT_TIMEOUT
+    if config.timeout is None:
+        # the estimate alone is a few ms on a LAN, below that ACKs still in the socket buffer
+        # would count as lost
+        return max(timeout_interval, MIN_TIMEOUT)
+    return timeout_interval
+
+
+def crash_timeout(addr: tuple):
+    # how long a download source may stay silent, a few RTOs once its RTT is known
+    if config.timeout is not None or rtt_info[addr].timeout_interval is None:
+        return get_timeout(addr)
+    return CRASH_RTOS * get_timeout(addr)
+
+
+def timeout_retransmission(sock: simsocket.SimSocket, addr: tuple, record: Ack_Record, seq: int, sending_time: float):
+    # timer of one DATA send, a later send of the same seq has a timer of its own
+    if ack_records.get(addr) is not record or record.sending_time.get(seq) != sending_time:
+        return
+    if seq in record.ack_packet or seq <= record.ack:
+        del record.sending_time[seq]
         return
-    global last_who_has
-    peer_list = config.peers
-    if last_who_has is None or time() - last_who_has > 60:
+    timeout_interval = get_timeout(addr)
+    if time() < sending_time + timeout_interval:
+        # the RTO grew since the send. Compared as the deadline itself, a difference may round below it
+        timers.schedule(sending_time + timeout_interval, timeout_retransmission, sock, addr, record, seq, sending_time)
+        return
+    record.cc.on_timeout(record, time())
+    # holes resent during a recovery may be lost again, the scoreboard may resend them
+    record.recovery_point = 0
+    record.retransmitted.clear()
+    send_data(sock, addr, seq)
+    # the receiver is considered gone once every seq in the window was sent 3 times
+    window_end = record.ack + math.floor(record.cwnd)
+    if all(num >= 3 for i, num in record.transfer_num.items() if i <= window_end):
+        del ack_records[addr]
+
+
+def send_whohas(sock: simsocket):
+    global last_who_has, whohas_timer
+    if len(picker.wanted) > 0 and (last_who_has is None or time() >= last_who_has + WHOHAS_INTERVAL):
         last_who_has = time()
-        for hash_str in target_hash:
-            if hash_str not in received_hash:
-                whohas_header = struct.pack(FORMAT, MAGIC, TEAM, 0, HEADER_LEN, HEADER_LEN + len(hash_str), 0, 0)
-                whohas_pkt = whohas_header + hash_str.encode()
-                for p in peer_list:
-                    if int(p[0]) != config.identity:
-                        sock.sendto(whohas_pkt, (p[1], int(p[2])))
+        missing_hashes = [hash_str for hash_str in target_hash if hash_str not in received_hash]
+        for p in config.peers:
+            if int(p[0]) != config.identity:
+                addr = (p[1], int(p[2]))
+                for whohas_pkt in pack_hash_pkts(packet.WHOHAS, missing_hashes, addr):
+                    sock.sendto(whohas_pkt, addr)
+    timers.cancel(whohas_timer)
+    whohas_timer = None
+    if downloading:
+        # re-flood while the download lasts, holders that were missed or crashed may have come back
+        next_who_has = time() + WHOHAS_INTERVAL
+        if last_who_has is not None and last_who_has + WHOHAS_INTERVAL > time():
+            next_who_has = last_who_has + WHOHAS_INTERVAL
+        whohas_timer = timers.schedule(next_who_has, send_whohas, sock)
 
 
-def process_ack(sock: simsocket.SimSocket, addr: tuple, seq: int, ack: int):
+def process_ack(sock: simsocket.SimSocket, addr: tuple, seq: int, ack: int, sack: bytes = b'', sample_rtt=None):
     record = ack_records.get(addr)
     if record is None:
         return
-    if seq > record.max_seq or ack > record.max_seq:
+    # the ack may pass max_seq when the receiver got those seqs from another peer
+    if seq > record.max_seq or ack > record.last_seq:
         return
-    if record.ack * MAX_PAYLOAD >= CHUNK_DATA_SIZE:
+    if record.ack >= record.last_seq:
         ack_records.pop(addr)
         return
     record.ack_packet.add(seq)
-    if record.transfer_num[seq] == 1:
+    newly_sacked = 0
+    if len(sack) > 0 and sack != record.last_sack:
+        record.last_sack = bytes(sack)
+        known = len(record.ack_packet)
+        for first, last in packet.parse_sack(sack):
+            last = min(last, record.last_seq)
+            record.ack_packet.update(range(max(first, ack + 1), last + 1))
+            record.high_sacked = max(record.high_sacked, last)
+        newly_sacked = len(record.ack_packet) - known
+    if sample_rtt is not None:
+        # from the timestamp echo, rtt_info has it already
+        record.cc.on_rtt(record, sample_rtt, time())
+    elif record.transfer_num.get(seq) == 1 and seq in record.sending_time:
+        # without timestamps only first transmissions are unambiguous (Karn)
         sample_rtt = time() - record.sending_time[seq]
         rtt_info[addr].update_info(sample_rtt)
+        record.cc.on_rtt(record, sample_rtt, time())
     if seq in record.sending_time:
         del record.sending_time[seq]
     if ack > record.ack:
+        # the window grows with the pkts newly acked, not the ACK count, so delayed ACKs do not slow it down
+        newly_acked = ack - record.ack
         record.ack = ack
-        record.duplicated_ack = 0
-        if record.mode == 0:
-            record.cwnd += 1
-            if record.cwnd >= record.ssthresh:
-                record.mode = 1
-        elif record.mode == 1:
-            record.cwnd += 1 / record.cwnd
-        else:
-            record.cwnd = record.ssthresh
-            record.mode = 1
-        for i in range(record.next_seq_num, record.ack + math.floor(record.cwnd) + 2):
-            if (i - 1) * MAX_PAYLOAD >= CHUNK_DATA_SIZE:
-                break
-            record.next_seq_num += 1
-            send_data(sock, addr, i)
+        record.next_seq_num = max(record.next_seq_num, ack + 1)
+        if record.ack >= record.last_seq:
+            # the whole range arrived, free the upload slot right away
+            ack_records.pop(addr)
+            return
+        record.cc.on_ack(record, newly_acked, time())
+        if record.recovery_point > 0:
+            if record.ack >= record.recovery_point:
+                record.recovery_point = 0
+                record.retransmitted.clear()
+            else:
+                retransmit_holes(sock, addr, record, newly_acked + newly_sacked)
+        send_window(sock, addr, record)
     elif ack == record.ack:
-        if record.mode == 2:
-            record.cwnd += 1
-            for i in range(record.next_seq_num, record.ack + math.floor(record.cwnd) + 2):
-                if (i - 1) * MAX_PAYLOAD >= CHUNK_DATA_SIZE:
-                    break
-                record.next_seq_num += 1
-                send_data(sock, addr, i)
-        else:
-            record.duplicated_ack += 1
-            if record.duplicated_ack == 3:
-                record.ssthresh = max(math.floor(record.cwnd / 2), 2)
-                record.cwnd = record.ssthresh + 3
-                record.mode = 2
+        if record.cc.on_dup_ack(record, time()):
+            if record.high_sacked <= record.ack:
+                # no SACK from this receiver, only the first hole is known
                 send_data(sock, addr, record.ack + 1)
+                return
+            if record.recovery_point == 0:
+                record.recovery_point = record.max_seq
+            if record.ack + 1 not in record.retransmitted:
+                record.retransmitted.add(record.ack + 1)
+                send_data(sock, addr, record.ack + 1)
+            retransmit_holes(sock, addr, record, newly_sacked)
+        elif record.recovery_point == 0 or retransmit_holes(sock, addr, record, newly_sacked) == 0:
+            # holes go before new data
+            send_window(sock, addr, record)
 
 
-def handle_crash():
-    for addr in list(ack_records.keys()):
-        record = ack_records[addr]
-        flag = True
-        for seq in record.transfer_num.keys():
-            if seq > record.ack + math.floor(record.cwnd):
-                continue
-            if record.transfer_num[seq] < 3:
-                flag = False
+def retransmit_holes(sock: simsocket.SimSocket, addr: tuple, record: Ack_Record, budget: int):
+    # resend the lowest holes with DUP_THRESH SACKed seqs above them, each once per recovery. A pkt may
+    # only enter the network for one that left it, so budget is the number of pkts this ACK newly covers
+    if budget <= 0:
+        return 0
+    above = 0
+    lost = []
+    for seq in range(record.high_sacked, record.ack, -1):
+        if seq in record.ack_packet:
+            above += 1
+        elif above >= DUP_THRESH and seq not in record.retransmitted:
+            lost.append(seq)
+    lost = lost[::-1][:budget]
+    for seq in lost:
+        record.retransmitted.add(seq)
+        send_data(sock, addr, seq)
+    return len(lost)
+
+
+def send_window(sock: simsocket.SimSocket, addr: tuple, record: Ack_Record):
+    # every seq not sent yet that the window allows, seqs the receiver already has are skipped.
+    # With --pace they leave at the controller's pacing rate, the rest wait for a timer
+    interval = 0
+    srtt = rtt_info[addr].estimated_rtt
+    if config.pace and srtt:
+        interval = 1 / record.cc.pacing_rate(record, srtt)
+        now = time()
+        record.next_send_time = max(record.next_send_time, now)
+    for i in range(record.next_seq_num, record.ack + math.floor(record.cwnd) + 2):
+        if i > record.last_seq:
+            break
+        if interval > 0:
+            if record.next_send_time > now + PACE_QUANTUM:
+                if record.pace_timer is None:
+                    record.pace_timer = timers.schedule(record.next_send_time, paced_send, sock, addr, record)
                 break
-        if len(record.transfer_num) > 0 and flag:
-            del ack_records[addr]
-    for addr in list(data_info.keys()):
-        record = data_info[addr]
-        timeout = 10 if rtt_info[addr].timeout_interval is None else rtt_info[addr].timeout_interval
-        if time() - record.last_receive_time > timeout:
-            chunk_hash = data_info[addr].downloading_chunk_hash
-            unfetch_hash.add(chunk_hash)
-            hash_peer_list[chunk_hash].append(hash_peer_list[chunk_hash].popleft())
-            del data_info[addr]
+            record.next_send_time += interval
+        record.next_seq_num += 1
+        if i not in record.ack_packet:
+            send_data(sock, addr, i)
+
+
+def paced_send(sock: simsocket.SimSocket, addr: tuple, record: Ack_Record):
+    record.pace_timer = None
+    if ack_records.get(addr) is record:
+        send_window(sock, addr, record)
+
+
+def handle_crash(sock: simsocket.SimSocket, addr: tuple, record: Data_Info):
+    # timer of one download source, moved forward lazily to last_receive_time + timeout
+    if data_info.get(addr) is not record:
+        return
+    timeout = crash_timeout(addr)
+    if time() < record.last_receive_time + timeout:
+        timers.schedule(record.last_receive_time + timeout, handle_crash, sock, addr, record)
+        return
+    chunk_hash = record.downloading_chunk_hash
+    drop_source(addr)
+    # the peer is considered gone, its hashes are served by other holders (or re-learned via WHOHAS)
+    picker.remove_peer(addr)
+    if picker.replicas(chunk_hash) == 0:
+        global last_who_has
+        last_who_has = None
+        send_whohas(sock)
 
 
 def process_user_input(sock):
@@ -308,60 +875,272 @@ def process_user_input(sock):
         pass
 
 
-def peer_run(config):
-    addr = (config.ip, config.port)
-    sock = simsocket.SimSocket(config.identity, addr, verbose=config.verbose)
-    peer_list = config.peers
-    for p in peer_list:
+def init_peers(config):
+    for p in config.peers:
         if int(p[0]) != config.identity:
             rtt_info[(p[1], int(p[2]))] = RTT_Info()
             rtt_info[(p[1], int(p[2]))].timeout_interval = config.timeout
+
+
+def open_socket(config):
+    addr = (config.ip, config.port)
+    sock = simsocket.SimSocket(config.identity, addr, verbose=config.verbose, pkt_log=config.pkt_log,
+                               batch=config.batch_io, shard=shard)
+    init_peers(config)
+    return sock
+
+
+def after_events(sock):
+    # run once the pkts, input or timers at hand are handled
+    send_get(sock)
+    global downloading, sink
+    if len(target_hash) == len(received_hash) and downloading:
+        downloading = False
+        sink.finish()
+        sink = None
+    if upload_counts is not None:
+        upload_counts[shard] = len(ack_records)
+    # with --batch-io everything sent since the last call leaves in one sendmmsg
+    sock.flush()
+
+
+def peer_run(config, read_input=True):
+    sock = open_socket(config)
+    inputs = [sock, sys.stdin] if read_input else [sock]
     try:
         while True:
-            ready = select.select([sock, sys.stdin], [], [], 0.1)
+            # sleep until a pkt or input arrives, or until the next timer is due
+            deadline = timers.next_deadline()
+            wait = None if deadline is None else max(deadline - time(), 0)
+            ready = select.select(inputs, [], [], wait)
             read_ready = ready[0]
             if len(read_ready) > 0:
                 if sock in read_ready:
-                    process_inbound_udp(sock)
+                    drain_inbound_udp(sock)
                 if sys.stdin in read_ready:
                     process_user_input(sock)
-            else:
-                # No pkt nor input arrives during this period 
-                pass
-            timeout_retransmission(sock)
-            send_get(sock)
-            handle_crash()
-            send_whohas(sock)
-            global downloading
-            if len(target_hash) == len(received_hash) and downloading:
-                downloading = False
-                with open(config.output_file, "wb") as wf:
-                    pickle.dump(received_hash, wf)
+            timers.run(time())
+            after_events(sock)
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        save_partials()
+        sock.close()
+
+
+def peer_run_async(config, read_input=True):
+    # same peer on an asyncio loop: the socket is drained in bulk when readable, timers are loop.call_at
+    global timers
+    sock = open_socket(config)
+    loop = asyncio.new_event_loop()
+    timers = timer_queue.LoopTimers(loop, time, after=lambda: after_events(sock))
+
+    def on_readable():
+        drain_inbound_udp(sock)
+        after_events(sock)
+
+    def on_input():
+        try:
+            process_user_input(sock)
+        except EOFError:
+            loop.remove_reader(sys.stdin.fileno())
+            return
+        after_events(sock)
+
+    loop.add_reader(sock.fileno(), on_readable)
+    if read_input:
+        loop.add_reader(sys.stdin.fileno(), on_input)
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        save_partials()
+        loop.close()
+        sock.close()
+
+
+def drain_forwarded(sock, channel):
+    # the pkts the dispatcher forwarded, at most MAX_DRAIN as drain_inbound_udp
+    for _ in range(MAX_DRAIN):
+        try:
+            msg = channel.recv(FORWARD_HEADER.size + BUF_SIZE, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return
+        ip, port = FORWARD_HEADER.unpack_from(msg)
+        process_pkt(sock, msg[FORWARD_HEADER.size:], (socket.inet_ntoa(ip), port))
+
+
+def serve_forwarded(sock, channel):
+    # a shard behind the dispatcher: pkts come in on channel, replies go out on the peer's socket shared
+    # with the dispatcher and the other shards
+    sock.worker_logs(config.identity, shard)
+    try:
+        while True:
+            deadline = timers.next_deadline()
+            wait = None if deadline is None else max(deadline - time(), 0)
+            if len(select.select([channel], [], [], wait)[0]) > 0:
+                drain_forwarded(sock, channel)
+            timers.run(time())
+            after_events(sock)
 
     except KeyboardInterrupt:
         pass
     finally:
+        channel.close()
         sock.close()
 
 
+def run_shard(config, index, sock=None, channel=None):
+    global shard
+    shard = index
+    # stopped by the parent alone: a SIGTERM from it is this worker's Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if channel is not None:
+        serve_forwarded(sock, channel)
+    elif config.asyncio:
+        peer_run_async(config, read_input=False)
+    else:
+        peer_run(config, read_input=False)
+
+
+def dispatch(sock, channels):
+    # receive for every shard and forward each pkt to the shard of its sender. A sender seen for the first time
+    # gets the next shard round-robin, so receivers spread evenly however their addresses hash
+    owners = dict()  # {address: channel of its shard}
+    while True:
+        select.select([sock], [], [])
+        for pkt, from_addr in sock.recvfrom_many(BUF_SIZE, MAX_DRAIN):
+            channel = owners.get(from_addr)
+            if channel is None:
+                channel = owners[from_addr] = channels[len(owners) % len(channels)]
+            try:
+                channel.send(FORWARD_HEADER.pack(socket.inet_aton(from_addr[0]), from_addr[1]) + pkt,
+                             socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                # the shard is behind, dropped as by a full socket buffer
+                pass
+
+
+def run_shards(config):
+    # --shards N: N forked workers serving the uploads. Each remote address belongs to one worker, so the
+    # ack_record, RTT and controller of a receiver all live in it. Chunk data loaded before the fork, or
+    # mmap'ed, is shared, and so every worker answers WHOHAS the same. Downloads need one process, the
+    # workers only serve uploads and stdin is not read.
+    # Without the simulator each worker has its own socket on the peer's port (SO_REUSEPORT) and the kernel
+    # hashes a sender to one of them. Under the simulator every pkt comes from the simulator's address, so
+    # this process binds the port alone and dispatches by the sender in the spiffy header instead: the
+    # workers inherit the socket to send on and get their pkts through a socketpair each
+    global upload_counts
+    ctx = multiprocessing.get_context('fork')
+    upload_counts = ctx.Array('i', config.shards, lock=False)
+    sock = None
+    channels = [(None, None)] * config.shards
+    if os.getenv("SIMULATOR") is not None:
+        sock = open_socket(config)
+        channels = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(config.shards)]
+    workers = [ctx.Process(target=run_shard, args=(config, i, sock, channels[i][1]), daemon=True)
+               for i in range(config.shards)]
+    for worker in workers:
+        worker.start()
+    try:
+        if sock is None:
+            for worker in workers:
+                worker.join()
+        else:
+            dispatch(sock, [channel for channel, _ in channels])
+    except KeyboardInterrupt:
+        # the workers ignore SIGINT, they stop on the SIGTERM sent here and flush their logs. Being daemons,
+        # those still running after SHARD_STOP_WAIT are killed on the way out
+        for worker in workers:
+            worker.terminate()
+        deadline = time() + SHARD_STOP_WAIT
+        for worker in workers:
+            worker.join(max(deadline - time(), 0))
+    finally:
+        if sock is not None:
+            sock.close()
+
+
 if __name__ == '__main__':
     """
     -p: Peer list file, it will be in the form "*.map" like nodes.map.
     -c: Chunkfile, a dictionary dumped by pickle. It will be loaded automatically in bt_utils. The loaded dictionary has the form: {chunkhash: chunkdata}
+        It can also be a chunk store index made by util/chunk_store.py, whose data file is mmap'ed instead of loaded.
     -m: The max number of peer that you can send chunk to concurrently. If more peers ask you for chunks, you should reply "DENIED"
     -i: ID, it is the index in nodes.map
     -v: verbose level for printing logs to stdout, 0 for no verbose, 1 for WARNING level, 2 for INFO, 3 for DEBUG.
     -t: pre-defined timeout. If it is not set, you should estimate timeout via RTT. If it is set, you should not change this time out.
         The timeout will be set when running test scripts. PLEASE do not change timeout if it set.
+    --block-check: on a chunk hash mismatch, compare per-block SHA-1 with the sender and re-fetch only the bad blocks.
+    --multi-source: split a chunk into ranges fetched from up to MAX_SOURCES holders, a holder that finishes early
+        takes over half of the largest outstanding range.
+    --endgame N: once at most N chunks are left and all of them are in progress, also GET them from idle holders
+        and CANCEL the slower copies when a chunk completes. 0 (default) disables it.
+    --ack-every K: ACK in-order DATA once per K pkts (or after ACK_DELAY) instead of per pkt. Out-of-order pkts
+        are still ACKed at once. Default 1.
+    --sack: ACKs carry the ranges received above the cumulative ack, so the sender resends every hole of a
+        window in one recovery. Senders always use the ranges they get.
+    --timestamps: every pkt carries a timestamp and echoes the peer's last one, so both directions sample the
+        RTT from any pkt, retransmitted DATA and control pkts included. See util/packet.py.
+    --pace: spread new DATA over the RTT at the congestion controller's pacing rate instead of sending
+        whatever the window allows back-to-back.
+    --cc: congestion controller of uploads, reno (default), cubic, or bbr (window from the measured
+        bandwidth and min RTT). See util/congestion.py.
+    --asyncio: run on an asyncio event loop instead of the select loop, the wire behavior is the same.
+    --pkt-log: text (default) logs every pkt as a DEBUG line in log/peerN.log, trace writes binary records to
+        log/peerN.trace (read them with util/pkt_trace.py), off logs no pkt at all.
+    --batch-io: queue the pkts sent while handling one batch of events and send them with one sendmmsg, read
+        inbound pkts with recvmmsg. Falls back to sendto/recvfrom where sendmmsg is not available.
+    --cache DIR: host-wide chunk cache shared with the other peers on this machine. Chunks of -c and every
+        chunk downloaded go into it, and a DOWNLOAD takes the chunks found there without fetching them.
+        See util/blob_cache.py.
+    --cache-size MB: least recently used chunks are removed from the cache beyond this size, default 1024.
+    --shards N: serve uploads from N processes sharing the peer's port, spread by the receiver's address, to use
+        N cores on a busy seeder. The peer then only seeds, DOWNLOAD is not read. Under the network simulator,
+        where every pkt comes from the simulator's address, one process receives and forwards each pkt to the
+        shard of the sender named in its spiffy header.
     """
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', type=str, help='<peerfile>     The list of all peers', default='nodes.map')
-    parser.add_argument('-c', type=str, help='<chunkfile>    Pickle dumped dictionary {chunkhash: chunkdata}')
+    parser.add_argument('-c', type=str, help='<chunkfile>    Pickle dumped dictionary {chunkhash: chunkdata} or chunk store index')
     parser.add_argument('-m', type=int, help='<maxconn>      Max # of concurrent sending')
     parser.add_argument('-i', type=int, help='<identity>     Which peer # am I?')
     parser.add_argument('-v', type=int, help='verbose level', default=0)
     parser.add_argument('-t', type=int, help="pre-defined timeout", default=None)
+    parser.add_argument('--block-check', action='store_true',
+                        help='on a chunk hash mismatch, fetch per-block checksums and re-request only the bad blocks')
+    parser.add_argument('--multi-source', action='store_true',
+                        help='fetch the ranges of one chunk from several holders at once')
+    parser.add_argument('--endgame', type=int, default=0,
+                        help='duplicate the GETs of the last N chunks to idle holders, 0 to disable')
+    parser.add_argument('--ack-every', type=int, default=1,
+                        help='send one cumulative ACK per K in-order DATA pkts')
+    parser.add_argument('--sack', action='store_true', help='send selective acknowledgements with every ACK')
+    parser.add_argument('--timestamps', action='store_true',
+                        help='echo timestamps in every pkt to sample the RTT both ways')
+    parser.add_argument('--pace', action='store_true', help='pace DATA at the congestion controller\'s rate')
+    parser.add_argument('--cc', choices=sorted(congestion.CONTROLLERS), default='reno',
+                        help='congestion controller for uploads')
+    parser.add_argument('--asyncio', action='store_true', help='run the peer on an asyncio event loop')
+    parser.add_argument('--pkt-log', choices=simsocket.PKT_LOG_MODES, default=simsocket.PKT_LOG_TEXT,
+                        help='per-pkt logging: text lines, a binary trace, or off')
+    parser.add_argument('--batch-io', action='store_true',
+                        help='send and receive many pkts per syscall with sendmmsg/recvmmsg')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='directory of a chunk cache shared by the peers on this host')
+    parser.add_argument('--cache-size', type=int, default=bt_utils.DEFAULT_CACHE_SIZE,
+                        help='size limit of the chunk cache in MB')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='seed from this many processes sharing the port, spread by receiver address')
     args = parser.parse_args()
 
     config = bt_utils.BtConfig(args)
-    peer_run(config)
+    if config.shards > 1:
+        run_shards(config)
+    elif config.asyncio:
+        peer_run_async(config)
+    else:
+        peer_run(config)
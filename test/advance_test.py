@@ -69,7 +69,7 @@ def advance_session():
     time_max = 640
     if os.path.exists("test/tmp5/results"):
         shutil.rmtree("test/tmp5/results", ignore_errors=True)
-        os.mkdir("test/tmp5/results")
+    os.makedirs("test/tmp5/results", exist_ok=True)
 
     stime = time.time()
     advance_session = grader.GradingSession(grader.normal_handler, latency=0.01, spiffy=True, topo_map="test/tmp5/topo5.map", nodes_map="test/tmp5/nodes5.map")
@@ -0,0 +1,61 @@
+import grader
+import time
+import pytest
+import pickle
+import hashlib
+import os
+
+'''
+This test runs the RDT scenario of basic_transfer_test with both peers on the asyncio runtime.
+There will be a packet loss around #150, the download must recover from it as with the select loop.
+
+This test is equivalent to run (except for packet loss):
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data1.fragment -m 1 -i 1 -t 60 --asyncio
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data2.fragment -m 1 -i 2 -t 60 --asyncio
+
+In peer1:
+DOWNLOAD test/tmp2/download_target.chunkhash test/tmp2/download_result.fragment
+'''
+
+@pytest.fixture(scope='module')
+def asyncio_session():
+    success = False
+    time_max = 80
+
+    if os.path.exists("test/tmp2/download_result.fragment"):
+        os.remove("test/tmp2/download_result.fragment")
+
+    stime = time.time()
+    session = grader.GradingSession(grader.drop_handler, latency=0.01)
+    session.add_peer(1, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48001), extra_args="--asyncio")
+    session.add_peer(2, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data2.fragment", 1, ("127.0.0.1", 48002), extra_args="--asyncio")
+    session.run_grader()
+
+    session.peer_list[("127.0.0.1", 48001)].send_cmd('''DOWNLOAD test/tmp2/download_target.chunkhash test/tmp2/download_result.fragment\n''')
+
+    while True:
+        if os.path.exists("test/tmp2/download_result.fragment"):
+            success = True
+            break
+        elif time.time()-stime>time_max:
+            success = False
+            break
+
+        time.sleep(0.1)
+
+    for p in session.peer_list.values():
+        p.terminate_peer()
+
+    return session, success
+
+def test_finish(asyncio_session):
+    session, success = asyncio_session
+    assert success == True, "Fail to complete transfer or timeout"
+
+def test_content(asyncio_session):
+    with open("test/tmp2/download_result.fragment", "rb") as download_file:
+        download_fragment = pickle.load(download_file)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+
+    assert target_hash in download_fragment, f"download hash mismatch, target: {target_hash}, has: {download_fragment.keys()}"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
@@ -0,0 +1,76 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.mmsg as mmsg
+import util.packet as packet
+import util.simsocket as simsocket
+
+'''
+Syscalls and pkts/s of SimSocket with --batch-io (one sendmmsg per flush, recvmmsg on the receive
+side) against one sendto/recvfrom per pkt, on localhost with and without a spiffy header. A burst is
+what the peer sends while handling one batch of events, e.g. a window of DATA after a run of ACKs.
+
+python3 test/batch_io_benchmark.py --pkts 100000 --burst 1 8 32 64
+'''
+
+MAX_DRAIN = 64
+
+
+def run(batch, spiffy, pkts, burst, port, identity):
+    if spiffy:
+        # the receiver itself stands in for the simulator, the spiffy header it gets names it as destination
+        os.environ["SIMULATOR"] = f"127.0.0.1:{port + 1}"
+    else:
+        os.environ.pop("SIMULATOR", None)
+    sender = simsocket.SimSocket(identity, ("127.0.0.1", port), verbose=0, pkt_log=simsocket.PKT_LOG_OFF, batch=batch)
+    receiver = simsocket.SimSocket(identity + 1, ("127.0.0.1", port + 1), verbose=0, pkt_log=simsocket.PKT_LOG_OFF, batch=batch)
+    payload = bytes(packet.MAX_PAYLOAD)
+    syscalls = 0
+    stime = time.perf_counter()
+    for start in range(0, pkts, burst):
+        # a burst at a time so that the socket buffer never drops
+        count = min(burst, pkts - start)
+        for seq in range(start + 1, start + count + 1):
+            sender.sendto(packet.encode(packet.DATA, payload, seq), ("127.0.0.1", port + 1))
+        sender.flush()
+        received = 0
+        while received < count:
+            got = len(receiver.recvfrom_many(1400, MAX_DRAIN))
+            received += got
+            if not batch:
+                # one recvfrom per pkt plus the one that finds the socket empty
+                syscalls += got + (got < MAX_DRAIN)
+        if not batch:
+            syscalls += count
+    elapsed = time.perf_counter() - stime
+    if batch:
+        syscalls = sender.io_calls()[0] + receiver.io_calls()[1]
+    sender.close()
+    receiver.close()
+    return elapsed, syscalls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pkts', type=int, default=100000)
+    parser.add_argument('--burst', type=int, nargs='+', default=[1, 8, 32, 64])
+    parser.add_argument('--port', type=int, default=49031)
+    args = parser.parse_args()
+
+    if not mmsg.available():
+        print("sendmmsg/recvmmsg not available here, --batch-io falls back to one syscall per pkt")
+        sys.exit(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        identity = 10
+        for spiffy in (False, True):
+            for burst in args.burst:
+                for batch in (False, True):
+                    identity += 2
+                    elapsed, syscalls = run(batch, spiffy, args.pkts, burst, args.port, identity)
+                    name = f"{'spiffy' if spiffy else 'direct'} burst {burst:3d} {'batch' if batch else 'per-pkt'}"
+                    print(f"{name:28s} {args.pkts / elapsed / 1e3:7.1f} k pkts/s  {syscalls / args.pkts:5.2f} syscalls/pkt")
@@ -0,0 +1,79 @@
+import sys
+import os
+import socket
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.mmsg as mmsg
+import util.packet as packet
+import util.simsocket as simsocket
+
+'''
+Batched sendmmsg/recvmmsg I/O of SimSocket, with and without the spiffy header.
+'''
+
+needs_mmsg = pytest.mark.skipif(not mmsg.available(), reason="sendmmsg/recvmmsg not available")
+
+
+def open_pair(tmp_path, monkeypatch, identity, ports, batch, simulator=None):
+    monkeypatch.chdir(tmp_path)
+    if simulator is None:
+        monkeypatch.delenv("SIMULATOR", raising=False)
+    else:
+        monkeypatch.setenv("SIMULATOR", simulator)
+    sender = simsocket.SimSocket(identity, ("127.0.0.1", ports[0]), verbose=0, pkt_log=simsocket.PKT_LOG_OFF, batch=batch)
+    receiver = simsocket.SimSocket(identity + 1, ("127.0.0.1", ports[1]), verbose=0, pkt_log=simsocket.PKT_LOG_OFF, batch=batch)
+    return sender, receiver
+
+
+@needs_mmsg
+def test_batched_round_trip(tmp_path, monkeypatch):
+    sender, receiver = open_pair(tmp_path, monkeypatch, 121, (49121, 49122), True)
+    # small pkts, 100 full DATA pkts could overflow the default receive buffer
+    pkts = [packet.encode(packet.DATA, bytes([seq]) * 16, seq) for seq in range(1, 101)]
+    for pkt in pkts:
+        assert sender.sendto(pkt, ("127.0.0.1", 49122)) == len(pkt)
+    # nothing leaves before flush
+    assert receiver.recvfrom_many(1400, 64) == []
+    sender.flush()
+    received = receiver.recvfrom_many(1400, 64) + receiver.recvfrom_many(1400, 64)
+    assert received == [(pkt, ("127.0.0.1", 49121)) for pkt in pkts]
+    # two sendmmsg for 100 pkts, three recvmmsg including the empty one
+    assert sender.io_calls()[0] == 2
+    assert receiver.io_calls()[1] == 3
+    sender.close()
+    receiver.close()
+
+
+@needs_mmsg
+def test_batched_spiffy(tmp_path, monkeypatch):
+    # the "simulator" is a plain socket: the spiffy header is gathered in front of each pkt
+    hub = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    hub.bind(("127.0.0.1", 49125))
+    sender, receiver = open_pair(tmp_path, monkeypatch, 123, (49123, 49124), True, "127.0.0.1:49125")
+    pkt = packet.encode(packet.ACK, seq=3, ack=3)
+    sender.sendto(pkt, ("127.0.0.1", 49124))
+    sender.flush()
+    wrapped, _ = hub.recvfrom(1400)
+    assert wrapped[simsocket.SPIFFY_HEADER.size:] == pkt
+    hub.sendto(wrapped, ("127.0.0.1", 49124))
+    assert receiver.recvfrom_many(1400, 64) == [(pkt, ("127.0.0.1", 49123))]
+    sender.close()
+    receiver.close()
+    hub.close()
+
+
+def test_fallback(tmp_path, monkeypatch):
+    # batch off: sendto sends at once and recvfrom_many loops over recvfrom
+    sender, receiver = open_pair(tmp_path, monkeypatch, 126, (49126, 49127), False)
+    assert sender.io_calls() is None
+    pkts = [packet.encode(packet.ACK, seq=seq) for seq in range(1, 6)]
+    for pkt in pkts:
+        sender.sendto(pkt, ("127.0.0.1", 49127))
+    sender.flush()
+    assert receiver.recvfrom_many(1400, 3) == [(pkt, ("127.0.0.1", 49126)) for pkt in pkts[:3]]
+    assert receiver.recvfrom_many(1400, 64) == [(pkt, ("127.0.0.1", 49126)) for pkt in pkts[3:]]
+    assert receiver.recvfrom_many(1400, 64) == []
+    sender.close()
+    receiver.close()
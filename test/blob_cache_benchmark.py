@@ -0,0 +1,87 @@
+import sys
+import os
+import argparse
+import hashlib
+import pickle
+import subprocess
+import tempfile
+
+'''
+Memory of --peers co-located peers that all load the same --chunks chunk .fragment, with and
+without a shared --cache (util/blob_cache.py). Every peer is a process of its own that loads its
+BtConfig, reads every chunk once as if serving it and then waits; their PSS, which splits shared
+pages among the processes mapping them, is summed while all of them are up.
+
+python3 test/blob_cache_benchmark.py --peers 8 --chunks 200
+'''
+
+CHUNK_SIZE = 512 * 1024
+
+LOADER = r'''
+import sys, hashlib, argparse
+sys.path.append(sys.argv[1])
+import util.bt_utils as bt_utils
+args = argparse.Namespace(p=sys.argv[2], c=sys.argv[3], m=1, i=1, v=0, t=None)
+if sys.argv[4] != "-":
+    args.cache, args.cache_size = sys.argv[4], 4096
+config = bt_utils.BtConfig(args)
+for chunk_hash in config.haschunks:
+    assert hashlib.sha1(config.haschunks[chunk_hash]).hexdigest() == chunk_hash
+print("ready", flush=True)
+sys.stdin.read()
+'''
+
+
+def make_fragment(path, chunk_num):
+    chunks = dict()
+    for i in range(chunk_num):
+        data = hashlib.sha256(i.to_bytes(4, 'big')).digest() * (CHUNK_SIZE // 32)
+        chunks[hashlib.sha1(data).hexdigest()] = data
+    with open(path, 'wb') as f:
+        pickle.dump(chunks, f)
+
+
+def rollup(pid):
+    # {field: KiB} of /proc/<pid>/smaps_rollup
+    fields = dict()
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields
+
+
+def run_peers(root, nodes_map, fragment, cache_dir, peers):
+    procs = []
+    try:
+        for _ in range(peers):
+            # one at a time, the first one with a cache fills it
+            proc = subprocess.Popen([sys.executable, "-c", LOADER, root, nodes_map, fragment, cache_dir],
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            assert proc.stdout.readline().strip() == "ready"
+            procs.append(proc)
+        usage = [rollup(proc.pid) for proc in procs]
+    finally:
+        for proc in procs:
+            proc.communicate("")
+    return sum(u["Pss"] for u in usage), sum(u["Rss"] for u in usage)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--peers', type=int, default=8)
+    parser.add_argument('--chunks', type=int, default=200, help='number of 512 KiB chunks every peer holds')
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_map = os.path.join(tmp, "nodes.map")
+        with open(nodes_map, 'w') as f:
+            f.write("1 127.0.0.1 48001\n")
+        fragment = os.path.join(tmp, "seed.fragment")
+        make_fragment(fragment, args.chunks)
+        for name, cache_dir in (("own copies", "-"), ("shared cache", os.path.join(tmp, "cache"))):
+            pss, rss = run_peers(root, nodes_map, fragment, cache_dir, args.peers)
+            print(f"{args.peers} peers x {args.chunks} chunks  {name:12s} total PSS {pss / 1024:8.1f} MiB  "
+                  f"total RSS {rss / 1024:8.1f} MiB")
@@ -0,0 +1,110 @@
+import sys
+import os
+import time
+import pickle
+import hashlib
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.blob_cache as blob_cache
+import util.bt_utils as bt_utils
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+The host-wide chunk cache (--cache): blobs are shared by every cache opened on the directory, the
+least recently used go first once it is full, and a peer downloading chunks another peer on the
+host already fetched takes them from the cache without a single DATA pkt.
+'''
+
+CHUNK_SIZE = 512 * 1024
+
+
+def make_chunks(count):
+    chunks = dict()
+    for i in range(count):
+        chunk = hashlib.sha256(str(i).encode()).digest() * (CHUNK_SIZE // 32)
+        chunks[hashlib.sha1(chunk).hexdigest()] = chunk
+    return chunks
+
+
+def test_shared_and_evicted(tmp_path):
+    chunks = make_chunks(4)
+    hashes = list(chunks)
+    cache_dir = str(tmp_path / "cache")
+    first = blob_cache.BlobCache(cache_dir, 3 * CHUNK_SIZE)
+    views = []
+    for chunk_hash in hashes[:3]:
+        views.append(first.put(chunk_hash, chunks[chunk_hash]))
+        assert bytes(views[-1]) == chunks[chunk_hash]
+        time.sleep(0.01)
+    # another peer sees the blobs, a hit makes the first one the most recent
+    second = blob_cache.BlobCache(cache_dir, 3 * CHUNK_SIZE)
+    assert second.size == 3 * CHUNK_SIZE
+    assert bytes(second.get(hashes[0])) == chunks[hashes[0]]
+    time.sleep(0.01)
+    second.put(hashes[3], chunks[hashes[3]])
+    # the least recently used blob made room, the map of it still reads
+    assert [chunk_hash in second for chunk_hash in hashes] == [True, False, True, True]
+    assert second.get(hashes[1]) is None
+    assert bytes(views[1]) == chunks[hashes[1]]
+    assert bytes(first.get(hashes[1])) == chunks[hashes[1]]
+    assert sorted(os.listdir(cache_dir)) == sorted(hashes[:1] + hashes[2:])
+
+
+def test_bad_blob_written_over(tmp_path):
+    chunks = make_chunks(3)
+    hashes = list(chunks)
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    # cut short, another chunk's bytes, empty
+    (cache_dir / hashes[0]).write_bytes(chunks[hashes[0]][:100])
+    (cache_dir / hashes[1]).write_bytes(chunks[hashes[2]])
+    (cache_dir / hashes[2]).write_bytes(b"")
+    with open(tmp_path / "seed.fragment", "wb") as f:
+        pickle.dump(chunks, f)
+    (tmp_path / "nodes.map").write_text("1 127.0.0.1 48001\n")
+    args = argparse.Namespace(p=str(tmp_path / "nodes.map"), c=str(tmp_path / "seed.fragment"), m=1, i=1, v=0, t=None,
+                              cache=str(cache_dir), cache_size=64)
+    config = bt_utils.BtConfig(args)
+    for chunk_hash, chunk in chunks.items():
+        assert bytes(config.haschunks[chunk_hash]) == chunk
+        assert (cache_dir / chunk_hash).read_bytes() == chunk
+
+
+def test_download_from_cache(tmp_path):
+    chunks = make_chunks(3)
+    with open(tmp_path / "seed.fragment", "wb") as f:
+        pickle.dump(chunks, f)
+    with open(tmp_path / "empty.fragment", "wb") as f:
+        pickle.dump(dict(), f)
+    with open(tmp_path / "target.chunkhash", "w") as f:
+        f.writelines(f"{i} {chunk_hash}\n" for i, chunk_hash in enumerate(chunks))
+    (tmp_path / "nodes.map").write_text("1 127.0.0.1 48001\n2 127.0.0.1 48002\n3 127.0.0.1 48003\n")
+    (tmp_path / "topo.map").write_text("1 2 10000000 0.01 50\n1 3 10000000 0.01 50\n")
+    cache_dir = str(tmp_path / "cache")
+    swarm = VirtualSwarm(str(tmp_path / "topo.map"), str(tmp_path / "nodes.map"))
+    swarm.add_peer(1, str(tmp_path / "seed.fragment"), 1)
+    swarm.add_peer(2, str(tmp_path / "empty.fragment"), 1, cache=cache_dir, cache_size=64)
+    swarm.add_peer(3, str(tmp_path / "empty.fragment"), 1, cache=cache_dir, cache_size=64)
+    sock = swarm.peers[1].sock
+    sendto = sock.sendto
+    sent = []
+
+    def counting_sendto(data, address):
+        if packet.parse(data)[0] == packet.DATA:
+            sent.append(address)
+        return sendto(data, address)
+    sock.sendto = counting_sendto
+
+    swarm.download(2, str(tmp_path / "target.chunkhash"), str(tmp_path / "result2.fragment"))
+    swarm.run(until=600)
+    assert not swarm.downloading()
+    assert sorted(os.listdir(cache_dir)) == sorted(chunks)
+    swarm.download(3, str(tmp_path / "target.chunkhash"), str(tmp_path / "result3.fragment"))
+    swarm.run(until=1200)
+    assert not swarm.downloading()
+    assert ("127.0.0.1", 48003) not in sent
+    for result in ("result2.fragment", "result3.fragment"):
+        with open(tmp_path / result, "rb") as f:
+            assert pickle.load(f) == chunks
@@ -0,0 +1,73 @@
+import grader
+import time
+import pytest
+import pickle
+import hashlib
+import os
+
+'''
+This test examines per-block checksums.
+One byte of DATA pkt #150 is flipped in flight, so the received chunk fails its SHA-1 check.
+With --block-check the downloader asks the sender for per-block checksums (type 6/7) and re-requests
+only the bad block with a ranged GET, instead of fetching the whole chunk again.
+
+This test is equivalent to run (except for the corruption):
+In shell1:
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data1.fragment -m 1 -i 1 -t 60 --block-check
+
+In shell2:
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data2.fragment -m 1 -i 2 -t 60 --block-check
+
+In shell1:
+DOWNLOAD test/tmp2/download_target.chunkhash test/tmp2/download_result.fragment
+'''
+
+@pytest.fixture(scope='module')
+def corrupt_session():
+    success = False
+    time_max = 80
+
+    if os.path.exists("test/tmp2/download_result.fragment"):
+        os.remove("test/tmp2/download_result.fragment")
+
+    stime = time.time()
+    corrupt_session = grader.GradingSession(grader.corrupt_handler, latency=0.01)
+    corrupt_session.add_peer(1, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48001), extra_args="--block-check")
+    corrupt_session.add_peer(2, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data2.fragment", 1, ("127.0.0.1", 48002), extra_args="--block-check")
+    corrupt_session.run_grader()
+
+    corrupt_session.peer_list[("127.0.0.1", 48001)].send_cmd('''DOWNLOAD test/tmp2/download_target.chunkhash test/tmp2/download_result.fragment\n''')
+
+    while True:
+        if os.path.exists("test/tmp2/download_result.fragment"):
+            success = True
+            break
+        elif time.time()-stime>time_max:
+            success = False
+            break
+
+        time.sleep(0.1)
+
+    for p in corrupt_session.peer_list.values():
+        p.terminate_peer()
+
+    return corrupt_session, success
+
+def test_finish(corrupt_session):
+    session, success = corrupt_session
+    assert success == True, "Fail to complete transfer or timeout"
+
+def test_block_refetch(corrupt_session):
+    session, success = corrupt_session
+    downloader = session.peer_list[("127.0.0.1", 48001)]
+    assert downloader.send_record[("127.0.0.1", 48002)].get(6, 0) == 1, "Fail to request block checksums"
+    assert downloader.send_record[("127.0.0.1", 48002)][2] == 2, "Expect one GET for the chunk and one for the bad block"
+    assert downloader.recv_record[("127.0.0.1", 48002)][3] < 600, "Whole chunk was fetched again"
+
+def test_content(corrupt_session):
+    with open("test/tmp2/download_result.fragment", "rb") as download_file:
+        download_fragment = pickle.load(download_file)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+
+    assert target_hash in download_fragment, f"download hash mismatch, target: {target_hash}, has: {download_fragment.keys()}"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
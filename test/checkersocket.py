@@ -3,9 +3,13 @@ import socket
 import logging
 import select
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
 
 SpiffyHeaderLen = struct.calcsize("I4s4sHH")
-StdHeaderLen = struct.calcsize("HBBHHII")
+StdHeaderLen = packet.HEADER_LEN
 _MAXBUFSIZE = 1500
 
 class StdPkt:
@@ -49,12 +53,7 @@ class CheckerSocket:
         s_head_lSrcPort = socket.ntohs(s_head_lSrcPort)
         s_head_lDestPort = socket.ntohs(s_head_lDestPort)
 
-        magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("HBBHHII", mixedheaders[SpiffyHeaderLen:])
-        magic = socket.ntohs(magic)
-        header_len = socket.ntohs(header_len)
-        pkt_len = socket.ntohs(pkt_len)
-        seq = socket.ntohl(seq)
-        ack = socket.ntohl(ack)
+        magic, team, pkt_type, header_len, pkt_len, seq, ack = packet.HEADER.unpack_from(mixedheaders, SpiffyHeaderLen)
 
         # can_read, _, _ = select.select([self.__sock], [], [], 1)
         # if len(can_read) > 0:
@@ -0,0 +1,152 @@
+import sys
+import os
+import pickle
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.chunk_sink as chunk_sink
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+The streaming output writer: the finished file loads with pickle like the old single dump, an
+interrupted one resumes from its journal and the partial files of its chunks in progress, and a
+restarted DOWNLOAD only fetches what is missing.
+'''
+
+
+def make_chunks(count):
+    chunks = dict()
+    for i in range(count):
+        chunk = hashlib.sha256(str(i).encode()).digest() * (512 * 1024 // 32)
+        chunks[hashlib.sha1(chunk).hexdigest()] = chunk
+    return chunks
+
+
+def test_pickle_compatible(tmp_path):
+    chunks = make_chunks(3)
+    output = str(tmp_path / "result.fragment")
+    sink = chunk_sink.ChunkSink(output)
+    for chunk_hash, chunk in chunks.items():
+        sink.add(chunk_hash, memoryview(chunk))
+        assert bytes(sink[chunk_hash]) == chunk
+    assert not os.path.exists(output)
+    sink.finish()
+    assert sorted(os.listdir(tmp_path)) == ["result.fragment"]
+    with open(output, "rb") as f:
+        assert pickle.load(f) == chunks
+
+
+def test_resume(tmp_path):
+    chunks = make_chunks(4)
+    hashes = list(chunks)
+    output = str(tmp_path / "result.fragment")
+    sink = chunk_sink.ChunkSink(output)
+    for chunk_hash in hashes[:3]:
+        sink.add(chunk_hash, chunks[chunk_hash])
+    # a crash while the third chunk was written: its data is cut short and its journal entry half there
+    offset, length = sink.offsets[hashes[2]]
+    sink.part.truncate(offset + length // 2)
+    sink.journal.truncate(2 * chunk_sink.JOURNAL_ENTRY.size + 7)
+    sink.part.close()
+    sink.journal.close()
+
+    sink = chunk_sink.ChunkSink(output)
+    assert sink.resumed == hashes[:2]
+    assert bytes(sink[hashes[1]]) == chunks[hashes[1]]
+    for chunk_hash in hashes[2:]:
+        sink.add(chunk_hash, chunks[chunk_hash])
+    sink.finish()
+    with open(output, "rb") as f:
+        assert pickle.load(f) == chunks
+
+
+def write_two_node(tmp_path, chunks):
+    with open(tmp_path / "seed.fragment", "wb") as f:
+        pickle.dump(chunks, f)
+    with open(tmp_path / "empty.fragment", "wb") as f:
+        pickle.dump(dict(), f)
+    with open(tmp_path / "target.chunkhash", "w") as f:
+        f.writelines(f"{i} {chunk_hash}\n" for i, chunk_hash in enumerate(chunks))
+    (tmp_path / "nodes.map").write_text("1 127.0.0.1 48001\n2 127.0.0.1 48002\n")
+    (tmp_path / "topo.map").write_text("1 2 10000000 0.01 50\n")
+
+
+def two_node_swarm(tmp_path, output):
+    swarm = VirtualSwarm(str(tmp_path / "topo.map"), str(tmp_path / "nodes.map"))
+    swarm.add_peer(1, str(tmp_path / "seed.fragment"), 1)
+    swarm.add_peer(2, str(tmp_path / "empty.fragment"), 1)
+    swarm.download(2, str(tmp_path / "target.chunkhash"), output)
+    return swarm
+
+
+def test_download_resumed(tmp_path):
+    chunks = make_chunks(4)
+    write_two_node(tmp_path, chunks)
+    output = str(tmp_path / "result.fragment")
+    swarm = lambda: two_node_swarm(tmp_path, output)
+
+    # the downloader dies with 2 chunks done
+    first = swarm()
+    downloader = first.peers[2].module
+    first.run(until=600, stop=lambda: len(downloader.received_hash) >= 2)
+    done = list(downloader.received_hash)
+    first.crash(2)
+    assert not os.path.exists(output)
+
+    second = swarm()
+    downloader = second.peers[2].module
+    assert downloader.sink.resumed == done
+    assert not set(done) & set(downloader.picker.wanted)
+    second.run(until=600)
+    assert not second.downloading()
+    with open(output, "rb") as f:
+        assert pickle.load(f) == chunks
+
+
+def test_partial_chunk_resumed(tmp_path):
+    chunks = make_chunks(2)
+    write_two_node(tmp_path, chunks)
+    output = str(tmp_path / "result.fragment")
+
+    # the downloader dies with 300 pkts of the first chunk in
+    first = two_node_swarm(tmp_path, output)
+    downloader = first.peers[2].module
+    first.run(until=600, stop=lambda: any(record.chunk.ack >= 300 for record in downloader.data_info.values()))
+    first.crash(2)
+    chunk = next(iter(downloader.data_info.values())).chunk
+    tag = chunk.tag
+    # what the next attempt finds is the last save, the pkts after it are lost
+    with open(os.path.join(output + chunk_sink.PARTIAL_SUFFIX, chunk.chunk_hash), "rb") as f:
+        saved_map = f.read()[downloader.CHUNK_DATA_SIZE:]
+    missing = (saved_map.find(0) + 1, saved_map.rfind(0) + 1)
+
+    second = two_node_swarm(tmp_path, output)
+    sock = second.peers[1].sock
+    sendto = sock.sendto
+    gets = []
+    sent = []
+
+    def counting_sendto(data, address):
+        type_code, seq, ack, _ = packet.parse(data)
+        if type_code == packet.DATA and ack == tag:
+            sent.append(seq)
+        return sendto(data, address)
+    sock.sendto = counting_sendto
+    process_pkt = second.peers[1].module.process_pkt
+
+    def logging_process_pkt(sock, pkt, from_addr):
+        type_code, seq, ack, _ = packet.parse(pkt)
+        if type_code == packet.GET:
+            gets.append((seq, ack))
+        process_pkt(sock, pkt, from_addr)
+    second.peers[1].module.process_pkt = logging_process_pkt
+    second.run(until=600)
+    assert not second.downloading()
+    with open(output, "rb") as f:
+        assert pickle.load(f) == chunks
+    # the first chunk is asked for from its first missing seq, nothing before it is sent again
+    assert missing[0] > 300 - downloader.SAVE_EVERY
+    assert gets[0] == missing
+    assert min(sent) == missing[0]
+    assert not os.path.exists(output + chunk_sink.PARTIAL_SUFFIX)
@@ -0,0 +1,84 @@
+import sys
+import os
+import argparse
+import hashlib
+import json
+import pickle
+import subprocess
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.chunk_store as chunk_store
+
+'''
+Compare peer startup with a pickled .fragment against the mmap'ed chunk store.
+
+Each format is loaded in a fresh interpreter, which then answers one WHOHAS-style lookup and
+slices one DATA payload, and reports wall time and peak RSS.
+
+python3 test/chunk_store_benchmark.py --chunks 400
+'''
+
+CHUNK_SIZE = 512 * 1024
+
+LOADER = r'''
+import sys, time, resource, json
+sys.path.append(sys.argv[1])
+stime = time.time()
+import util.bt_utils as bt_utils
+class Args: pass
+args = Args()
+args.p, args.c, args.m, args.i, args.v, args.t = sys.argv[2], sys.argv[3], 1, 1, 0, None
+config = bt_utils.BtConfig(args)
+key = sys.argv[4]
+assert key in config.haschunks
+payload = bytes(memoryview(config.haschunks[key])[1024:2048])
+elapsed = time.time() - stime
+# ru_maxrss survives exec and would include the parent's footprint, VmHWM does not
+max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open("/proc/self/status") as f:
+        max_rss = int([l for l in f if l.startswith("VmHWM:")][0].split()[1])
+except (OSError, IndexError):
+    pass
+print(json.dumps({"startup_s": elapsed, "max_rss_kb": max_rss}))
+'''
+
+
+def make_fragment(path, chunk_num):
+    chunks = dict()
+    for i in range(chunk_num):
+        data = hashlib.sha256(i.to_bytes(4, 'big')).digest() * (CHUNK_SIZE // 32)
+        chunks[hashlib.sha1(data).hexdigest()] = data
+    with open(path, 'wb') as f:
+        pickle.dump(chunks, f)
+    return list(chunks.keys())
+
+
+def run_loader(root, nodes_map, chunk_file, key):
+    out = subprocess.run([sys.executable, "-c", LOADER, root, nodes_map, chunk_file, key],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=200, help='number of 512 KiB chunks the seeder holds')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_map = os.path.join(tmp, "nodes.map")
+        with open(nodes_map, 'w') as f:
+            f.write("1 127.0.0.1 48001\n")
+        fragment = os.path.join(tmp, "seed.fragment")
+        store = os.path.join(tmp, "seed.store")
+        keys = make_fragment(fragment, args.chunks)
+        chunk_store.convert(fragment, store)
+
+        for name, path in (("pickle", fragment), ("chunk_store", store)):
+            results = [run_loader(root, nodes_map, path, keys[-1]) for _ in range(args.repeat)]
+            startup = min(r["startup_s"] for r in results)
+            rss = min(r["max_rss_kb"] for r in results)
+            print(f"{name:12s} chunks={args.chunks} startup={startup * 1000:.1f} ms max_rss={rss / 1024:.1f} MiB")
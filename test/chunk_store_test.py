@@ -0,0 +1,30 @@
+import sys
+import os
+import pickle
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.chunk_store as chunk_store
+
+'''
+The chunk store converted from a .fragment must hold exactly the same chunks.
+'''
+
+
+def test_convert_roundtrip(tmp_path):
+    fragment = os.path.join(os.path.dirname(__file__), "tmp2", "data2.fragment")
+    store = str(tmp_path / "data2.store")
+    chunk_store.convert(fragment, store)
+
+    with open(fragment, "rb") as f:
+        expected = pickle.load(f)
+
+    assert chunk_store.is_chunk_store(store)
+    assert not chunk_store.is_chunk_store(fragment)
+    chunks = chunk_store.ChunkStore(store)
+    assert sorted(chunks.keys()) == sorted(expected.keys())
+    for chunk_hash, data in expected.items():
+        assert chunk_hash in chunks
+        assert bytes(chunks[chunk_hash]) == data
+        assert hashlib.sha1(chunks[chunk_hash]).hexdigest() == chunk_hash
+    chunks.close()
@@ -0,0 +1,74 @@
+import sys
+import os
+import argparse
+import hashlib
+import pickle
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.congestion as congestion
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Completion time of one upload of --chunks chunks with each congestion controller, on two-node
+topologies of growing bandwidth-delay product, on virtual time.
+
+python3 test/congestion_benchmark.py --chunks 4
+'''
+
+# (name, bits per second, one-way delay in s, queue size in pkts)
+LINKS = [
+    ("lan 10Mbps 5ms", 10000000, 0.005, 50),
+    ("wan 10Mbps 50ms", 10000000, 0.05, 50),
+    ("long 10Mbps 200ms", 10000000, 0.2, 100),
+    ("fat 100Mbps 100ms", 100000000, 0.1, 400),
+]
+
+
+def write_files(tmp, chunks):
+    data = {}
+    for i in range(chunks):
+        chunk = hashlib.sha256(str(i).encode()).digest() * (512 * 1024 // 32)
+        data[hashlib.sha1(chunk).hexdigest()] = chunk
+    with open(os.path.join(tmp, "seed.fragment"), "wb") as f:
+        pickle.dump(data, f)
+    with open(os.path.join(tmp, "empty.fragment"), "wb") as f:
+        pickle.dump(dict(), f)
+    with open(os.path.join(tmp, "target.chunkhash"), "w") as f:
+        for i, chunk_hash in enumerate(data):
+            f.write(f"{i} {chunk_hash}\n")
+    with open(os.path.join(tmp, "nodes.map"), "w") as f:
+        f.write("1 127.0.0.1 48001\n2 127.0.0.1 48002\n")
+
+
+def run(tmp, link, cc):
+    _, bps, delay, queue = link
+    topo = os.path.join(tmp, "topo.map")
+    with open(topo, "w") as f:
+        f.write(f"1 2 {bps} {delay} {queue}\n")
+    swarm = VirtualSwarm(topo, os.path.join(tmp, "nodes.map"))
+    swarm.add_peer(1, os.path.join(tmp, "seed.fragment"), 1, cc=cc)
+    swarm.add_peer(2, os.path.join(tmp, "empty.fragment"), 1, cc=cc)
+    swarm.download(2, os.path.join(tmp, "target.chunkhash"), os.path.join(tmp, "result.fragment"))
+    finish = swarm.run(until=3600)
+    return finish, not swarm.downloading(), swarm.network.dropped()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=4)
+    parser.add_argument('--cc', nargs='+', choices=sorted(congestion.CONTROLLERS), default=["reno", "cubic", "bbr"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_files(tmp, args.chunks)
+        for link in LINKS:
+            bdp = link[1] / 8 * 2 * link[2] / 1040
+            for cc in args.cc:
+                stime = time.perf_counter()
+                finish, done, dropped = run(tmp, link, cc)
+                goodput = args.chunks * 512 / finish
+                status = "done" if done else "unfinished"
+                print(f"{link[0]:18s} bdp {bdp:6.0f} pkts  {cc:5s} {finish:8.2f} s  {goodput:8.1f} KiB/s  "
+                      f"{dropped:5d} dropped  {time.perf_counter() - stime:6.2f} s wall  {status}")
@@ -0,0 +1,132 @@
+import sys
+import os
+import pickle
+import hashlib
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.congestion as congestion
+from util.virtual_swarm import VirtualSwarm
+
+'''
+The congestion controllers on their own, and whole tmp5 swarms with each of them, paced or not.
+'''
+
+TMP5 = os.path.join(os.path.dirname(__file__), "tmp5")
+
+
+class Record:
+    # the Ack_Record fields a controller touches
+    def __init__(self):
+        self.cwnd = 1.0
+        self.ssthresh = congestion.INIT_SSTHRESH
+        self.mode = 0
+        self.duplicated_ack = 0
+
+
+def test_reno():
+    cc = congestion.Reno()
+    record = Record()
+    cc.start(record)
+    # slow start counts at most ABC_LIMIT pkts per ACK
+    cc.on_ack(record, 5, 0)
+    assert record.cwnd == 1 + congestion.ABC_LIMIT
+    record.cwnd = 63
+    cc.on_ack(record, 1, 0)
+    assert (record.cwnd, record.mode) == (64, 1)
+    cc.on_ack(record, 1, 0)
+    assert record.cwnd == pytest.approx(64 + 1 / 64)
+    record.cwnd = 40
+    assert not cc.on_dup_ack(record, 0)
+    assert not cc.on_dup_ack(record, 0)
+    assert cc.on_dup_ack(record, 0)
+    assert (record.ssthresh, record.cwnd, record.mode) == (20, 23, 2)
+    assert not cc.on_dup_ack(record, 0)
+    assert record.cwnd == 24
+    cc.on_ack(record, 1, 0)
+    assert (record.cwnd, record.mode) == (20, 1)
+    cc.on_timeout(record, 0)
+    assert (record.ssthresh, record.cwnd, record.mode) == (10, 1, 0)
+
+
+def test_cubic_regrows_to_w_max():
+    cc = congestion.Cubic()
+    record = Record()
+    record.cwnd, record.mode = 100, 1
+    cc.on_rtt(record, 0.1, 0)
+    for _ in range(3):
+        cc.on_dup_ack(record, 0)
+    assert record.ssthresh == 70
+    cc.on_ack(record, 1, 0)
+    assert (record.cwnd, record.mode) == (70, 1)
+    # K = cbrt(30 / C) seconds after the loss the window is back at w_max, concave before it
+    k = (30 / congestion.CUBIC_C) ** (1 / 3)
+    now = 0
+    while now < k - 0.1:
+        now += 0.01
+        cc.on_ack(record, 1, now)
+    assert 90 < record.cwnd < 100
+    while now < k + 2:
+        now += 0.01
+        cc.on_ack(record, 1, now)
+    assert record.cwnd > 100
+
+
+def test_bbr_model():
+    cc = congestion.Bbr()
+    record = Record()
+    cc.start(record)
+    # a pipe that delivers 100 pkts/s with a 0.1 s min RTT, whatever the window
+    now = 0
+    for _ in range(200):
+        cc.on_rtt(record, 0.1, now)
+        now += 0.01
+        cc.on_ack(record, 1, now)
+    assert record.mode == 1
+    assert cc.bdp() == pytest.approx(10, rel=0.15)
+    assert record.cwnd == pytest.approx(congestion.BBR_CWND_GAIN * cc.bdp() * congestion.BBR_PROBE_GAINS[cc.probe_index])
+    # a loss caps the window, a timeout falls back to one pkt and the next ACK restores it
+    record.cwnd = 30
+    for _ in range(3):
+        cc.on_dup_ack(record, now)
+    assert cc.inflight_hi == pytest.approx(30 * congestion.BBR_LOSS_BETA)
+    cc.on_timeout(record, now)
+    assert record.cwnd == 1
+    cc.on_ack(record, 1, now)
+    assert record.cwnd > 4
+    # the next upload to the same receiver skips startup
+    fresh = Record()
+    cc.start(fresh)
+    assert fresh.mode == 1 and fresh.cwnd == pytest.approx(cc.bdp())
+
+
+def test_pacing_rate():
+    record = Record()
+    record.cwnd = 10
+    # slow start paces a window out in half an RTT, avoidance in a bit less than one
+    assert congestion.Reno().pacing_rate(record, 0.1) == pytest.approx(congestion.PACING_GAIN_SLOW_START * 100)
+    record.mode = 1
+    assert congestion.Reno().pacing_rate(record, 0.1) == pytest.approx(congestion.PACING_GAIN * 100)
+    # bbr paces at its bandwidth estimate once it has one
+    cc = congestion.Bbr()
+    assert cc.pacing_rate(record, 0.1) == pytest.approx(congestion.PACING_GAIN * 100)
+    cc.bw_samples = [50, 80]
+    cc.min_rtt = 0.1
+    assert cc.pacing_rate(record, 0.1) == pytest.approx(congestion.BBR_PROBE_GAINS[0] * 80)
+
+
+@pytest.mark.parametrize("cc, pace", [("cubic", False), ("bbr", False), ("reno", True), ("bbr", True)])
+def test_swarm(tmp_path, cc, pace):
+    swarm = VirtualSwarm(os.path.join(TMP5, "topo5.map"), os.path.join(TMP5, "nodes5.map"))
+    for identity, fragment in [(1, 1), (2, 2), (7, 3), (14, 4), (10, 5), (15, 6), (12, 7), (13, 8)]:
+        swarm.add_peer(identity, os.path.join(TMP5, "fragments", f"data5-{fragment}.fragment"), 100, cc=cc, pace=pace)
+    swarm.download(7, os.path.join(TMP5, "targets", "target2.chunkhash"), str(tmp_path / "result.fragment"))
+    swarm.run(until=640)
+    assert not swarm.downloading()
+    with open(os.path.join(TMP5, "targets", "target2.chunkhash")) as tf:
+        target_hash = [line.split(" ")[1].strip() for line in tf if line.strip()]
+    with open(tmp_path / "result.fragment", "rb") as rf:
+        result = pickle.load(rf)
+    assert sorted(result) == sorted(target_hash)
+    assert all(hashlib.sha1(data).hexdigest() == hash_str for hash_str, data in result.items())
@@ -0,0 +1,112 @@
+import sys
+import os
+import argparse
+import hashlib
+import random
+import struct
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import peer
+from receive_buffer_benchmark import bench_config
+
+'''
+Count WHOHAS/IHAVE pkts and bytes for one DOWNLOAD, with batched hashes against the old
+one-hash-per-pkt flooding (reproduced below as legacy_*).
+
+python3 test/control_traffic_benchmark.py --chunks 1000 --peers 50 --replicas 3
+'''
+
+
+class CountingSocket:
+    def __init__(self):
+        self.pkts = []  # (pkt, addr)
+
+    def sendto(self, data, addr):
+        self.pkts.append((bytes(data), addr))
+        return len(data)
+
+
+class FeedSocket(CountingSocket):
+    def __init__(self, pkt, from_addr):
+        super().__init__()
+        self.pkt = pkt
+        self.from_addr = from_addr
+
+    def recvfrom(self, bufsize):
+        return self.pkt, self.from_addr
+
+
+def legacy_whohas(hashes, peers):
+    pkts = []
+    for hash_str in hashes:
+        whohas_pkt = struct.pack(peer.FORMAT, peer.MAGIC, peer.TEAM, 0, peer.HEADER_LEN, peer.HEADER_LEN + len(hash_str), 0, 0) + hash_str.encode()
+        for p in peers:
+            if int(p[0]) != 1:
+                pkts.append((whohas_pkt, (p[1], int(p[2]))))
+    return pkts
+
+
+def legacy_ihave(whohas_pkts, holdings):
+    pkts = []
+    for whohas_pkt, addr in whohas_pkts:
+        chunk_hash = whohas_pkt[peer.HEADER_LEN:].decode()
+        if chunk_hash in holdings[addr]:
+            pkts.append((struct.pack(peer.FORMAT, peer.MAGIC, peer.TEAM, 1, peer.HEADER_LEN, peer.HEADER_LEN + len(chunk_hash), 0, 0) + chunk_hash.encode(), addr))
+    return pkts
+
+
+def batched(hashes, peers, holdings):
+    peer.config = bench_config(peers)
+    peer.config.haschunks = set()
+    peer.target_hash.clear()
+    peer.received_hash.clear()
+    peer.picker = peer.piece_picker.PiecePicker()
+    peer.target_hash.update(hashes)
+    for hash_str in hashes:
+        peer.picker.want(hash_str)
+    peer.last_who_has = None
+    sock = CountingSocket()
+    peer.send_whohas(sock)
+    whohas_pkts = sock.pkts
+
+    ihave_pkts = []
+    for whohas_pkt, addr in whohas_pkts:
+        peer.config.haschunks = holdings[addr]
+        feed = FeedSocket(whohas_pkt, ("127.0.0.1", 48001))
+        peer.process_inbound_udp(feed)
+        ihave_pkts.extend((pkt, addr) for pkt, _ in feed.pkts)
+
+    # the downloader must learn every holder of every hash
+    peer.config.haschunks = set()
+    for ihave_pkt, addr in ihave_pkts:
+        peer.process_inbound_udp(FeedSocket(ihave_pkt, addr))
+    for hash_str in hashes:
+        assert peer.picker.holders[hash_str] == {addr for addr in holdings if hash_str in holdings[addr]}
+    return whohas_pkts, ihave_pkts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--peers', type=int, default=50)
+    parser.add_argument('--replicas', type=int, default=3, help='how many peers hold each chunk')
+    args = parser.parse_args()
+
+    rng = random.Random(305)
+    hashes = [hashlib.sha1(i.to_bytes(4, 'big')).hexdigest() for i in range(args.chunks)]
+    peers = [[str(i), "127.0.0.1", str(48000 + i)] for i in range(1, args.peers + 2)]
+    holdings = {("127.0.0.1", 48000 + i): set() for i in range(2, args.peers + 2)}
+    for hash_str in hashes:
+        for addr in rng.sample(sorted(holdings.keys()), min(args.replicas, args.peers)):
+            holdings[addr].add(hash_str)
+
+    old_whohas = legacy_whohas(hashes, peers)
+    old_ihave = legacy_ihave(old_whohas, holdings)
+    new_whohas, new_ihave = batched(hashes, peers, holdings)
+
+    print(f"{args.chunks} chunks, {args.peers} peers, {args.replicas} replicas per chunk")
+    for name, whohas_pkts, ihave_pkts in (("one hash/pkt", old_whohas, old_ihave), ("batched", new_whohas, new_ihave)):
+        whohas_bytes = sum(len(pkt) for pkt, _ in whohas_pkts)
+        ihave_bytes = sum(len(pkt) for pkt, _ in ihave_pkts)
+        print(f"{name:13s} WHOHAS {len(whohas_pkts):6d} pkts {whohas_bytes:9d} B   IHAVE {len(ihave_pkts):6d} pkts {ihave_bytes:9d} B")
@@ -0,0 +1,68 @@
+import os
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+
+'''
+One 512 KiB transfer between two peers on plain localhost sockets (no simulator), with one ACK
+per DATA pkt against cumulative ACKs (--ack-every K). Reports transfer time, DATA pkts/s and
+the number of ACKs, counted from the peers' logs.
+
+python3 test/delayed_ack_benchmark.py --ack-every 1 2 4 --repeat 3
+'''
+
+
+def run_once(root, ack_every, time_max):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.pop("SIMULATOR", None)
+        nodes_map = os.path.join(root, "test/tmp1/nodes1.map")
+        result = os.path.join(tmp, "result.fragment")
+        # both peers would race to create it
+        os.makedirs(os.path.join(tmp, "log"))
+        peers = []
+        for identity, fragment, extra_args in ((2, "data2.fragment", []), (1, "data1.fragment", ["--ack-every", str(ack_every)])):
+            cmd = [sys.executable, os.path.join(root, "src/peer.py"), "-p", nodes_map, "-c", os.path.join(root, "test/tmp1", fragment),
+                   "-m", "1", "-i", str(identity)] + extra_args
+            peers.append(subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, env=env, cwd=tmp, text=True))
+        time.sleep(1)
+        stime = time.time()
+        peers[1].stdin.write(f"DOWNLOAD {os.path.join(root, 'test/tmp1/download_target.chunkhash')} {result}\n")
+        peers[1].stdin.flush()
+        elapsed = None
+        while time.time() - stime < time_max:
+            if os.path.exists(result):
+                elapsed = time.time() - stime
+                break
+            time.sleep(0.01)
+        for p in peers:
+            p.terminate()
+            p.wait()
+        with open(os.path.join(tmp, "log", "peer1.log")) as f:
+            log = f.read()
+        data_pkts = log.count("Receiving a type3")
+        ack_pkts = log.count("sending a type4")
+    return elapsed, data_pkts, ack_pkts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ack-every', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--time-max', type=float, default=60)
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    for ack_every in args.ack_every:
+        runs = [run_once(root, ack_every, args.time_max) for _ in range(args.repeat)]
+        done = [r for r in runs if r[0] is not None]
+        if len(done) == 0:
+            print(f"ack-every {ack_every}: no transfer finished")
+            continue
+        elapsed = sorted(r[0] for r in done)[len(done) // 2]
+        data_pkts = sum(r[1] for r in done) / len(done)
+        ack_pkts = sum(r[2] for r in done) / len(done)
+        print(f"ack-every {ack_every}: {len(done)}/{len(runs)} done, median {elapsed * 1000:7.1f} ms, "
+              f"{data_pkts / elapsed:8.0f} DATA pkts/s, {data_pkts:6.0f} DATA, {ack_pkts:6.0f} ACKs")
@@ -0,0 +1,83 @@
+import os
+import argparse
+import pickle
+import shutil
+import tempfile
+import time
+
+import grader
+
+'''
+Tail latency of a 2-chunk download on the lossy test/tmp5/topo5.map, with and without --endgame.
+
+Peer1 downloads the chunks of target2. They are held by peer14 and peer12 (data5-4, data5-7)
+and, as extra replicas, by peer2 and peer7. Links have 15-packet drop-tail queues, so whichever
+holder a chunk is first asked from may be slow; with end-game the idle holders duplicate it.
+The whole download time is the completion time of the last chunk.
+
+python3 test/endgame_benchmark.py --repeat 3
+'''
+
+NODES = "test/tmp5/nodes5.map"
+TOPO = "test/tmp5/topo5.map"
+TARGET = "test/tmp5/targets/target2.chunkhash"
+
+
+def merged_fragment(path, fragments):
+    chunks = dict()
+    for fragment in fragments:
+        with open(fragment, "rb") as f:
+            chunks.update(pickle.load(f))
+    with open(path, "wb") as f:
+        pickle.dump(chunks, f)
+
+
+def run_once(tmp, extra_args, time_max):
+    result = os.path.join(tmp, "result.fragment")
+    if os.path.exists(result):
+        os.remove(result)
+    replica = os.path.join(tmp, "replica.fragment")
+    session = grader.GradingSession(grader.normal_handler, latency=0.01, spiffy=True, topo_map=TOPO, nodes_map=NODES)
+    session.add_peer(1, "src/peer.py", NODES, "test/tmp5/fragments/data5-1.fragment", 100, ("127.0.0.1", 48001), timeout=None, extra_args=extra_args)
+    session.add_peer(2, "src/peer.py", NODES, replica, 100, ("127.0.0.1", 48002), timeout=None)
+    session.add_peer(7, "src/peer.py", NODES, replica, 100, ("127.0.0.1", 48003), timeout=None)
+    session.add_peer(14, "src/peer.py", NODES, "test/tmp5/fragments/data5-4.fragment", 100, ("127.0.0.1", 48004), timeout=None)
+    session.add_peer(12, "src/peer.py", NODES, "test/tmp5/fragments/data5-7.fragment", 100, ("127.0.0.1", 48007), timeout=None)
+    session.run_grader()
+
+    stime = time.time()
+    session.peer_list[("127.0.0.1", 48001)].send_cmd(f"DOWNLOAD {TARGET} {result}\n")
+    elapsed = None
+    while time.time() - stime < time_max:
+        if os.path.exists(result):
+            elapsed = time.time() - stime
+            break
+        time.sleep(0.1)
+    for p in session.peer_list.values():
+        p.terminate_peer()
+    session.simulator_process.terminate()
+    session.simulator_process.wait()
+    time.sleep(1)
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--endgame', type=int, default=2, help='N passed to --endgame')
+    parser.add_argument('--time-max', type=float, default=120)
+    args = parser.parse_args()
+
+    os.makedirs("log", exist_ok=True)
+    tmp = tempfile.mkdtemp()
+    try:
+        merged_fragment(os.path.join(tmp, "replica.fragment"),
+                        ["test/tmp5/fragments/data5-4.fragment", "test/tmp5/fragments/data5-7.fragment"])
+        for name, extra_args in (("default", ""), (f"--endgame {args.endgame}", f"--endgame {args.endgame}")):
+            times = [run_once(tmp, extra_args, args.time_max) for _ in range(args.repeat)]
+            done = sorted(t for t in times if t is not None)
+            summary = " ".join(f"{t:.1f}" for t in done)
+            print(f"{name:12s} finished {len(done)}/{len(times)}  times [s]: {summary}"
+                  + (f"  median {done[len(done) // 2]:.1f}  max {done[-1]:.1f}" if done else ""))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
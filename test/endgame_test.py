@@ -0,0 +1,116 @@
+import grader
+import time
+import pytest
+import pickle
+import hashlib
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+This test examines the end-game mode, and that DATA without a chunk tag (ack field 0, as from
+example/dumbsender.py) is still received.
+Peer2 and peer3 both have the target chunk, peer1 runs with --endgame 1, so once the chunk is
+in progress from one of them the other one is asked for it as well. When the chunk completes
+the slower sender gets a CANCEL.
+
+This test is equivalent to run:
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data1.fragment -m 1 -i 1 --endgame 1
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data2.fragment -m 1 -i 2
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data2.fragment -m 1 -i 3
+
+In peer1:
+DOWNLOAD test/tmp1/download_target.chunkhash test/tmp1/download_result.fragment
+'''
+
+@pytest.fixture(scope='module')
+def endgame_session():
+    success = False
+    time_max = 60
+
+    if os.path.exists("test/tmp1/download_result.fragment"):
+        os.remove("test/tmp1/download_result.fragment")
+
+    stime = time.time()
+    session = grader.GradingSession(grader.normal_handler)
+    session.add_peer(1, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data1.fragment", 1, ("127.0.0.1", 48001), timeout=None, extra_args="--endgame 1")
+    session.add_peer(2, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data2.fragment", 1, ("127.0.0.1", 48002), timeout=None)
+    session.add_peer(3, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data2.fragment", 1, ("127.0.0.1", 48003), timeout=None)
+    session.run_grader()
+
+    session.peer_list[("127.0.0.1", 48001)].send_cmd('''DOWNLOAD test/tmp1/download_target.chunkhash test/tmp1/download_result.fragment\n''')
+
+    while True:
+        if os.path.exists("test/tmp1/download_result.fragment"):
+            success = True
+            break
+        elif time.time()-stime>time_max:
+            success = False
+            break
+
+        time.sleep(0.1)
+
+    # the grader may still be relaying a backlog of DATA when the result is written
+    downloader = session.peer_list[("127.0.0.1", 48001)]
+    wait_start = time.time()
+    while success and time.time() - wait_start < 5:
+        if any(downloader.send_record.get(("127.0.0.1", port), {}).get(8, 0) > 0 for port in (48002, 48003)):
+            break
+        time.sleep(0.1)
+    for p in session.peer_list.values():
+        p.terminate_peer()
+
+    return session, success
+
+def test_finish(endgame_session):
+    session, success = endgame_session
+    assert success == True, "Fail to complete transfer or timeout"
+
+def test_duplicate_and_cancel(endgame_session):
+    session, success = endgame_session
+    downloader = session.peer_list[("127.0.0.1", 48001)]
+    for port in (48002, 48003):
+        assert downloader.send_record[("127.0.0.1", port)][2] > 0, f"No GET sent to {port}"
+    cancels = sum(downloader.send_record[("127.0.0.1", port)].get(8, 0) for port in (48002, 48003))
+    assert cancels >= 1, "The slower sender was not cancelled"
+
+def test_content(endgame_session):
+    with open("test/tmp1/download_result.fragment", "rb") as download_file:
+        download_fragment = pickle.load(download_file)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+
+    assert target_hash in download_fragment, f"download hash mismatch, target: {target_hash}, has: {download_fragment.keys()}"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
+
+
+def test_untagged_data(tmp_path):
+    # a sender that puts 0 in the ack field of its DATA, as the protocol has it
+    nodes_map = tmp_path / "nodes.map"
+    nodes_map.write_text("1 127.0.0.1 48001\n2 127.0.0.1 48002\n")
+    topo_map = tmp_path / "topo.map"
+    topo_map.write_text("1 2 1000000 0.01 50\n")
+    swarm = VirtualSwarm(str(topo_map), str(nodes_map))
+    swarm.add_peer(1, "test/tmp1/data1.fragment", 1)
+    swarm.add_peer(2, "test/tmp1/data2.fragment", 1)
+    sock = swarm.peers[2].sock
+    sendto = sock.sendto
+    untagged = []
+
+    def untagged_sendto(data, address):
+        if packet.parse(data)[0] == packet.DATA:
+            data = bytes(data[:packet.HEADER_LEN - 4]) + bytes(4) + bytes(data[packet.HEADER_LEN:])
+            untagged.append(data)
+        return sendto(data, address)
+    sock.sendto = untagged_sendto
+    result = str(tmp_path / "result.fragment")
+    swarm.download(1, "test/tmp1/download_target.chunkhash", result)
+    swarm.run(until=300)
+    assert not swarm.downloading()
+    assert len(untagged) >= 512
+    with open(result, "rb") as f:
+        download_fragment = pickle.load(f)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash
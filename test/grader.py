@@ -13,9 +13,13 @@ import queue
 from concurrent.futures import ThreadPoolExecutor
 import logging
 os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.getcwd())
+import util.netsim as netsim
+
+PEER_START_MAX = 5
 
 class PeerProc:
-    def __init__(self, identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit = 1, timeout = 60):
+    def __init__(self, identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit = 1, timeout = 60, extra_args = ""):
         self.id = identity
         self.peer_file_loc = peer_file_loc
         self.node_map_loc = node_map_loc
@@ -25,16 +29,28 @@ class PeerProc:
         self.send_record = dict() #{to_id:{type:cnt}}
         self.recv_record = dict() #{from_id:{type:cnt}}
         self.timeout = timeout
+        self.extra_args = extra_args
 
     def start_peer(self):
         if self.timeout:
             cmd = f"python3 -u {self.peer_file_loc} -p {self.node_map_loc} -c {self.haschunk_loc} -m {self.max_transmit} -i {self.id} -t {self.timeout}"
         else:
             cmd = f"python3 -u {self.peer_file_loc} -p {self.node_map_loc} -c {self.haschunk_loc} -m {self.max_transmit} -i {self.id}"
+        if self.extra_args:
+            cmd = f"{cmd} {self.extra_args}"
 
+        log_file = os.path.join("log", f"peer{self.id}.log")
+        if os.path.exists(log_file):
+            os.remove(log_file)
         self.process = subprocess.Popen(cmd.split(" "), stdin=subprocess.PIPE,stdout=subprocess.DEVNULL,text=True, bufsize=1, universal_newlines=True)
-        # ensure peer is running
-        time.sleep(1) 
+        # ensure peer is running: SimSocket logs "Start logging" right after binding its socket
+        deadline = time.time() + PEER_START_MAX
+        while time.time() < deadline:
+            if os.path.exists(log_file):
+                with open(log_file) as f:
+                    if "Start logging" in f.read():
+                        break
+            time.sleep(0.01)
 
     def send_cmd(self, cmd):
         self.process.stdin.write(cmd)
@@ -46,7 +62,7 @@ class PeerProc:
             for i in range(6):
                 self.send_record[to_addr][i] = 0
 
-        self.send_record[to_addr][pkt_type] += 1
+        self.send_record[to_addr][pkt_type] = self.send_record[to_addr].get(pkt_type, 0) + 1
 
     def record_recv_pkt(self, pkt_type, from_addr):
         if from_addr not in self.recv_record:
@@ -54,7 +70,7 @@ class PeerProc:
             for i in range(6):
                 self.recv_record[from_addr][i] = 0
 
-        self.recv_record[from_addr][pkt_type] += 1
+        self.recv_record[from_addr][pkt_type] = self.recv_record[from_addr].get(pkt_type, 0) + 1
 
     def terminate_peer(self):
         self.process.send_signal(signal.SIGINT)
@@ -63,7 +79,7 @@ class PeerProc:
 
 
 class GradingSession:
-    def __init__(self, grading_handler, latency = 0.05, spiffy=False, topo_map = "test/tmp3/topo3.map", nodes_map = "test/tmp3/nodes3.map"):
+    def __init__(self, grading_handler, latency = 0.05, spiffy=False, topo_map = "test/tmp3/topo3.map", nodes_map = "test/tmp3/nodes3.map", simulator = None):
         self.peer_list = dict()
         self.checkerIP = "127.0.0.1"
         self.checkerPort = random.randint(30525, 52305)
@@ -78,6 +94,12 @@ class GradingSession:
 
         self.topo = topo_map
         self.nodes = nodes_map
+        # spiffy mode runs "hupsim" (util/hupsim.pl) or "netsim" (util/netsim.py in a thread)
+        self.simulator = simulator or os.getenv("GRADER_SIMULATOR", "hupsim")
+        self.netsim = None
+        # tap(pkt, time) is called for every pkt a peer sends, spiffy header included.
+        # The relay and netsim call it, hupsim pkts are not seen
+        self.tap = None
 
     def recv_pkt(self):
         while not self._FINISH:
@@ -85,6 +107,8 @@ class GradingSession:
             read_ready = ready[0]
             if len(read_ready) > 0:
                 pkt = self.checker_sock.recv_pkt_from()
+                if self.tap is not None:
+                    self.tap(pkt.pkt_bytes, time.time())
                 self.peer_list[pkt.from_addr].record_send_pkt(pkt.pkt_type, pkt.to_addr)
                 self.checker_recv_queue.put(pkt)
     
@@ -108,9 +132,11 @@ class GradingSession:
 
     def stop_grader(self):
         self._FINISH = True
+        if self.netsim is not None:
+            self.netsim.stop()
 
-    def add_peer(self, identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit, peer_addr, timeout = 60):
-        peer = PeerProc(identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit, timeout=timeout)
+    def add_peer(self, identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit, peer_addr, timeout = 60, extra_args = ""):
+        peer = PeerProc(identity, peer_file_loc, node_map_loc, haschunk_loc, max_transmit, timeout=timeout, extra_args=extra_args)
         self.peer_list[peer_addr] = peer
 
     def run_grader(self):
@@ -130,12 +156,18 @@ class GradingSession:
             send_worker.start()
             grading_worker = Thread(target=self.grading_handler, args=[self.checker_recv_queue, self.checker_send_queue,], daemon=True)
             grading_worker.start()
+        elif self.simulator == "netsim":
+            self.start_time = time.time()
+            # ready as soon as its socket is bound
+            self.netsim = netsim.Simulator(self.topo, self.nodes, (self.checkerIP, self.checkerPort), tap=self.tap)
+            Thread(target=self.netsim.serve, daemon=True).start()
         else:
             self.start_time = time.time()
             # start simulator
             cmd = f"perl util/hupsim.pl -m {self.topo} -n {self.nodes} -p {self.checkerPort} -v 3"
             outfile = open("log/Checker.log", "w")
             simulator_process = subprocess.Popen(cmd.split(" "), stdin=subprocess.PIPE,stdout=outfile,stderr=outfile ,text=True, bufsize=1, universal_newlines=True)
+            self.simulator_process = simulator_process
             # ensure simulator starts
             time.sleep(5)
 
@@ -198,6 +230,24 @@ def drop_handler(recv_queue, send_queue):
 
         send_queue.put(pkt)
 
+def corrupt_handler(recv_queue, send_queue):
+    # flip one payload byte of the 150th DATA pkt, the pkt itself is still delivered
+    cnt = 0
+    while True:
+        try:
+            pkt = recv_queue.get(timeout=0.01)
+        except:
+            continue
+
+        if pkt.pkt_type == 3:
+            cnt += 1
+            if cnt == 150:
+                corrupted = bytearray(pkt.pkt_bytes)
+                corrupted[-1] ^= 0xff
+                pkt.pkt_bytes = bytes(corrupted)
+
+        send_queue.put(pkt)
+
 def normal_handler(recv_queue, send_queue):
     start_time = time.time()
     while True:
@@ -0,0 +1,113 @@
+import sys
+import os
+import argparse
+import hashlib
+import math
+import pickle
+import resource
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.make_data as make_data
+
+'''
+Time and peak RSS of chunking a synthetic file of --sizes GB into --peers fragments (peer i gets
+the chunks i, i + peers, ...): the old make_data, which reads the whole file into memory and runs
+once per fragment, against the streaming make_data with every fragment in one pass, on one worker
+and on --workers threads. Each run is a process of its own. The old one is skipped when the file
+does not fit in the memory available.
+
+python3 test/make_data_benchmark.py --sizes 1,10 --peers 4
+'''
+
+MIB = 2 ** 20
+
+
+def old_make_data(input_file, output_file, chunk_num, my_index):
+    # util/make_data.py before streaming: every chunk in a list, hashed serially, one pickle.dump
+    num = min(math.floor(os.path.getsize(input_file) / make_data.BT_CHUNK_SIZE), chunk_num)
+    data_chunk = []
+    data_hash = []
+    with open(input_file, 'rb') as file:
+        for i in range(num):
+            chunk_byte = file.read(make_data.BT_CHUNK_SIZE)
+            data_chunk.append(chunk_byte)
+            data_hash.append(make_data.chunk_hash(chunk_byte))
+    with open("master.chunkhash", 'w') as f:
+        for j in range(len(data_hash)):
+            print(f"{j+1} {data_hash[j]}", file=f)
+    my_data = dict(zip([data_hash[i-1] for i in my_index], [data_chunk[i-1] for i in my_index]))
+    with open(output_file, "wb") as wf:
+        pickle.dump(my_data, wf)
+
+
+def fragments(tmp, num, peers):
+    return [(os.path.join(tmp, f"data{p}.fragment"), list(range(p + 1, num + 1, peers))) for p in range(peers)]
+
+
+def write_input(path, size):
+    # distinct random chunks, so that no two hash the same
+    block = 64 * MIB
+    with open(path, 'wb') as f:
+        for _ in range(size // block):
+            f.write(os.urandom(block))
+
+
+def mem_available():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def run(mode, input_file, tmp, peers, workers):
+    num = os.path.getsize(input_file) // make_data.BT_CHUNK_SIZE
+    if mode == "old":
+        for output_file, my_index in fragments(tmp, num, peers):
+            old_make_data(input_file, output_file, num, my_index)
+    else:
+        make_data.make_fragments(input_file, num, fragments(tmp, num, peers), workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=str, default="1", help='input sizes in GB')
+    parser.add_argument('--peers', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--mode', choices=["old", "stream"], default=None, help='run one mode in this process')
+    parser.add_argument('--input', type=str, default=None)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        stime = time.perf_counter()
+        run(args.mode, args.input, os.path.dirname(args.input), args.peers, args.workers)
+        elapsed = time.perf_counter() - stime
+        # ru_maxrss is in KiB on Linux
+        print(f"{elapsed:.2f} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+        sys.exit(0)
+
+    runs = [("old", 1, "old, once per fragment"), ("stream", 1, "streaming, 1 worker")]
+    if args.workers > 1:
+        runs.append(("stream", args.workers, f"streaming, {args.workers} workers"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            input_file = os.path.join(tmp, "input")
+            write_input(input_file, size * 1024 * MIB)
+            expected = None
+            for mode, workers, name in runs:
+                if mode == "old" and os.path.getsize(input_file) > mem_available():
+                    print(f"{size:3d} GB  {args.peers} fragments  {name:24s} skipped, the input does not fit in memory")
+                    continue
+                ret = subprocess.run([sys.executable, __file__, "--mode", mode, "--input", input_file,
+                                      "--peers", str(args.peers), "--workers", str(workers)],
+                                     capture_output=True, text=True, check=True, cwd=tmp)
+                elapsed, max_rss = ret.stdout.split()
+                with open(os.path.join(tmp, "master.chunkhash"), 'rb') as f:
+                    master = hashlib.sha1(f.read()).hexdigest()
+                assert expected is None or master == expected
+                expected = master
+                print(f"{size:3d} GB  {args.peers} fragments  {name:24s} {float(elapsed):7.2f} s  "
+                      f"{size * 1024 / float(elapsed):6.1f} MiB/s  peak RSS {int(max_rss) / 1024:8.1f} MiB")
@@ -0,0 +1,44 @@
+import sys
+import os
+import pickle
+import hashlib
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.make_data as make_data
+
+'''
+The streaming chunker: fragments made in one pass load with pickle into the same dicts the old
+read-everything make_data dumped, and master.chunkhash lists every chunk in order.
+'''
+
+
+def write_input(path, chunks):
+    # a partial chunk at the end, which is not part of any fragment
+    data = os.urandom(chunks * make_data.BT_CHUNK_SIZE + 1000)
+    path.write_bytes(data)
+    return [data[i * make_data.BT_CHUNK_SIZE:(i + 1) * make_data.BT_CHUNK_SIZE] for i in range(chunks)]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_fragments_in_one_pass(tmp_path, workers):
+    chunks = write_input(tmp_path / "input", 20)
+    hashes = [hashlib.sha1(chunk).hexdigest() for chunk in chunks]
+    fragments = [(str(tmp_path / "data1.fragment"), [3, 1, 2]), (str(tmp_path / "data2.fragment"), list(range(2, 21)))]
+    master = str(tmp_path / "master.chunkhash")
+    listed = make_data.make_fragments(str(tmp_path / "input"), 30, fragments, workers, master)
+
+    with open(master) as f:
+        assert f.read().split() == [word for i, chunk_hash in enumerate(hashes) for word in (str(i + 1), chunk_hash)]
+    for (output_file, my_index), fragment_hashes in zip(fragments, listed):
+        assert fragment_hashes == [hashes[i - 1] for i in my_index]
+        with open(output_file, "rb") as f:
+            assert pickle.load(f) == {hashes[i - 1]: chunks[i - 1] for i in my_index}
+
+
+def test_index_out_of_range(tmp_path):
+    write_input(tmp_path / "input", 4)
+    with pytest.raises(ValueError):
+        make_data.make_fragments(str(tmp_path / "input"), 4, [(str(tmp_path / "data.fragment"), [5])], 1,
+                                 str(tmp_path / "master.chunkhash"))
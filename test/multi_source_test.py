@@ -0,0 +1,71 @@
+import grader
+import time
+import pytest
+import pickle
+import hashlib
+import os
+
+'''
+This test examines multi-source downloading.
+Peer2 and peer3 both have the target chunk, peer1 runs with --multi-source and should fetch
+ranges of the same chunk from both of them and merge them into one correct chunk.
+
+This test is equivalent to run:
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data1.fragment -m 1 -i 1 --multi-source
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data2.fragment -m 1 -i 2
+python3 src/peer.py -p test/tmp1/nodes1.map -c test/tmp1/data2.fragment -m 1 -i 3
+
+In peer1:
+DOWNLOAD test/tmp1/download_target.chunkhash test/tmp1/download_result.fragment
+'''
+
+@pytest.fixture(scope='module')
+def multi_source_session():
+    success = False
+    time_max = 60
+
+    if os.path.exists("test/tmp1/download_result.fragment"):
+        os.remove("test/tmp1/download_result.fragment")
+
+    stime = time.time()
+    session = grader.GradingSession(grader.normal_handler)
+    session.add_peer(1, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data1.fragment", 1, ("127.0.0.1", 48001), timeout=None, extra_args="--multi-source")
+    session.add_peer(2, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data2.fragment", 1, ("127.0.0.1", 48002), timeout=None)
+    session.add_peer(3, "src/peer.py", "test/tmp1/nodes1.map", "test/tmp1/data2.fragment", 1, ("127.0.0.1", 48003), timeout=None)
+    session.run_grader()
+
+    session.peer_list[("127.0.0.1", 48001)].send_cmd('''DOWNLOAD test/tmp1/download_target.chunkhash test/tmp1/download_result.fragment\n''')
+
+    while True:
+        if os.path.exists("test/tmp1/download_result.fragment"):
+            success = True
+            break
+        elif time.time()-stime>time_max:
+            success = False
+            break
+
+        time.sleep(0.1)
+
+    for p in session.peer_list.values():
+        p.terminate_peer()
+
+    return session, success
+
+def test_finish(multi_source_session):
+    session, success = multi_source_session
+    assert success == True, "Fail to complete transfer or timeout"
+
+def test_both_sources(multi_source_session):
+    session, success = multi_source_session
+    downloader = session.peer_list[("127.0.0.1", 48001)]
+    for port in (48002, 48003):
+        assert downloader.send_record[("127.0.0.1", port)][2] > 0, f"No GET sent to {port}"
+        assert downloader.recv_record[("127.0.0.1", port)][3] > 0, f"No DATA received from {port}"
+
+def test_content(multi_source_session):
+    with open("test/tmp1/download_result.fragment", "rb") as download_file:
+        download_fragment = pickle.load(download_file)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+
+    assert target_hash in download_fragment, f"download hash mismatch, target: {target_hash}, has: {download_fragment.keys()}"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
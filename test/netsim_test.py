@@ -0,0 +1,78 @@
+import sys
+import os
+import socket
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.netsim as netsim
+
+'''
+Routing, timing and drop-tail queues of the Python network simulator, on virtual time.
+'''
+
+NODES = {1: ("127.0.0.1", 48001), 2: ("127.0.0.1", 48002), 3: ("127.0.0.1", 48003)}
+
+
+def spiffy_pkt(src, dst, payload_len):
+    header = netsim.SPIFFY_HEADER.pack(src, socket.inet_aton(NODES[src][0]), socket.inet_aton(NODES[dst][0]), NODES[src][1], NODES[dst][1])
+    return header + bytes(payload_len)
+
+
+class VirtualNetwork:
+    # Network driven event by event, recording (time, addr) of every delivery
+    def __init__(self, topo):
+        self.now = 0.0
+        self.delivered = []
+        self.network = netsim.Network(topo, NODES, lambda pkt, addr: self.delivered.append((self.now, addr)))
+
+    def inject(self, pkt):
+        self.network.inject(pkt, self.now)
+
+    def run_until(self, end):
+        while self.network.next_event() is not None and self.network.next_event() <= end:
+            self.now = self.network.next_event()
+            self.network.run(self.now)
+
+
+def test_fewest_hops():
+    tmp5 = os.path.join(os.path.dirname(__file__), "tmp5")
+    topo = netsim.read_topo(os.path.join(tmp5, "topo5.map"))
+    nodes = netsim.read_nodes(os.path.join(tmp5, "nodes5.map"))
+    network = netsim.Network(topo, nodes, lambda pkt, addr: None)
+    assert network.next_hop[1][2] == 2
+    assert network.next_hop[1][13] == 3
+    assert network.next_hop[13][1] == 11
+    # 7 -> 8 -> 6 -> 4 -> 3 -> 1
+    hop, path = 7, [7]
+    while hop != 1:
+        hop = network.next_hop[hop][1]
+        path.append(hop)
+    assert path == [7, 8, 6, 4, 3, 1]
+
+
+def test_delay_and_bandwidth():
+    # 1000 B at 8000 bps takes 1 s per link, plus 0.5 s of delay, over 2 links
+    sim = VirtualNetwork([(1, 2, 8000, 0.5, 10), (2, 3, 8000, 0.5, 10)])
+    sim.inject(spiffy_pkt(1, 3, 1000 - netsim.SPIFFY_HEADER.size))
+    sim.run_until(10)
+    assert sim.delivered == [(3.0, NODES[3])]
+
+
+def test_queueing_delay():
+    sim = VirtualNetwork([(1, 2, 8000, 0.0, 10)])
+    for _ in range(3):
+        sim.inject(spiffy_pkt(1, 2, 1000 - netsim.SPIFFY_HEADER.size))
+    sim.run_until(10)
+    assert [t for t, _ in sim.delivered] == [1.0, 2.0, 3.0]
+
+
+def test_drop_tail():
+    sim = VirtualNetwork([(1, 2, 8000, 0.1, 2)])
+    for _ in range(5):
+        sim.inject(spiffy_pkt(1, 2, 100))
+    sim.run_until(10)
+    assert len(sim.delivered) == 2
+    assert sim.network.dropped() == 3
+    # the queue has room again once the pkts left
+    sim.inject(spiffy_pkt(1, 2, 100))
+    sim.run_until(20)
+    assert len(sim.delivered) == 3
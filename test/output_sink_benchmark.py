@@ -0,0 +1,74 @@
+import sys
+import os
+import argparse
+import hashlib
+import pickle
+import resource
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import peer
+from receive_buffer_benchmark import bench_config
+import util.chunk_sink as chunk_sink
+
+'''
+Peak RSS and time of a --chunks chunk download through process_data, with every chunk written
+out as it completes (util/chunk_sink.py) against keeping them all in received_hash for one
+pickle.dump at the end. Each mode runs in a process of its own so that its peak is its own.
+
+python3 test/output_sink_benchmark.py --chunks 1000
+'''
+
+
+class NullSocket:
+    def sendto(self, data, addr):
+        return len(data)
+
+
+def download(chunks, output, mode):
+    sock = NullSocket()
+    addr = ("127.0.0.1", 48002)
+    peer.config = bench_config()
+    if mode == "sink":
+        peer.sink = chunk_sink.ChunkSink(output)
+    for i in range(chunks):
+        # one chunk is generated at a time, only the peer keeps them
+        data = memoryview(hashlib.sha256(i.to_bytes(4, 'big')).digest() * (peer.CHUNK_DATA_SIZE // 32))
+        peer.data_info[addr] = peer.Data_Info(peer.Chunk_Buffer(hashlib.sha1(data).hexdigest()))
+        for seq in range(1, peer.CHUNK_PKT_NUM + 1):
+            peer.process_data(sock, addr, data[(seq - 1) * peer.MAX_PAYLOAD:seq * peer.MAX_PAYLOAD], seq)
+    if mode == "sink":
+        peer.sink.finish()
+    else:
+        with open(output, "wb") as wf:
+            pickle.dump(peer.received_hash, wf)
+    assert len(peer.received_hash) == chunks
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=1000)
+    parser.add_argument('--mode', choices=["dump", "sink"], default=None, help='run one mode in this process')
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        stime = time.perf_counter()
+        download(args.chunks, args.output, args.mode)
+        elapsed = time.perf_counter() - stime
+        # ru_maxrss is in KiB on Linux
+        print(f"{elapsed:.2f} {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, name in (("dump", "pickle.dump at the end"), ("sink", "chunk sink")):
+            output = os.path.join(tmp, f"{mode}.fragment")
+            ret = subprocess.run([sys.executable, __file__, "--chunks", str(args.chunks), "--mode", mode, "--output", output],
+                                 capture_output=True, text=True, check=True)
+            elapsed, max_rss = ret.stdout.split()
+            print(f"{args.chunks} chunks  {name:24s} peak RSS {int(max_rss) / 1024:8.1f} MiB  {float(elapsed):6.2f} s  "
+                  f"output {os.path.getsize(output) / 2 ** 20:7.1f} MiB")
+            os.remove(output)
@@ -0,0 +1,80 @@
+import sys
+import os
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import congestion_benchmark
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Loss rate and goodput of paced (--pace) against back-to-back sending, on virtual time: the tmp5
+advance scenario, whose links have drop-tail queues of 15 pkts, and the two-node links of
+test/congestion_benchmark.py. Loss rate is pkts dropped by the network over pkts sent by peers.
+
+python3 test/pacing_benchmark.py --cc reno bbr
+'''
+
+TMP5 = os.path.join(os.path.dirname(__file__), "tmp5")
+PEERS = [(1, 1), (2, 2), (7, 3), (14, 4), (10, 5), (15, 6), (12, 7), (13, 8)]  # (id, fragment)
+TARGETS = [(1, 1), (7, 2), (10, 3), (13, 4)]  # (id, target)
+
+
+def count_chunks(chunkhash_file):
+    with open(chunkhash_file) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def run_tmp5(results, max_conn, options):
+    swarm = VirtualSwarm(os.path.join(TMP5, "topo5.map"), os.path.join(TMP5, "nodes5.map"))
+    for identity, fragment in PEERS:
+        swarm.add_peer(identity, os.path.join(TMP5, "fragments", f"data5-{fragment}.fragment"), max_conn, **options)
+    chunks = 0
+    for identity, target in TARGETS:
+        chunkhash_file = os.path.join(TMP5, "targets", f"target{target}.chunkhash")
+        chunks += count_chunks(chunkhash_file)
+        swarm.download(identity, chunkhash_file, os.path.join(results, f"result{target}.fragment"))
+    finish = swarm.run(until=3600)
+    return finish, chunks, swarm
+
+
+def run_link(tmp, link, options):
+    _, bps, delay, queue = link
+    topo = os.path.join(tmp, "topo.map")
+    with open(topo, "w") as f:
+        f.write(f"1 2 {bps} {delay} {queue}\n")
+    swarm = VirtualSwarm(topo, os.path.join(tmp, "nodes.map"))
+    swarm.add_peer(1, os.path.join(tmp, "seed.fragment"), 1, **options)
+    swarm.add_peer(2, os.path.join(tmp, "empty.fragment"), 1, **options)
+    chunkhash_file = os.path.join(tmp, "target.chunkhash")
+    swarm.download(2, chunkhash_file, os.path.join(tmp, "result.fragment"))
+    finish = swarm.run(until=3600)
+    return finish, count_chunks(chunkhash_file), swarm
+
+
+def report(name, finish, chunks, swarm):
+    network = swarm.network
+    status = "done" if not swarm.downloading() else "unfinished"
+    print(f"{name:36s} {finish:8.2f} s  {chunks * 512 / finish:8.1f} KiB/s  "
+          f"loss {network.dropped() / max(network.injected, 1):6.2%} ({network.dropped()}/{network.injected})  {status}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cc', nargs='+', default=["reno", "bbr"])
+    parser.add_argument('--max-conn', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--chunks', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for max_conn in args.max_conn:
+            for cc in args.cc:
+                for pace in (False, True):
+                    name = f"tmp5 -m {max_conn} {cc} {'paced' if pace else 'unpaced'}"
+                    report(name, *run_tmp5(tmp, max_conn, dict(cc=cc, pace=pace)))
+        congestion_benchmark.write_files(tmp, args.chunks)
+        for link in congestion_benchmark.LINKS:
+            for cc in args.cc:
+                for pace in (False, True):
+                    report(f"{link[0]} {cc} {'paced' if pace else 'unpaced'}", *run_link(tmp, link, dict(cc=cc, pace=pace)))
@@ -0,0 +1,82 @@
+import sys
+import os
+import argparse
+import struct
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
+
+'''
+Encode and decode ops/s of util/packet.py against the old per-pkt struct.pack(FORMAT, ...) +
+payload and struct.unpack(FORMAT, pkt[:HEADER_LEN]) + pkt[HEADER_LEN:] (reproduced below as legacy_*),
+and against packing DATA into a preallocated per-connection buffer with pack_into (SendBuffer).
+
+python3 test/packet_codec_benchmark.py --ops 1000000
+'''
+
+
+def legacy_encode_data(seq, tag, payload):
+    return struct.pack(packet.FORMAT, packet.MAGIC, packet.TEAM, 3, packet.HEADER_LEN, packet.HEADER_LEN + len(payload), seq, tag) + payload
+
+
+def legacy_decode(pkt):
+    magic, team, type_code, hlen, plen, seq, ack = struct.unpack(packet.FORMAT, pkt[:packet.HEADER_LEN])
+    return type_code, seq, ack, pkt[packet.HEADER_LEN:]
+
+
+class SendBuffer:
+    def __init__(self):
+        self.buffer = bytearray(packet.HEADER_LEN + packet.MAX_PAYLOAD)
+        self.view = memoryview(self.buffer)
+
+    def pack(self, type_code, seq, ack, payload):
+        end = packet.HEADER_LEN + len(payload)
+        packet.HEADER.pack_into(self.buffer, 0, packet.MAGIC, packet.TEAM, type_code, packet.HEADER_LEN, end, seq, ack)
+        self.view[packet.HEADER_LEN:end] = payload
+        return self.view[:end]
+
+
+def timed(ops, fn):
+    stime = time.perf_counter()
+    fn()
+    return ops / (time.perf_counter() - stime)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=1000000)
+    args = parser.parse_args()
+
+    chunk = memoryview(bytes(range(256)) * 2048)  # 512 KiB, the payload is a view into it as in send_data
+    payloads = [chunk[(i % 512) * 1024:(i % 512 + 1) * 1024] for i in range(512)]
+    send_buffer = SendBuffer()
+    pkt = legacy_encode_data(7, 0x12345678, payloads[0])
+
+    def legacy_encode():
+        for i in range(args.ops):
+            legacy_encode_data(i, 0x12345678, payloads[i & 511])
+
+    def codec_encode():
+        encode = packet.encode
+        for i in range(args.ops):
+            encode(3, payloads[i & 511], i, 0x12345678)
+
+    def buffer_encode():
+        pack = send_buffer.pack
+        for i in range(args.ops):
+            pack(3, i, 0x12345678, payloads[i & 511])
+
+    def legacy_decode_all():
+        for _ in range(args.ops):
+            legacy_decode(pkt)
+
+    def codec_decode():
+        parse = packet.parse
+        for _ in range(args.ops):
+            parse(pkt)
+
+    for name, fn in (("encode DATA legacy", legacy_encode), ("encode DATA encode", codec_encode),
+                     ("encode DATA SendBuffer", buffer_encode),
+                     ("decode legacy", legacy_decode_all), ("decode parse", codec_decode)):
+        print(f"{name:22s} {timed(args.ops, fn) / 1e6:6.2f} M ops/s")
@@ -0,0 +1,55 @@
+import sys
+import os
+import struct
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
+
+'''
+Encoding and parsing of peer pkts.
+'''
+
+
+def test_round_trip():
+    pkt = packet.encode(packet.DATA, b"payload", seq=7, ack=0x12345678)
+    assert pkt[:packet.HEADER_LEN] == struct.pack("!HBBHHII", 52305, 15, 3, 16, 23, 7, 0x12345678)
+    type_code, seq, ack, data = packet.parse(pkt)
+    assert (type_code, seq, ack, bytes(data)) == (packet.DATA, 7, 0x12345678, b"payload")
+
+
+def test_payload_is_a_view():
+    pkt = bytearray(packet.encode(packet.IHAVE, b"abc"))
+    data = packet.parse(pkt)[3]
+    pkt[-1:] = b"z"
+    assert bytes(data) == b"abz"
+
+
+def test_longer_header_skipped():
+    # a header that declares 4 extra bytes: the payload starts after them
+    pkt = struct.pack("!HBBHHII", 52305, 15, 4, 20, 23, 1, 2) + b"\x00\x00\x00\x09" + b"xyz"
+    type_code, seq, ack, data = packet.parse(pkt)
+    assert (type_code, seq, ack, bytes(data)) == (packet.ACK, 1, 2, b"xyz")
+
+
+def test_rejected():
+    assert packet.parse(b"short") is None
+    assert packet.parse(struct.pack("!HBBHHII", 1234, 15, 0, 16, 16, 0, 0)) is None
+    assert packet.parse(struct.pack("!HBBHHII", 52305, 15, 0, 8, 16, 0, 0)) is None
+    assert packet.parse(struct.pack("!HBBHHII", 52305, 15, 0, 40, 40, 0, 0)) is None
+
+
+def test_sack_blocks():
+    payload = packet.encode_sack([(3, 5), (9, 9)])
+    assert payload == struct.pack("!IIII", 3, 5, 9, 9)
+    pkt = packet.encode(packet.ACK, payload, seq=9, ack=1)
+    assert packet.parse_sack(packet.parse(pkt)[3]) == [(3, 5), (9, 9)]
+    assert packet.parse_sack(b"") == []
+    assert len(packet.encode_sack([(i, i) for i in range(1, 100, 2)])) == packet.MAX_SACK_BLOCKS * packet.SACK_BLOCK.size
+
+
+def test_timestamps():
+    pkt = packet.encode(packet.ACK, b"xy", seq=3, ack=2, stamp=(10, 7, 1))
+    assert pkt[:packet.HEADER_LEN] == struct.pack("!HBBHHII", 52305, 15, 4, 28, 30, 3, 2)
+    assert packet.parse_stamp(pkt) == (10, 7, 1)
+    assert bytes(packet.parse(pkt)[3]) == b"xy"
+    assert packet.parse_stamp(packet.encode(packet.ACK, b"xy")) is None
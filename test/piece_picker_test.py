@@ -0,0 +1,58 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from util.piece_picker import PiecePicker
+
+'''
+Rarest-first selection of the availability index.
+'''
+
+A = ("127.0.0.1", 48001)
+B = ("127.0.0.1", 48002)
+C = ("127.0.0.1", 48003)
+
+
+def make_picker():
+    picker = PiecePicker()
+    for chunk_hash, holders in (("h1", (A, B, C)), ("h2", (A, B)), ("h3", (A,))):
+        picker.want(chunk_hash)
+        for addr in holders:
+            picker.add_holder(chunk_hash, addr)
+    return picker
+
+
+def test_rarest_first():
+    picker = make_picker()
+    assert picker.pick(A) == "h3"
+    assert picker.pick(B) == "h2"
+    assert picker.pick(C) == "h1"
+    picker.unwant("h3")
+    assert picker.pick(A) == "h2"
+    picker.unwant("h2")
+    assert picker.pick(A) == "h1"
+    assert picker.pick(B) == "h1"
+    picker.unwant("h1")
+    assert picker.pick(A) is None
+
+
+def test_replica_count_changes():
+    picker = make_picker()
+    picker.add_holder("h3", B)
+    picker.add_holder("h3", C)
+    # h2 is now the only hash with two holders
+    assert picker.pick(A) == "h2"
+    picker.remove_peer(A)
+    assert picker.replicas("h1") == 2
+    assert picker.pick(A) is None
+    assert picker.pick(C) in ("h1", "h3")
+    picker.want("h4")
+    assert picker.pick(C) in ("h1", "h3")
+
+
+def test_rewant():
+    picker = make_picker()
+    picker.unwant("h3")
+    assert picker.pick(A) == "h2"
+    picker.want("h3")
+    assert picker.pick(A) == "h3"
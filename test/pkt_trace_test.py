@@ -0,0 +1,62 @@
+import sys
+import os
+import struct
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.pkt_trace as pkt_trace
+import util.simsocket as simsocket
+
+'''
+The binary pkt trace and the --pkt-log modes of SimSocket.
+'''
+
+
+def test_ring_wraps(tmp_path):
+    path = str(tmp_path / "peer.trace")
+    trace = pkt_trace.PktTrace(path, records_per_half=4)
+    # both halves fill more than once, and a partial half is left for close()
+    for seq in range(1, 20):
+        trace.record(pkt_trace.SENT if seq % 2 else pkt_trace.RECEIVED, 3, seq, seq - 1, 1040, ("127.0.0.1", 48002))
+    trace.close()
+    records = list(pkt_trace.read_trace(path))
+    assert [r[3] for r in records] == list(range(1, 20))
+    assert records[0][1:] == (pkt_trace.SENT, 3, 1, 0, 1040, ("127.0.0.1", 48002))
+    assert records[1][1] == pkt_trace.RECEIVED
+    assert all(a[0] <= b[0] for a, b in zip(records, records[1:]))
+
+
+def exchange(tmp_path, monkeypatch, pkt_log, identity):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SIMULATOR", raising=False)
+    sender = simsocket.SimSocket(identity, ("127.0.0.1", 49101), verbose=0, pkt_log=pkt_log)
+    receiver = simsocket.SimSocket(identity + 1, ("127.0.0.1", 49102), verbose=0, pkt_log=pkt_log)
+    pkt = struct.pack("!HBBHHII", 52305, 15, 3, 16, 20, 7, 0) + b"data"
+    assert sender.sendto(pkt, ("127.0.0.1", 49102)) == len(pkt)
+    assert receiver.recvfrom(1400) == (pkt, ("127.0.0.1", 49101))
+    sender.close()
+    receiver.close()
+    with open(tmp_path / "log" / f"peer{identity}.log") as f:
+        return f.read()
+
+
+def test_text_log(tmp_path, monkeypatch):
+    log = exchange(tmp_path, monkeypatch, simsocket.PKT_LOG_TEXT, 101)
+    assert "Start logging" in log
+    assert "sending a type3 pkt to ('127.0.0.1', 49102) via normal socket, seq7, ack0, pkt_len20" in log
+
+
+def test_trace(tmp_path, monkeypatch):
+    log = exchange(tmp_path, monkeypatch, simsocket.PKT_LOG_TRACE, 103)
+    assert "Start logging" in log
+    assert "sending" not in log
+    sent = list(pkt_trace.read_trace(str(tmp_path / "log" / "peer103.trace")))
+    received = list(pkt_trace.read_trace(str(tmp_path / "log" / "peer104.trace")))
+    assert [r[1:] for r in sent] == [(pkt_trace.SENT, 3, 7, 0, 20, ("127.0.0.1", 49102))]
+    assert [r[1:] for r in received] == [(pkt_trace.RECEIVED, 3, 7, 0, 20, ("127.0.0.1", 49101))]
+
+
+def test_off(tmp_path, monkeypatch):
+    log = exchange(tmp_path, monkeypatch, simsocket.PKT_LOG_OFF, 105)
+    assert "Start logging" in log
+    assert "sending" not in log and "Receiving" not in log
+    assert not os.path.exists(tmp_path / "log" / "peer105.trace")
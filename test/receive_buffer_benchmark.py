@@ -0,0 +1,125 @@
+import sys
+import os
+import argparse
+import hashlib
+import pickle
+import random
+import struct
+import tempfile
+import time
+from typing import Dict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import peer
+import util.bt_utils as bt_utils
+
+'''
+Per-packet receive cost of process_data with the preallocated buffer, against the old
+bytes += reassembly (reproduced below as legacy_process_data).
+
+python3 test/receive_buffer_benchmark.py
+'''
+
+
+class NullSocket:
+    def sendto(self, data, addr):
+        return len(data)
+
+
+def bench_config(peers=(("1", "127.0.0.1", "48001"),), **options):
+    # the BtConfig of peer 1 holding no chunks, every flag not in options at its default as on the command line
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_map = os.path.join(tmp, "nodes.map")
+        with open(nodes_map, "w") as f:
+            f.writelines(" ".join(p) + "\n" for p in peers)
+        fragment = os.path.join(tmp, "empty.fragment")
+        with open(fragment, "wb") as f:
+            pickle.dump(dict(), f)
+        return bt_utils.BtConfig(argparse.Namespace(p=nodes_map, c=fragment, m=1, i=1, v=0, t=None, **options))
+
+
+class LegacyDataInfo:
+    def __init__(self, chunk_hash):
+        self.received_chunk = b''
+        self.buffer: Dict[int, bytes] = dict()
+        self.ack = 0
+        self.received_pkt = set()
+        self.downloading_chunk_hash = chunk_hash
+        self.last_receive_time = None
+
+
+def legacy_process_data(sock, addr, data, seq):
+    record = peer.data_info.get(addr)
+    if record is None:
+        return
+    record.last_receive_time = time.time()
+    if seq not in record.received_pkt:
+        record.buffer[seq] = data
+        record.received_pkt.add(seq)
+        while record.ack + 1 in record.received_pkt:
+            record.ack += 1
+            record.received_chunk += record.buffer[record.ack]
+            del record.buffer[record.ack]
+        pkt = struct.pack(peer.FORMAT, peer.MAGIC, peer.TEAM, 4, peer.HEADER_LEN, peer.HEADER_LEN, seq, record.ack)
+        if len(record.received_chunk) == peer.CHUNK_DATA_SIZE:
+            sha1 = hashlib.sha1()
+            sha1.update(record.received_chunk)
+            if sha1.hexdigest() == record.downloading_chunk_hash:
+                peer.config.haschunks[record.downloading_chunk_hash] = record.received_chunk
+                peer.received_hash[record.downloading_chunk_hash] = record.received_chunk
+            else:
+                peer.picker.want(record.downloading_chunk_hash)
+            del peer.data_info[addr]
+    else:
+        pkt = struct.pack(peer.FORMAT, peer.MAGIC, peer.TEAM, 4, peer.HEADER_LEN, peer.HEADER_LEN, seq, record.ack)
+    sock.sendto(pkt, addr)
+
+
+def make_chunk(i):
+    data = hashlib.sha256(i.to_bytes(4, 'big')).digest() * (peer.CHUNK_DATA_SIZE // 32)
+    packets = [data[(seq - 1) * peer.MAX_PAYLOAD: seq * peer.MAX_PAYLOAD] for seq in range(1, peer.CHUNK_PKT_NUM + 1)]
+    return hashlib.sha1(data).hexdigest(), packets
+
+
+def new_data_info(chunk_hash):
+    return peer.Data_Info(peer.Chunk_Buffer(chunk_hash))
+
+
+def run(chunks, new_record, handler, reorder):
+    sock = NullSocket()
+    addr = ("127.0.0.1", 48002)
+    peer.config = bench_config()
+    peer.received_hash.clear()
+    rng = random.Random(305)
+    elapsed = 0
+    pkt_num = 0
+    for chunk_hash, packets in chunks:
+        order = list(range(1, len(packets) + 1))
+        if reorder:
+            # swap neighbours so that the out-of-order path is exercised as well
+            for i in range(0, len(order) - 1, 2):
+                if rng.random() < reorder:
+                    order[i], order[i + 1] = order[i + 1], order[i]
+        peer.data_info[addr] = new_record(chunk_hash)
+        stime = time.perf_counter()
+        for seq in order:
+            handler(sock, addr, packets[seq - 1], seq)
+        elapsed += time.perf_counter() - stime
+        pkt_num += len(order)
+        assert chunk_hash in peer.received_hash
+    return elapsed, pkt_num
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=100, help='chunks in the multi-chunk download')
+    parser.add_argument('--reorder', type=float, default=0.1, help='probability of swapping two neighbouring packets')
+    args = parser.parse_args()
+
+    one = [make_chunk(0)]
+    many = [make_chunk(i) for i in range(args.chunks)]
+    for name, chunks in (("1 chunk", one), (f"{args.chunks} chunks", many)):
+        for impl, new_record, handler in (("legacy bytes +=", LegacyDataInfo, legacy_process_data),
+                                          ("preallocated", new_data_info, peer.process_data)):
+            elapsed, pkt_num = run(chunks, new_record, handler, args.reorder)
+            print(f"{name:11s} {impl:16s} {elapsed * 1000:9.1f} ms total  {elapsed / pkt_num * 1e6:7.2f} us/pkt")
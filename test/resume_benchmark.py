@@ -0,0 +1,81 @@
+import sys
+import os
+import argparse
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import congestion_benchmark
+import util.chunk_sink as chunk_sink
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Cost of restarting a downloader that crashed mid-transfer, on a two-node link of
+test/congestion_benchmark.py and virtual time: DATA pkts sent again and time to finish after the
+restart, with the partial chunk files kept against deleting them, i.e. with only the journal of
+completed chunks, which refetches the chunk in progress from its first pkt.
+
+python3 test/resume_benchmark.py --chunks 8 --link wan
+'''
+
+
+def swarm(tmp, link, output):
+    _, bps, delay, queue = link
+    topo = os.path.join(tmp, "topo.map")
+    with open(topo, "w") as f:
+        f.write(f"1 2 {bps} {delay} {queue}\n")
+    swarm = VirtualSwarm(topo, os.path.join(tmp, "nodes.map"))
+    swarm.add_peer(1, os.path.join(tmp, "seed.fragment"), 1)
+    swarm.add_peer(2, os.path.join(tmp, "empty.fragment"), 1)
+    swarm.download(2, os.path.join(tmp, "target.chunkhash"), output)
+    return swarm
+
+
+def received_pkts(module):
+    in_progress = {record.chunk for record in module.data_info.values()}
+    return len(module.received_hash) * module.CHUNK_PKT_NUM + sum(bytes(chunk.received_map).count(1) for chunk in in_progress)
+
+
+def restart(tmp, link, chunks, crash_at, keep_partial):
+    output = os.path.join(tmp, "result.fragment")
+    first = swarm(tmp, link, output)
+    downloader = first.peers[2].module
+    total = chunks * downloader.CHUNK_PKT_NUM
+    first.run(until=3600, stop=lambda: received_pkts(downloader) >= crash_at * total)
+    first.crash(2)
+    missing = total - received_pkts(downloader)
+    if not keep_partial:
+        shutil.rmtree(output + chunk_sink.PARTIAL_SUFFIX)
+
+    second = swarm(tmp, link, output)
+    sock = second.peers[1].sock
+    sendto = sock.sendto
+    sent = [0]
+
+    def counting_sendto(data, address):
+        if packet.parse(data)[0] == packet.DATA:
+            sent[0] += 1
+        return sendto(data, address)
+    sock.sendto = counting_sendto
+    finish = second.run(until=3600)
+    assert not second.downloading()
+    os.remove(output)
+    return sent[0], missing, finish
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=8)
+    parser.add_argument('--link', choices=[link[0].split()[0] for link in congestion_benchmark.LINKS], default="wan")
+    args = parser.parse_args()
+
+    link = next(link for link in congestion_benchmark.LINKS if link[0].startswith(args.link))
+    with tempfile.TemporaryDirectory() as tmp:
+        congestion_benchmark.write_files(tmp, args.chunks)
+        for crash_at in (0.1, 0.45, 0.8):
+            for keep_partial, name in ((False, "journal only"), (True, "partial chunks")):
+                sent, missing, finish = restart(tmp, link, args.chunks, crash_at, keep_partial)
+                print(f"{link[0]}  crash at {crash_at:4.0%}  {name:15s} DATA sent after restart {sent:5d} "
+                      f"(missing {missing:5d})  finished {finish:6.2f} s after restart")
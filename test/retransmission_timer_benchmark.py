@@ -0,0 +1,77 @@
+import sys
+import os
+import argparse
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from util.timer_queue import TimerQueue
+
+'''
+Per-iteration timer overhead of the peer event loop with many uploads in flight: the old
+timeout_retransmission scan over every in-flight seq (reproduced below as legacy_scan) against
+the timer queue, where one iteration handles one ACK, i.e. one DATA sent and one stale timer popped.
+
+python3 test/retransmission_timer_benchmark.py --uploads 100 --window 64
+'''
+
+
+class Record:
+    def __init__(self, window):
+        self.ack = 0
+        self.sending_time = {seq: time.time() for seq in range(1, window + 1)}
+        self.ack_packet = set()
+
+
+def legacy_scan(records, timeout_interval):
+    # the old per-tick scan, minus the retransmission itself since nothing is due
+    for addr in records:
+        record = records[addr]
+        for seq in list(record.sending_time.keys()):
+            if seq in record.ack_packet or seq <= record.ack:
+                del record.sending_time[seq]
+            elif time.time() - record.sending_time[seq] > timeout_interval:
+                pass
+
+
+def on_timer(record, seq):
+    pass
+
+
+def run_legacy(uploads, window, iterations):
+    records = {i: Record(window) for i in range(uploads)}
+    stime = time.perf_counter()
+    for _ in range(iterations):
+        legacy_scan(records, 10)
+    return (time.perf_counter() - stime) / iterations
+
+
+def run_timers(uploads, window, iterations):
+    timers = TimerQueue()
+    now = time.time()
+    records = [Record(window) for _ in range(uploads)]
+    for record in records:
+        for seq in record.sending_time:
+            timers.schedule(now + 10 + seq * 1e-6, on_timer, record, seq)
+    stime = time.perf_counter()
+    for i in range(iterations):
+        # one DATA sent per ACK, and the timer of an acked seq expires
+        record = records[i % uploads]
+        timers.schedule(time.time() + 10, on_timer, record, i)
+        deadline = timers.next_deadline()
+        max(deadline - time.time(), 0)
+        timers.run(deadline)
+    return (time.perf_counter() - stime) / iterations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uploads', type=int, default=100, help='concurrent uploads (ack_records)')
+    parser.add_argument('--window', type=int, default=64, help='in-flight DATA pkts per upload')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    legacy = run_legacy(args.uploads, args.window, args.iterations)
+    timer = run_timers(args.uploads, args.window, args.iterations * 100)
+    print(f"{args.uploads} uploads x {args.window} in flight")
+    print(f"scan every tick {legacy * 1e6:10.1f} us/iteration")
+    print(f"timer queue     {timer * 1e6:10.1f} us/iteration")
@@ -0,0 +1,83 @@
+import sys
+import os
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import congestion_benchmark
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+What timestamp echo (--timestamps) changes for the timers, on the two-node links of
+test/congestion_benchmark.py and virtual time:
+  first loss  the first DATA pkt of the upload is lost, time until the download completes. Without
+              timestamps the sender has no RTT sample yet and waits DEFAULT_TIMEOUT.
+  crash       the sender dies a quarter into the upload, time until the downloader gives up on it.
+  rto         the sender's and the downloader's RTO for each other at the end of the upload.
+
+python3 test/rtt_benchmark.py --chunks 1
+'''
+
+
+def two_node_swarm(tmp, link, **options):
+    _, bps, delay, queue = link
+    topo = os.path.join(tmp, "topo.map")
+    with open(topo, "w") as f:
+        f.write(f"1 2 {bps} {delay} {queue}\n")
+    swarm = VirtualSwarm(topo, os.path.join(tmp, "nodes.map"))
+    swarm.add_peer(1, os.path.join(tmp, "seed.fragment"), 1, **options)
+    swarm.add_peer(2, os.path.join(tmp, "empty.fragment"), 1, **options)
+    return swarm
+
+
+def drop_first_data(swarm, identity):
+    # the first DATA pkt identity sends is lost
+    sock = swarm.peers[identity].sock
+    sendto = sock.sendto
+    dropped = []
+
+    def lossy_sendto(data, address):
+        if len(dropped) == 0 and packet.parse(data)[0] == packet.DATA:
+            dropped.append(data)
+            return len(data)
+        return sendto(data, address)
+    sock.sendto = lossy_sendto
+
+
+def first_loss(tmp, link, **options):
+    swarm = two_node_swarm(tmp, link, **options)
+    drop_first_data(swarm, 1)
+    swarm.download(2, os.path.join(tmp, "target.chunkhash"), os.path.join(tmp, "result.fragment"))
+    finish = swarm.run(until=3600)
+    seeder, downloader = swarm.peers[1].module, swarm.peers[2].module
+    rtos = (seeder.get_timeout(("127.0.0.1", 48002)), downloader.get_timeout(("127.0.0.1", 48001)))
+    return finish, rtos
+
+
+def crash(tmp, link, **options):
+    swarm = two_node_swarm(tmp, link, **options)
+    swarm.download(2, os.path.join(tmp, "target.chunkhash"), os.path.join(tmp, "result.fragment"))
+    downloader = swarm.peers[2].module
+    swarm.run(until=3600, stop=lambda: any(record.ack >= downloader.CHUNK_PKT_NUM // 4 for record in downloader.data_info.values()))
+    swarm.crash(1)
+    crashed = swarm.now
+    swarm.run(until=crashed + 3600, stop=lambda: len(downloader.data_info) == 0)
+    return swarm.now - crashed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunks', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        congestion_benchmark.write_files(tmp, args.chunks)
+        for link in congestion_benchmark.LINKS:
+            for timestamps in (False, True):
+                name = f"{link[0]} {'timestamps' if timestamps else 'plain'}"
+                finish, (sender_rto, receiver_rto) = first_loss(tmp, link, timestamps=timestamps)
+                detect = crash(tmp, link, timestamps=timestamps)
+                print(f"{name:32s} first loss {finish:7.2f} s   crash {detect:6.2f} s   "
+                      f"rto sender {sender_rto:6.3f} s receiver {receiver_rto:6.3f} s")
@@ -0,0 +1,80 @@
+import os
+import argparse
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+'''
+Datagram throughput of the select loop against the asyncio runtime (--asyncio).
+
+A peer holding test/tmp1/data2.fragment is started without the simulator, then a client keeps
+--window WHOHAS pkts outstanding and counts the IHAVE replies, so the rate is bounded by how
+fast the peer's loop turns pkts around.
+
+python3 test/runtime_benchmark.py --pkts 20000 --window 32
+'''
+
+FORMAT = '!HBBHHII'
+HEADER_LEN = struct.calcsize(FORMAT)
+CHUNK_HASH = bytes.fromhex("3b68110847941b84e8d05417a5b2609122a56314")
+PEER_PORT = 48101
+CLIENT_PORT = 48102
+
+
+def run(root, nodes_map, extra_args, pkts, window):
+    cmd = [sys.executable, os.path.join(root, "src/peer.py"), "-p", nodes_map, "-c", os.path.join(root, "test/tmp1/data2.fragment"),
+           "-m", "1", "-i", "1"] + extra_args
+    env = dict(os.environ)
+    env.pop("SIMULATOR", None)
+    peer = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, env=env, cwd=tempfile.gettempdir())
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", CLIENT_PORT))
+    client.settimeout(0.2)
+    whohas = struct.pack(FORMAT, 52305, 15, 0, HEADER_LEN, HEADER_LEN + len(CHUNK_HASH), 0, 0) + CHUNK_HASH
+    peer_addr = ("127.0.0.1", PEER_PORT)
+    try:
+        # wait for the peer to answer at all
+        while True:
+            client.sendto(whohas, peer_addr)
+            try:
+                client.recvfrom(2048)
+                break
+            except socket.timeout:
+                continue
+        sent = received = 0
+        stime = time.perf_counter()
+        while received < pkts:
+            while sent - received < window and sent < pkts:
+                client.sendto(whohas, peer_addr)
+                sent += 1
+            try:
+                client.recvfrom(2048)
+                received += 1
+            except socket.timeout:
+                # a pkt was lost, refill the window
+                sent = received
+        elapsed = time.perf_counter() - stime
+    finally:
+        peer.terminate()
+        peer.wait()
+        client.close()
+    return pkts / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pkts', type=int, default=20000)
+    parser.add_argument('--window', type=int, default=32, help='WHOHAS pkts kept outstanding')
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_map = os.path.join(tmp, "nodes.map")
+        with open(nodes_map, 'w') as f:
+            f.write(f"1 127.0.0.1 {PEER_PORT}\n2 127.0.0.1 {CLIENT_PORT}\n")
+        for name, extra_args in (("select loop", []), ("asyncio", ["--asyncio"])):
+            rate = run(root, nodes_map, extra_args, args.pkts, args.window)
+            print(f"{name:12s} {rate:9.0f} pkts/s")
@@ -0,0 +1,107 @@
+import os
+import sys
+import time
+import queue
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(__file__))
+import grader
+
+'''
+Loss recovery with and without SACK (--sack on the downloader) in the tmp2 drop scenario, under the
+single loss of grader.drop_handler and under bursts and scattered losses in the same place.
+Recovery time is from the first dropped DATA pkt until the cumulative ACK covers every dropped seq.
+
+python3 test/sack_benchmark.py --runs 3
+'''
+
+DATA = 3
+ACK = 4
+TIME_MAX = 120
+PATTERNS = [
+    # DATA pkts are counted as grader.drop_handler does, it drops #150
+    ("drop_handler", {150}),
+    ("burst 4", set(range(150, 154))),
+    ("burst 16", set(range(150, 166))),
+    ("every 8th x10", set(range(150, 230, 8))),
+    ("random 2%", set(random.Random(305).sample(range(100, 512), 8))),
+]
+
+
+def pattern_handler(drops, events, stop):
+    def handler(recv_queue, send_queue):
+        cnt = 0
+        while not stop.is_set():
+            try:
+                pkt = recv_queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            if pkt.pkt_type == DATA:
+                cnt += 1
+                if cnt in drops:
+                    events.append((time.time(), DATA, pkt.seq))
+                    continue
+            elif pkt.pkt_type == ACK:
+                events.append((time.time(), ACK, pkt.ack))
+            send_queue.put(pkt)
+    return handler
+
+
+def run_once(drops, extra_args, results):
+    events = []
+    stop = threading.Event()
+    session = grader.GradingSession(pattern_handler(drops, events, stop), latency=0.01)
+    session.add_peer(1, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48001), extra_args=extra_args)
+    session.add_peer(2, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data2.fragment", 1, ("127.0.0.1", 48002))
+    session.run_grader()
+    output = os.path.join(results, "result.fragment")
+    if os.path.exists(output):
+        os.remove(output)
+    stime = time.time()
+    session.peer_list[("127.0.0.1", 48001)].send_cmd(f"DOWNLOAD test/tmp2/download_target.chunkhash {output}\n")
+    finish = None
+    while time.time() - stime < TIME_MAX:
+        if os.path.exists(output):
+            finish = time.time() - stime
+            break
+        time.sleep(0.01)
+    for p in session.peer_list.values():
+        p.terminate_peer()
+    stop.set()
+    session.stop_grader()
+
+    dropped = [(t, seq) for t, kind, seq in events if kind == DATA]
+    recovery = None
+    if dropped:
+        last_seq = max(seq for _, seq in dropped)
+        covered = [t for t, kind, ack in events if kind == ACK and ack >= last_seq and t > dropped[0][0]]
+        if covered:
+            recovery = covered[0] - dropped[0][0]
+    data_sent = session.peer_list[("127.0.0.1", 48002)].send_record.get(("127.0.0.1", 48001), dict()).get(DATA, 0)
+    return finish, recovery, data_sent
+
+
+def median(values):
+    values = sorted(v for v in values if v is not None)
+    return values[len(values) // 2] if values else None
+
+
+def fmt(value):
+    return "   -   " if value is None else f"{value:7.3f}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as results:
+        for name, drops in PATTERNS:
+            for label, extra_args in (("ack", ""), ("sack", "--sack")):
+                runs = [run_once(drops, extra_args, results) for _ in range(args.runs)]
+                print(f"{name:14s} {label:4s} completion {fmt(median(r[0] for r in runs))} s  "
+                      f"recovery {fmt(median(r[1] for r in runs))} s  DATA sent {median(r[2] for r in runs)}  "
+                      f"{sum(r[0] is not None for r in runs)}/{len(runs)} done")
@@ -0,0 +1,80 @@
+import grader
+import time
+import queue
+import pytest
+import pickle
+import hashlib
+import os
+import threading
+
+'''
+This test runs the RDT scenario of basic_transfer_test with the downloader sending SACK blocks,
+and drops a burst of 16 DATA pkts from #150 on. With the -t 60 of the grader only SACK recovers
+all of them without waiting for a timeout, and each lost pkt is sent again exactly once.
+
+This test is equivalent to run (except for packet loss):
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data1.fragment -m 1 -i 1 -t 60 --sack
+python3 src/peer.py -p test/tmp2/nodes2.map -c test/tmp2/data2.fragment -m 1 -i 2 -t 60
+
+In peer1:
+DOWNLOAD test/tmp2/download_target.chunkhash <result>
+'''
+
+DROPS = set(range(150, 166))
+
+
+def burst_drop_handler(stop):
+    def handler(recv_queue, send_queue):
+        cnt = 0
+        while not stop.is_set():
+            try:
+                pkt = recv_queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            if pkt.pkt_type == 3:
+                cnt += 1
+                if cnt in DROPS:
+                    continue
+            send_queue.put(pkt)
+    return handler
+
+
+@pytest.fixture(scope='module')
+def sack_session(tmp_path_factory):
+    time_max = 30
+    output = str(tmp_path_factory.mktemp("sack") / "download_result.fragment")
+    stop = threading.Event()
+    session = grader.GradingSession(burst_drop_handler(stop), latency=0.01)
+    session.add_peer(1, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48001), extra_args="--sack")
+    session.add_peer(2, "src/peer.py", "test/tmp2/nodes2.map", "test/tmp2/data2.fragment", 1, ("127.0.0.1", 48002))
+    session.run_grader()
+
+    stime = time.time()
+    session.peer_list[("127.0.0.1", 48001)].send_cmd(f"DOWNLOAD test/tmp2/download_target.chunkhash {output}\n")
+    success = False
+    while time.time() - stime < time_max:
+        if os.path.exists(output):
+            success = True
+            break
+        time.sleep(0.1)
+
+    for p in session.peer_list.values():
+        p.terminate_peer()
+    stop.set()
+    session.stop_grader()
+    return session, success, output
+
+
+def test_finish(sack_session):
+    session, success, output = sack_session
+    assert success == True, "Fail to complete transfer or timeout"
+    with open(output, "rb") as download_file:
+        download_fragment = pickle.load(download_file)
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+    assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
+
+
+def test_one_retransmission_per_loss(sack_session):
+    session, success, output = sack_session
+    sender = session.peer_list[("127.0.0.1", 48002)]
+    assert sender.send_record[("127.0.0.1", 48001)][3] == 512 + len(DROPS)
@@ -0,0 +1,134 @@
+import sys
+import os
+import argparse
+import hashlib
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+import peer
+import util.chunk_store as chunk_store
+import util.packet as packet
+
+'''
+Aggregate upload throughput of one seeder (src/peer.py --shards N, chunk data in an mmap'ed chunk
+store) to --clients receivers on localhost, without the network simulator, for every N in
+--shards. Each receiver is a process that GETs chunks back to back for --seconds and ACKs every
+DATA pkt, the throughput is the chunks they completed, and the CPU seconds each shard used show how
+the uploads were spread. Scaling needs at least N free cores for the seeder besides the ones the
+receivers keep busy.
+
+python3 test/sharded_seeder_benchmark.py --shards 1,2,4 --clients 8 --seconds 5
+'''
+
+SEEDER_PORT = 48001
+CLIENT_PORT = 48100
+GET_RETRY = 1
+
+
+def make_store(path, chunk_num):
+    chunks = []
+    for i in range(chunk_num):
+        data = hashlib.sha256(i.to_bytes(4, 'big')).digest() * (peer.CHUNK_DATA_SIZE // 32)
+        chunks.append((hashlib.sha1(data).hexdigest(), data))
+    chunk_store.write_store(chunks, path)
+    return [chunk_hash for chunk_hash, _ in chunks]
+
+
+def receive(port, hashes, seconds):
+    # chunks completed in the time given, the pkts are only counted, not kept
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 2 ** 20)
+    sock.bind(("127.0.0.1", port))
+    sock.settimeout(GET_RETRY)
+    seeder = ("127.0.0.1", SEEDER_PORT)
+    done = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        chunk_hash = hashes[(port + done) % len(hashes)]
+        tag = peer.chunk_tag(chunk_hash)
+        received = bytearray(peer.CHUNK_PKT_NUM)
+        ack = 0
+        sock.sendto(packet.encode(packet.GET, bytes.fromhex(chunk_hash)), seeder)
+        while ack < peer.CHUNK_PKT_NUM and time.time() < deadline:
+            try:
+                pkt, _ = sock.recvfrom(peer.BUF_SIZE)
+            except socket.timeout:
+                if ack == 0:
+                    sock.sendto(packet.encode(packet.GET, bytes.fromhex(chunk_hash)), seeder)
+                continue
+            type_code, seq, pkt_tag, _ = packet.parse(pkt)
+            if type_code != packet.DATA or pkt_tag != tag or not 1 <= seq <= peer.CHUNK_PKT_NUM:
+                continue
+            received[seq - 1] = 1
+            while ack < peer.CHUNK_PKT_NUM and received[ack]:
+                ack += 1
+            sock.sendto(packet.encode(packet.ACK, seq=seq, ack=ack), seeder)
+        if ack == peer.CHUNK_PKT_NUM:
+            done += 1
+    sock.close()
+    return done
+
+
+def run(tmp, store, hashes, shards, clients, seconds):
+    env = dict(os.environ)
+    env.pop("SIMULATOR", None)
+    seeder = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "peer.py"),
+                               "-p", os.path.join(tmp, "nodes.map"), "-c", store, "-m", str(clients), "-i", "1",
+                               "--shards", str(shards), "--pkt-log", "off"],
+                              cwd=tmp, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              start_new_session=True)
+    time.sleep(1)
+    receivers = [subprocess.Popen([sys.executable, __file__, "--receive", str(CLIENT_PORT + i), "--store", store,
+                                   "--seconds", str(seconds)], stdout=subprocess.PIPE, text=True)
+                 for i in range(clients)]
+    done = sum(int(receiver.communicate()[0]) for receiver in receivers)
+    cpu = shard_cpu(seeder.pid)
+    # as Ctrl-C would
+    os.killpg(seeder.pid, signal.SIGINT)
+    seeder.wait()
+    return done, cpu
+
+
+def shard_cpu(pid):
+    # user + system CPU seconds of every child of pid, i.e. of each shard with --shards, or of pid without
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        children = [int(child) for child in f.read().split()] or [pid]
+    cpu = []
+    for child in children:
+        with open(f"/proc/{child}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu.append((int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"))
+    return cpu
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=str, default="1,2,4")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--chunks', type=int, default=16)
+    parser.add_argument('--receive', type=int, default=None, help='run one receiver on this port')
+    parser.add_argument('--store', type=str, default=None)
+    args = parser.parse_args()
+
+    if args.receive is not None:
+        print(receive(args.receive, list(chunk_store.ChunkStore(args.store).keys()), args.seconds))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "nodes.map"), 'w') as f:
+            f.write(f"1 127.0.0.1 {SEEDER_PORT}\n")
+            f.writelines(f"{i + 2} 127.0.0.1 {CLIENT_PORT + i}\n" for i in range(args.clients))
+        store = os.path.join(tmp, "seed.store")
+        hashes = make_store(store, args.chunks)
+        print(f"{os.cpu_count()} cores")
+        for shards in [int(n) for n in args.shards.split(",")]:
+            done, cpu = run(tmp, store, hashes, shards, args.clients, args.seconds)
+            print(f"{shards} shards  {args.clients} receivers  {done:5d} chunks  "
+                  f"{done * peer.CHUNK_DATA_SIZE / 2 ** 20 / args.seconds:7.1f} MiB/s  "
+                  f"shard CPU s {' '.join(f'{seconds:.1f}' for seconds in cpu)}")
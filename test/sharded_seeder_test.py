@@ -0,0 +1,101 @@
+import grader
+import time
+import socket
+import pytest
+import pickle
+import hashlib
+import os
+import re
+
+'''
+This test runs the RDT scenario of basic_transfer_test with the seeder split into 2 shards and a
+second receiver, peer 3 holding what peer 1 holds. Under the simulator all pkts come from its
+address, the seeder dispatches them by the sender in the spiffy header: both downloads must
+complete, each served by a shard of its own, and a SIGINT to the seeder must stop every shard.
+The two windows at once overrun the relay now and then, the seeder runs with a 1 s timeout so that
+the pkts lost besides the one dropped on purpose are not left to a 60 s one.
+
+This test is equivalent to run (except for packet loss), with a nodes.map listing peers 1-3:
+python3 src/peer.py -p nodes.map -c test/tmp2/data1.fragment -m 1 -i 1 -t 60
+python3 src/peer.py -p nodes.map -c test/tmp2/data2.fragment -m 2 -i 2 -t 1 --shards 2
+python3 src/peer.py -p nodes.map -c test/tmp2/data1.fragment -m 1 -i 3 -t 60
+
+In peer1 and peer3 (download_result3.fragment, next to nodes.map, for peer3):
+DOWNLOAD test/tmp2/download_target.chunkhash test/tmp2/download_result.fragment
+'''
+
+SEEDER = ("127.0.0.1", 48002)
+RECEIVERS = [("127.0.0.1", 48001), ("127.0.0.1", 48003)]
+
+
+@pytest.fixture(scope='module')
+def sharded_session(tmp_path_factory):
+    success = False
+    time_max = 80
+
+    tmp = tmp_path_factory.mktemp("sharded")
+    results = dict(zip(RECEIVERS, ["test/tmp2/download_result.fragment", str(tmp / "download_result3.fragment")]))
+    if os.path.exists(results[RECEIVERS[0]]):
+        os.remove(results[RECEIVERS[0]])
+    nodes_map = str(tmp / "nodes.map")
+    with open(nodes_map, "w") as f:
+        f.write("1 127.0.0.1 48001\n2 127.0.0.1 48002\n3 127.0.0.1 48003\n")
+
+    stime = time.time()
+    session = grader.GradingSession(grader.drop_handler, latency=0.01)
+    session.add_peer(1, "src/peer.py", nodes_map, "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48001))
+    session.add_peer(2, "src/peer.py", nodes_map, "test/tmp2/data2.fragment", 2, SEEDER, timeout=1,
+                     extra_args="--shards 2")
+    session.add_peer(3, "src/peer.py", nodes_map, "test/tmp2/data1.fragment", 1, ("127.0.0.1", 48003))
+    session.run_grader()
+
+    for receiver, result in results.items():
+        session.peer_list[receiver].send_cmd(f'''DOWNLOAD test/tmp2/download_target.chunkhash {result}\n''')
+
+    while True:
+        if all(os.path.exists(result) for result in results.values()):
+            success = True
+            break
+        elif time.time()-stime>time_max:
+            success = False
+            break
+
+        time.sleep(0.1)
+
+    seeder = session.peer_list[SEEDER].process
+    for p in session.peer_list.values():
+        p.terminate_peer()
+    seeder.wait(timeout=10)
+
+    return session, success, results
+
+
+def test_finish(sharded_session):
+    session, success, _ = sharded_session
+    assert success == True, "Fail to complete transfer or timeout"
+
+
+def test_content(sharded_session):
+    target_hash = "3b68110847941b84e8d05417a5b2609122a56314"
+    for result in sharded_session[2].values():
+        with open(result, "rb") as download_file:
+            download_fragment = pickle.load(download_file)
+
+        assert target_hash in download_fragment, f"download hash mismatch, target: {target_hash}, has: {download_fragment.keys()}"
+        assert hashlib.sha1(download_fragment[target_hash]).hexdigest() == target_hash, "received data mismatch"
+
+
+def test_shard_per_receiver(sharded_session):
+    # every shard logs the pkts it sends, each receiver got its DATA (type 3) from a different one
+    served = []
+    for index in range(2):
+        with open(f"log/peer2.{index}.log") as log:
+            served.append(set(re.findall(r"sending a type3 pkt to \('([\d.]+)', (\d+)\)", log.read())))
+    assert sorted(tuple(receivers) for receivers in served) == sorted(((ip, str(port)),) for ip, port in RECEIVERS)
+
+
+def test_shards_stopped(sharded_session):
+    # the port is free again only once no shard holds it
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(SEEDER)
+    sock.close()
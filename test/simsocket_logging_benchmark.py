@@ -0,0 +1,87 @@
+import sys
+import os
+import argparse
+import logging
+import socket
+import struct
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.simsocket as simsocket
+
+'''
+Per-pkt cost of SimSocket.sendto + recvfrom on localhost with each --pkt-log mode, against the
+old path that unpacked the header and wrote a DEBUG line for every pkt (reproduced below as
+LegacySocket).
+
+python3 test/simsocket_logging_benchmark.py --pkts 100000
+'''
+
+BATCH = 64
+
+
+class LegacySocket:
+    def __init__(self, id, address):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.logger = logging.getLogger(f"LEGACY{id}_LOGGER")
+        self.logger.setLevel(logging.DEBUG)
+        fh = logging.FileHandler(filename=os.path.join("log", f"legacy{id}.log"), mode="w")
+        fh.setLevel(level=logging.DEBUG)
+        fh.setFormatter(logging.Formatter(fmt="%(asctime)s -+- %(name)s -+- %(levelname)s -+- %(message)s"))
+        self.logger.addHandler(fh)
+
+    def sendto(self, data_bytes, address, flags=0):
+        magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("!HBBHHII", data_bytes[:16])
+        self.logger.debug(f"sending a type{pkt_type} pkt to {address} via normal socket, seq{seq}, ack{ack}, pkt_len{pkt_len}")
+        return self.sock.sendto(data_bytes, flags, address)
+
+    def recvfrom(self, bufsize, flags=0):
+        ret = self.sock.recvfrom(bufsize, flags)
+        magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("!HBBHHII", ret[0][:16])
+        self.logger.debug(f"Receiving a type{pkt_type} pkt from {ret[1]} via normal socket, seq{seq}, ack{ack}, pkt_len{pkt_len}")
+        return ret
+
+    def close(self):
+        self.sock.close()
+
+
+def run(new_socket, pkts, port):
+    sender = new_socket(1, ("127.0.0.1", port))
+    receiver = new_socket(2, ("127.0.0.1", port + 1))
+    payload = bytes(1024)
+    stime = time.perf_counter()
+    for start in range(0, pkts, BATCH):
+        # a batch at a time so that the socket buffer never drops
+        for seq in range(start + 1, min(start + BATCH, pkts) + 1):
+            sender.sendto(struct.pack("!HBBHHII", 52305, 15, 3, 16, 16 + len(payload), seq, 0) + payload, ("127.0.0.1", port + 1))
+        for _ in range(start + 1, min(start + BATCH, pkts) + 1):
+            receiver.recvfrom(1400)
+    elapsed = time.perf_counter() - stime
+    sender.close()
+    receiver.close()
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pkts', type=int, default=100000)
+    parser.add_argument('--port', type=int, default=49001)
+    args = parser.parse_args()
+
+    os.environ.pop("SIMULATOR", None)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.makedirs("log")
+        cases = [("legacy text", LegacySocket)]
+        for i, mode in enumerate(simsocket.PKT_LOG_MODES):
+            # a logger per case, handlers of an earlier case must not stay attached
+            cases.append((f"--pkt-log {mode}", lambda id, address, mode=mode, i=i:
+                          simsocket.SimSocket(10 * (i + 1) + id, address, verbose=0, pkt_log=mode)))
+        for name, new_socket in cases:
+            elapsed = run(new_socket, args.pkts, args.port)
+            log_bytes = sum(os.path.getsize(os.path.join("log", f)) for f in os.listdir("log"))
+            for f in os.listdir("log"):
+                os.remove(os.path.join("log", f))
+            print(f"{name:17s} {elapsed / args.pkts * 1e6:7.2f} us/pkt (send + recv)  {log_bytes / 1024:9.0f} KiB of logs")
@@ -0,0 +1,264 @@
+import os
+import sys
+import math
+import json
+import time
+import socket
+import struct
+import argparse
+import tempfile
+import threading
+
+sys.path.append(os.path.dirname(__file__))
+CWD = os.getcwd()  # grader moves to the repo root
+import grader
+
+'''
+Goodput, completion time, per-chunk time, retransmission ratio and control overhead of the
+tmp1-tmp5 scenarios, over repeated runs and for one or more peer variants side by side.
+
+Every pkt a peer sends is seen through GradingSession.tap, so the spiffy scenarios run on netsim
+(util/netsim.py) instead of hupsim. A variant is LABEL=PEER_FILE followed by its extra args,
+e.g. comparing a checkout of the previous release against the current tree with multi-source:
+
+python3 test/suite_benchmark.py --runs 5 --scenario drop advance \
+    --variant "old=/tmp/old/src/peer.py" --variant "new=src/peer.py --multi-source" --json suite.json
+'''
+
+SPIFFY_HEADER = struct.Struct('!I4s4sHH')
+PEER_HEADER = struct.Struct('!HBBHHII')
+CHUNK_DATA_SIZE = 512 * 1024
+SHA1_LEN = 20
+GET = 2
+DATA = 3
+TIME_MAX = 640
+PERCENTILES = (50, 90)
+
+
+class Scenario:
+    # peers are (id, chunk file, max conn, timeout), downloads are (id, chunkhash file)
+    def __init__(self, name, handler, nodes_map, peers, downloads, spiffy=False, topo_map=None, crash=None):
+        self.name = name
+        self.handler = handler
+        self.nodes_map = nodes_map
+        self.peers = peers
+        self.downloads = downloads
+        self.spiffy = spiffy
+        self.topo_map = topo_map
+        self.crash = crash  # (id, seconds after the DOWNLOAD)
+
+
+SCENARIOS = [
+    Scenario("transfer", grader.normal_handler, "test/tmp1/nodes1.map",
+             [(1, "test/tmp1/data1.fragment", 1, 60), (2, "test/tmp1/data2.fragment", 1, 60)],
+             [(1, "test/tmp1/download_target.chunkhash")]),
+    Scenario("drop", grader.drop_handler, "test/tmp2/nodes2.map",
+             [(1, "test/tmp2/data1.fragment", 1, 60), (2, "test/tmp2/data2.fragment", 1, 60)],
+             [(1, "test/tmp2/download_target.chunkhash")]),
+    Scenario("concurrency", grader.normal_handler, "test/tmp3/nodes3.map",
+             [(1, "test/tmp3/data3-1.fragment", 100, 60), (2, "test/tmp3/data3-2.fragment", 100, 60),
+              (3, "test/tmp3/data3-3.fragment", 100, 60)],
+             [(1, "test/tmp3/download_target3.chunkhash")], spiffy=True, topo_map="test/tmp3/topo3.map"),
+    Scenario("crash", grader.normal_handler, "test/tmp4/nodes4.map",
+             [(1, "test/tmp4/data4-1.fragment", 100, None), (2, "test/tmp4/data4-2.fragment", 100, None),
+              (3, "test/tmp4/data4-2.fragment", 100, None)],
+             [(1, "test/tmp4/download_target4.chunkhash")], spiffy=True, topo_map="test/tmp4/topo4.map", crash=(2, 1)),
+    Scenario("advance", grader.normal_handler, "test/tmp5/nodes5.map",
+             [(identity, f"test/tmp5/fragments/data5-{fragment}.fragment", 100, None)
+              for identity, fragment in ((1, 1), (2, 2), (7, 3), (14, 4), (10, 5), (15, 6), (12, 7), (13, 8))],
+             [(1, "test/tmp5/targets/target1.chunkhash"), (7, "test/tmp5/targets/target2.chunkhash"),
+              (10, "test/tmp5/targets/target3.chunkhash"), (13, "test/tmp5/targets/target4.chunkhash")],
+             spiffy=True, topo_map="test/tmp5/topo5.map"),
+]
+
+
+def read_addrs(nodes_map):
+    addrs = dict()
+    with open(nodes_map) as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            identity, ip, port = line.split()[:3]
+            addrs[int(identity)] = (ip, int(port))
+    return addrs
+
+
+def count_hashes(chunkhash_file):
+    with open(chunkhash_file) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def run_once(scenario, peer_file, extra_args, results):
+    addrs = read_addrs(scenario.nodes_map)
+    pkts = []  # (time, pkt), the tap runs on the relay or netsim thread
+    lock = threading.Lock()
+
+    def tap(pkt, now):
+        with lock:
+            pkts.append((now, pkt))
+
+    session = grader.GradingSession(scenario.handler, latency=0.01, spiffy=scenario.spiffy, topo_map=scenario.topo_map,
+                                    nodes_map=scenario.nodes_map, simulator="netsim")
+    session.tap = tap
+    for identity, chunk_file, max_conn, timeout in scenario.peers:
+        session.add_peer(identity, peer_file, scenario.nodes_map, chunk_file, max_conn, addrs[identity], timeout=timeout, extra_args=extra_args)
+    session.run_grader()
+
+    outputs = []
+    stime = time.time()
+    for identity, chunkhash_file in scenario.downloads:
+        output = os.path.join(results, f"{scenario.name}-{identity}.fragment")
+        if os.path.exists(output):
+            os.remove(output)
+        outputs.append(output)
+        session.peer_list[addrs[identity]].send_cmd(f"DOWNLOAD {chunkhash_file} {output}\n")
+    crashed = scenario.crash is None
+    finish = None
+    while time.time() - stime < TIME_MAX:
+        if not crashed and time.time() - stime >= scenario.crash[1]:
+            session.peer_list[addrs[scenario.crash[0]]].terminate_peer()
+            crashed = True
+        if all(os.path.exists(output) for output in outputs):
+            finish = time.time() - stime
+            break
+        time.sleep(0.05)
+
+    procs = [p.process for p in session.peer_list.values() if p.process is not None]
+    for p in session.peer_list.values():
+        if p.process is not None:
+            p.terminate_peer()
+    for proc in procs:
+        proc.wait(timeout=5)
+    session.stop_grader()
+    with lock:
+        pkts = list(pkts)
+    chunk_num = sum(count_hashes(chunkhash_file) for _, chunkhash_file in scenario.downloads)
+    return measure(pkts, stime, finish, chunk_num)
+
+
+def measure(pkts, stime, finish, chunk_num):
+    counts = dict()  # {pkt type: pkts}
+    total_bytes = 0
+    control_bytes = 0
+    data_pkts = 0
+    unique_data = set()
+    chunk_span = dict()  # {(receiver, chunk hash): [first DATA time, last DATA time]}
+    asked = dict()  # {(sender, receiver): chunk hash of the last GET receiver sent to sender}
+    tagged = dict()  # {(receiver, chunk tag): chunk hash}
+    for now, pkt in pkts:
+        if len(pkt) < SPIFFY_HEADER.size + PEER_HEADER.size:
+            continue
+        _, src_ip, dst_ip, src_port, dst_port = SPIFFY_HEADER.unpack_from(pkt)
+        _, _, pkt_type, header_len, _, seq, ack = PEER_HEADER.unpack_from(pkt, SPIFFY_HEADER.size)
+        size = len(pkt) - SPIFFY_HEADER.size
+        counts[pkt_type] = counts.get(pkt_type, 0) + 1
+        total_bytes += size
+        sender = (socket.inet_ntoa(src_ip), src_port)
+        receiver = (socket.inet_ntoa(dst_ip), dst_port)
+        if pkt_type == GET:
+            # a ranged GET names its seqs in seq and ack, DATA seqs are within the chunk either way
+            payload = SPIFFY_HEADER.size + header_len
+            chunk_hash = pkt[payload:payload + SHA1_LEN].hex()
+            asked[(receiver, sender)] = chunk_hash
+            tagged[(sender, int(chunk_hash[:8], 16))] = chunk_hash
+        if pkt_type != DATA:
+            control_bytes += size
+            continue
+        data_pkts += 1
+        # tagged DATA names its chunk in the ack field, untagged DATA (ack 0) is for the last GET of the pair
+        chunk = tagged.get((receiver, ack)) if ack != 0 else None
+        if chunk is None:
+            chunk = asked.get((sender, receiver), (sender, ack))
+        unique_data.add((receiver, chunk, seq))
+        span = chunk_span.setdefault((receiver, chunk), [now, now])
+        span[1] = now
+    metrics = {
+        "completed": finish is not None,
+        "completion_time": finish,
+        "goodput_kib_s": chunk_num * CHUNK_DATA_SIZE / 1024 / finish if finish else None,
+        "chunk_times": [span[1] - span[0] for span in chunk_span.values()],
+        "first_data": min((span[0] for span in chunk_span.values()), default=stime) - stime,
+        "retransmission_ratio": (data_pkts - len(unique_data)) / data_pkts if data_pkts else 0.0,
+        "control_overhead": control_bytes / total_bytes if total_bytes else 0.0,
+        "pkts": {str(pkt_type): num for pkt_type, num in sorted(counts.items())},
+    }
+    return metrics
+
+
+def percentile(values, p):
+    # nearest rank
+    values = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[rank]
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    summary = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary.update({"min": min(values), "max": max(values), "mean": sum(values) / len(values)})
+    return summary
+
+
+def summarize_runs(runs):
+    summary = {name: summarize([run[name] for run in runs])
+               for name in ("completion_time", "goodput_kib_s", "first_data", "retransmission_ratio", "control_overhead")}
+    summary["chunk_time"] = summarize([t for run in runs for t in run["chunk_times"]])
+    summary["completed"] = sum(run["completed"] for run in runs)
+    return summary
+
+
+def parse_variant(text):
+    label, command = text.split('=', 1)
+    peer_file, _, extra_args = command.strip().partition(' ')
+    return label, peer_file, extra_args.strip()
+
+
+def print_table(report, labels):
+    columns = ("completion_time", "goodput_kib_s", "chunk_time", "retransmission_ratio", "control_overhead")
+    print(f"{'scenario':12s} {'metric':21s}" + "".join(f"{label:>14s}" for label in labels) + ("   delta" if len(labels) > 1 else ""))
+    for scenario in next(iter(report.values())):
+        for column in columns:
+            values = []
+            for label in labels:
+                summary = report[label][scenario]["summary"][column]
+                values.append(None if summary is None else summary["p50"])
+            cells = "".join(f"{'-':>14s}" if v is None else f"{v:14.3f}" for v in values)
+            delta = ""
+            if len(labels) > 1 and values[0] and values[-1] is not None:
+                delta = f"{(values[-1] - values[0]) / values[0] * 100:+7.1f}%"
+            print(f"{scenario:12s} {column + ' p50':21s}{cells}   {delta}")
+        completed = "".join(f"{report[label][scenario]['summary']['completed']:>14d}" for label in labels)
+        print(f"{scenario:12s} {'completed runs':21s}{completed}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--scenario', nargs='+', default=[s.name for s in SCENARIOS], choices=[s.name for s in SCENARIOS])
+    parser.add_argument('--variant', action='append', default=None,
+                        help='LABEL=PEER_FILE [extra args], repeat to compare, the delta column is last against first')
+    parser.add_argument('--json', type=str, default=None, help='write every run and the summaries here')
+    args = parser.parse_args()
+
+    variants = [parse_variant(v) for v in (args.variant or ["peer=src/peer.py"])]
+    report = dict()  # {label: {scenario: {"runs": [...], "summary": {...}}}}
+    with tempfile.TemporaryDirectory() as results:
+        for scenario in SCENARIOS:
+            if scenario.name not in args.scenario:
+                continue
+            # interleave the variants so that load on the host hits them alike
+            runs = {label: [] for label, _, _ in variants}
+            for i in range(args.runs):
+                for label, peer_file, extra_args in variants:
+                    metrics = run_once(scenario, peer_file, extra_args, results)
+                    runs[label].append(metrics)
+                    print(f"{scenario.name} {label} run {i + 1}: {metrics['completion_time']} s", file=sys.stderr)
+            for label in runs:
+                report.setdefault(label, dict())[scenario.name] = {"runs": runs[label], "summary": summarize_runs(runs[label])}
+
+    print_table(report, [label for label, _, _ in variants])
+    if args.json:
+        with open(os.path.join(CWD, args.json), "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,56 @@
+import sys
+import os
+import socket
+import hashlib
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
+import suite_benchmark
+
+'''
+The pkt trace parser of suite_benchmark.py: DATA belongs to the chunk of the GET it answers, whether
+the sender tags it with the chunk in the ack field or, as older peers do, leaves 0 there.
+'''
+
+RECEIVER = ("127.0.0.1", 48001)
+HOLDERS = [("127.0.0.1", 48002), ("127.0.0.1", 48003)]
+HASHES = [hashlib.sha1(bytes([i])).hexdigest() for i in range(2)]
+
+
+def spiffy(src, dst, pkt):
+    return suite_benchmark.SPIFFY_HEADER.pack(0, socket.inet_aton(src[0]), socket.inet_aton(dst[0]), src[1], dst[1]) + pkt
+
+
+def get(holder, chunk_hash, first=0, last=0):
+    return spiffy(RECEIVER, holder, packet.encode(packet.GET, bytes.fromhex(chunk_hash), seq=first, ack=last))
+
+
+def data(holder, chunk_hash, seq, tagged):
+    tag = int(chunk_hash[:8], 16) if tagged else 0
+    return spiffy(holder, RECEIVER, packet.encode(packet.DATA, bytes(100), seq, tag))
+
+
+@pytest.mark.parametrize("tagged", [False, True])
+def test_chunks_from_one_holder(tagged):
+    # two chunks one after the other from the same holder, seq 2 of the first sent twice
+    trace = []
+    for chunk_hash in HASHES:
+        trace.append(get(HOLDERS[0], chunk_hash))
+        trace.extend(data(HOLDERS[0], chunk_hash, seq, tagged) for seq in (1, 2, 3, 4))
+    trace.insert(3, data(HOLDERS[0], HASHES[0], 2, tagged))
+    metrics = suite_benchmark.measure(list(enumerate(trace)), 0, 20, 2)
+    assert sorted(metrics["chunk_times"]) == [3, 4]
+    assert metrics["retransmission_ratio"] == 1 / 9
+
+
+@pytest.mark.parametrize("tagged", [False, True])
+def test_ranges_from_two_holders(tagged):
+    # one chunk in two ranged GETs, the DATA of both holders interleaved
+    trace = [get(HOLDERS[0], HASHES[0], 1, 2), get(HOLDERS[1], HASHES[0], 3, 4)]
+    for seq in (1, 2):
+        trace.append(data(HOLDERS[0], HASHES[0], seq, tagged))
+        trace.append(data(HOLDERS[1], HASHES[0], seq + 2, tagged))
+    metrics = suite_benchmark.measure(list(enumerate(trace)), 0, 10, 1)
+    assert metrics["chunk_times"] == [3]
+    assert metrics["retransmission_ratio"] == 0
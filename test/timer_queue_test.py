@@ -0,0 +1,72 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from util.timer_queue import TimerQueue
+
+'''
+Ordering and cancellation of the event loop timers.
+'''
+
+
+def test_deadline_order():
+    timers = TimerQueue()
+    fired = []
+    timers.schedule(3.0, fired.append, "c")
+    timers.schedule(1.0, fired.append, "a")
+    timers.schedule(2.0, fired.append, "b")
+    timers.schedule(2.0, fired.append, "b2")
+    assert timers.next_deadline() == 1.0
+    assert timers.run(0.5) == 0
+    assert timers.run(2.0) == 3
+    assert fired == ["a", "b", "b2"]
+    assert timers.next_deadline() == 3.0
+    assert timers.run(10.0) == 1
+    assert fired == ["a", "b", "b2", "c"]
+    assert timers.next_deadline() is None
+
+
+def test_cancel():
+    timers = TimerQueue()
+    fired = []
+    first = timers.schedule(1.0, fired.append, 1)
+    timers.schedule(2.0, fired.append, 2)
+    timers.cancel(first)
+    timers.cancel(None)
+    assert timers.next_deadline() == 2.0
+    assert timers.run(5.0) == 1
+    assert fired == [2]
+
+
+def test_reschedule_from_callback():
+    timers = TimerQueue()
+    fired = []
+
+    def tick(n):
+        fired.append(n)
+        if n < 3:
+            timers.schedule(n + 1.0, tick, n + 1)
+
+    timers.schedule(1.0, tick, 1)
+    assert timers.run(1.0) == 1
+    assert timers.next_deadline() == 2.0
+    # a timer scheduled by a callback waits for the next run
+    assert timers.run(5.0) == 1
+    assert timers.run(5.0) == 1
+    assert timers.run(5.0) == 0
+    assert fired == [1, 2, 3]
+
+
+def test_callback_scheduled_in_the_past():
+    timers = TimerQueue()
+    fired = []
+
+    def again(n):
+        fired.append(n)
+        timers.schedule(0.0, again, n + 1)
+
+    timers.schedule(1.0, again, 1)
+    assert timers.run(5.0) == 1
+    assert timers.next_deadline() == 0.0
+    assert timers.run(5.0) == 1
+    assert fired == [1, 2]
@@ -0,0 +1,85 @@
+import sys
+import os
+import pickle
+import hashlib
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.packet as packet
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Timestamp echo (--timestamps) on a two-node swarm with a 50 ms link, on virtual time: both peers
+know each other's RTT from the first control pkts, so a lost first DATA pkt and a crashed sender
+cost a few RTTs instead of DEFAULT_TIMEOUT.
+'''
+
+TEST_DIR = os.path.dirname(__file__)
+TARGET = os.path.join(TEST_DIR, "tmp1", "download_target.chunkhash")
+SEEDER = ("127.0.0.1", 48001)
+DOWNLOADER = ("127.0.0.1", 48002)
+
+
+def two_node_swarm(tmp_path, timestamps):
+    nodes_map = tmp_path / "nodes.map"
+    nodes_map.write_text("1 127.0.0.1 48001\n2 127.0.0.1 48002\n")
+    topo_map = tmp_path / "topo.map"
+    topo_map.write_text("1 2 1000000 0.05 15\n")
+    swarm = VirtualSwarm(str(topo_map), str(nodes_map))
+    swarm.add_peer(1, os.path.join(TEST_DIR, "tmp1", "data2.fragment"), 1, timestamps=timestamps)
+    swarm.add_peer(2, os.path.join(TEST_DIR, "tmp1", "data1.fragment"), 1, timestamps=timestamps)
+    return swarm
+
+
+def check_result(result_file):
+    with open(TARGET) as tf:
+        target_hash = [line.split(" ")[1].strip() for line in tf if line.strip()]
+    with open(result_file, "rb") as rf:
+        result = pickle.load(rf)
+    assert sorted(result) == sorted(target_hash)
+    assert all(hashlib.sha1(data).hexdigest() == hash_str for hash_str, data in result.items())
+
+
+@pytest.mark.parametrize("timestamps", [False, True])
+def test_first_data_lost(tmp_path, timestamps):
+    swarm = two_node_swarm(tmp_path, timestamps)
+    sock = swarm.peers[1].sock
+    sendto = sock.sendto
+    dropped = []
+
+    def lossy_sendto(data, address):
+        if len(dropped) == 0 and packet.parse(data)[0] == packet.DATA:
+            dropped.append(data)
+            return len(data)
+        return sendto(data, address)
+    sock.sendto = lossy_sendto
+    result = str(tmp_path / "result.fragment")
+    swarm.download(2, TARGET, result)
+    finish = swarm.run(until=300)
+    assert not swarm.downloading()
+    check_result(result)
+    seeder, downloader = swarm.peers[1].module, swarm.peers[2].module
+    if timestamps:
+        # the GET gave the sender its RTT before the first DATA timer was set
+        assert finish < seeder.DEFAULT_TIMEOUT
+        for info in (seeder.rtt_info[DOWNLOADER], downloader.rtt_info[SEEDER]):
+            assert info.min_rtt == pytest.approx(0.1, abs=0.02)
+            assert info.timeout_interval < 1
+    else:
+        assert finish > seeder.DEFAULT_TIMEOUT
+
+
+def test_crash_detected_in_rtos(tmp_path):
+    swarm = two_node_swarm(tmp_path, True)
+    swarm.download(2, TARGET, str(tmp_path / "result.fragment"))
+    downloader = swarm.peers[2].module
+    swarm.run(until=300, stop=lambda: any(record.ack >= 64 for record in downloader.data_info.values()))
+    swarm.crash(1)
+    crashed = swarm.now
+    record = downloader.data_info[SEEDER]
+    swarm.run(until=crashed + 300, stop=lambda: len(downloader.data_info) == 0)
+    assert len(downloader.data_info) == 0
+    # DATA in flight at the crash still arrives, the source is silent from the last of it
+    assert swarm.now - record.last_receive_time <= downloader.CRASH_RTOS * downloader.get_timeout(SEEDER) + 0.01
+    assert swarm.now - crashed < 2
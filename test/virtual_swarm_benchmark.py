@@ -0,0 +1,50 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Sweep peer options over the tmp5 advance scenario on virtual time, each run takes seconds
+instead of the minutes it takes on hupsim.
+
+python3 test/virtual_swarm_benchmark.py --max-conn 1 4 100
+'''
+
+TMP5 = os.path.join(os.path.dirname(__file__), "tmp5")
+PEERS = [(1, 1), (2, 2), (7, 3), (14, 4), (10, 5), (15, 6), (12, 7), (13, 8)]  # (id, fragment)
+TARGETS = [(1, 1), (7, 2), (10, 3), (13, 4)]  # (id, target)
+VARIANTS = [
+    ("default", dict()),
+    ("multi-source", dict(multi_source=True)),
+    ("endgame 2", dict(endgame=2)),
+    ("ack-every 4", dict(ack_every=4)),
+]
+
+
+def run(max_conn, options, results):
+    swarm = VirtualSwarm(os.path.join(TMP5, "topo5.map"), os.path.join(TMP5, "nodes5.map"))
+    for identity, fragment in PEERS:
+        swarm.add_peer(identity, os.path.join(TMP5, "fragments", f"data5-{fragment}.fragment"), max_conn, **options)
+    for identity, target in TARGETS:
+        swarm.download(identity, os.path.join(TMP5, "targets", f"target{target}.chunkhash"), os.path.join(results, f"result{target}.fragment"))
+    stime = time.perf_counter()
+    finish = swarm.run(until=3600)
+    return finish, time.perf_counter() - stime, not swarm.downloading(), swarm.network.dropped()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-conn', type=int, nargs='+', default=[1, 100])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as results:
+        for max_conn in args.max_conn:
+            for name, options in VARIANTS:
+                finish, wall, done, dropped = run(max_conn, options, results)
+                status = "done" if done else "unfinished"
+                print(f"max-conn {max_conn:3d}  {name:13s} {finish:8.2f} s virtual  {wall:6.2f} s wall  "
+                      f"{finish / wall:6.1f}x  {dropped:5d} dropped  {status}")
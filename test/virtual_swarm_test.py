@@ -0,0 +1,91 @@
+import sys
+import os
+import time
+import pickle
+import hashlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from util.virtual_swarm import VirtualSwarm
+
+'''
+Whole swarms in one process on virtual time: the advance scenario of tmp5, the same run twice,
+and a holder that crashes mid-transfer.
+'''
+
+TEST_DIR = os.path.dirname(__file__)
+TMP5 = os.path.join(TEST_DIR, "tmp5")
+TMP5_PEERS = [(1, 1), (2, 2), (7, 3), (14, 4), (10, 5), (15, 6), (12, 7), (13, 8)]  # (id, fragment)
+TMP5_TARGETS = [(1, 1), (7, 2), (10, 3), (13, 4)]  # (id, target)
+
+
+def tmp5_swarm(results, **options):
+    swarm = VirtualSwarm(os.path.join(TMP5, "topo5.map"), os.path.join(TMP5, "nodes5.map"))
+    for identity, fragment in TMP5_PEERS:
+        swarm.add_peer(identity, os.path.join(TMP5, "fragments", f"data5-{fragment}.fragment"), 100, **options)
+    for identity, target in TMP5_TARGETS:
+        swarm.download(identity, os.path.join(TMP5, "targets", f"target{target}.chunkhash"), os.path.join(results, f"result{target}.fragment"))
+    return swarm
+
+
+def check_result(target_file, result_file):
+    with open(target_file, "r") as tf:
+        target_hash = [line.split(" ")[1].strip() for line in tf if line.strip()]
+    with open(result_file, "rb") as rf:
+        result = pickle.load(rf)
+    assert sorted(result.keys()) == sorted(target_hash)
+    for hash_str, data in result.items():
+        assert hashlib.sha1(data).hexdigest() == hash_str
+
+
+def test_advance_swarm(tmp_path):
+    swarm = tmp5_swarm(str(tmp_path))
+    stime = time.time()
+    finish = swarm.run(until=640)
+    wall = time.time() - stime
+    assert not swarm.downloading()
+    for _, target in TMP5_TARGETS:
+        check_result(os.path.join(TMP5, "targets", f"target{target}.chunkhash"), os.path.join(str(tmp_path), f"result{target}.fragment"))
+    # hupsim needs about as many wall seconds as the virtual ones
+    assert wall < finish / 5
+
+
+def test_upload_slot_freed(tmp_path):
+    # with one upload slot per peer, a sender that kept its finished transfer would DENY forever
+    swarm = VirtualSwarm(os.path.join(TMP5, "topo5.map"), os.path.join(TMP5, "nodes5.map"))
+    for identity, fragment in TMP5_PEERS:
+        swarm.add_peer(identity, os.path.join(TMP5, "fragments", f"data5-{fragment}.fragment"), 1)
+    for identity, target in TMP5_TARGETS:
+        swarm.download(identity, os.path.join(TMP5, "targets", f"target{target}.chunkhash"), os.path.join(str(tmp_path), f"result{target}.fragment"))
+    swarm.run(until=640)
+    assert not swarm.downloading()
+    # the last ACKs may still be on the way
+    swarm.run(until=swarm.now + 5, stop=lambda: False)
+    assert all(len(peer.module.ack_records) == 0 for peer in swarm.peers.values())
+
+
+def test_deterministic(tmp_path):
+    first = tmp5_swarm(str(tmp_path)).run(until=640)
+    second = tmp5_swarm(str(tmp_path)).run(until=640)
+    assert first == second
+
+
+def test_crash_failover(tmp_path):
+    # 1 downloads the chunk that 2 and 3 both hold, 2 dies once the transfer is under way
+    nodes_map = tmp_path / "nodes.map"
+    nodes_map.write_text("1 127.0.0.1 48001\n2 127.0.0.1 48002\n3 127.0.0.1 48003\n")
+    topo_map = tmp_path / "topo.map"
+    topo_map.write_text("1 2 1000000 0.05 15\n1 3 1000000 0.05 15\n2 3 1000000 0.05 15\n")
+    fragment = os.path.join(TEST_DIR, "tmp1", "data2.fragment")
+    swarm = VirtualSwarm(str(topo_map), str(nodes_map))
+    swarm.add_peer(1, os.path.join(TEST_DIR, "tmp1", "data1.fragment"), 1)
+    swarm.add_peer(2, fragment, 1)
+    swarm.add_peer(3, fragment, 1)
+    result = str(tmp_path / "result.fragment")
+    swarm.download(1, os.path.join(TEST_DIR, "tmp1", "download_target.chunkhash"), result)
+    swarm.run(stop=lambda: swarm.peers[1].module.data_info)
+    source = next(iter(swarm.peers[1].module.data_info))
+    swarm.run(until=swarm.now + 1)
+    swarm.crash(2 if source[1] == 48002 else 3)
+    swarm.run(until=swarm.now + 300)
+    assert not swarm.downloading()
+    check_result(os.path.join(TEST_DIR, "tmp1", "download_target.chunkhash"), result)
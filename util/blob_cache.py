@@ -0,0 +1,97 @@
+import os
+import mmap
+import hashlib
+
+"""
+Host-wide content-addressed chunk cache shared by the peers on one machine.
+
+A directory of blobs, one file per chunk named by its SHA-1 hex. Blobs are written to a hidden
+temporary file and renamed into place, so a reader never sees half a chunk, and they are read
+through read-only mmaps: every peer mapping the same blob shares the same page cache pages
+instead of holding its own copy of the bytes.
+
+Recency is the blob's mtime, refreshed on every hit. Whoever adds a blob and takes the cache over
+max_bytes removes the least recently used blobs until it fits again, the size limit is kept by
+the adders and may be exceeded briefly while several peers add at once. Blobs removed while
+mapped stay readable by whoever has them mapped, their space is freed once the last map goes.
+Data put is taken as it is: the peer puts the chunks it seeds from -c and the chunks it downloaded,
+which passed their hash check. A blob already in the cache is checked against its name before put
+returns it, one that is not what its name says (cut short, or stray) is written over.
+"""
+
+TMP_PREFIX = '.'
+
+
+class BlobCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.__views = dict()  # {chunkhash: memoryview of its mmap}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = self.__scan()[1]  # bytes in the cache, as far as this process knows
+
+    def __path(self, chunk_hash):
+        return os.path.join(self.cache_dir, chunk_hash)
+
+    def __scan(self):
+        # ([(mtime, size, name)] of the blobs, total size)
+        blobs = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(TMP_PREFIX):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((st.st_mtime, st.st_size, entry.name))
+        return blobs, sum(size for _, size, _ in blobs)
+
+    def __contains__(self, chunk_hash):
+        return chunk_hash in self.__views or os.path.exists(self.__path(chunk_hash))
+
+    def get(self, chunk_hash):
+        # the blob as a memoryview of a read-only mmap, None if it is not cached
+        view = self.__views.get(chunk_hash)
+        try:
+            os.utime(self.__path(chunk_hash))
+        except FileNotFoundError:
+            # evicted, a map this process already has is still good
+            return view
+        if view is None:
+            try:
+                with open(self.__path(chunk_hash), 'rb') as f:
+                    view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            except (FileNotFoundError, ValueError):
+                # gone, or an empty file mmap refuses
+                return None
+            self.__views[chunk_hash] = view
+        return view
+
+    def put(self, chunk_hash, data):
+        # add a chunk unless a good copy is there already, and return it as get() does
+        view = self.get(chunk_hash)
+        if view is not None and (len(view) != len(data) or hashlib.sha1(view).hexdigest() != chunk_hash):
+            self.__views.pop(chunk_hash)
+            view = None
+        if view is None:
+            tmp = os.path.join(self.cache_dir, f"{TMP_PREFIX}{chunk_hash}.{os.getpid()}")
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.__path(chunk_hash))
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+            view = self.get(chunk_hash)
+        return view
+
+    def evict(self):
+        # drop the least recently used blobs until the cache fits in max_bytes
+        blobs, self.size = self.__scan()
+        for _, size, name in sorted(blobs):
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(self.__path(name))
+            except FileNotFoundError:
+                pass
+            self.size -= size
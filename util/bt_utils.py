@@ -1,6 +1,10 @@
 import sys
 import os
 import pickle
+import util.chunk_store as chunk_store
+import util.blob_cache as blob_cache
+
+DEFAULT_CACHE_SIZE = 1024  # MiB
 
 class BtConfig:
     def __init__(self, args):
@@ -13,6 +17,23 @@ class BtConfig:
         self.haschunks = dict()
         self.verbose = args.v
         self.timeout = args.t
+        self.block_check = getattr(args, 'block_check', False)
+        self.multi_source = getattr(args, 'multi_source', False)
+        self.endgame = getattr(args, 'endgame', 0)
+        self.ack_every = getattr(args, 'ack_every', 1)
+        self.sack = getattr(args, 'sack', False)
+        self.congestion = getattr(args, 'cc', 'reno')
+        self.pace = getattr(args, 'pace', False)
+        self.timestamps = getattr(args, 'timestamps', False)
+        self.asyncio = getattr(args, 'asyncio', False)
+        self.pkt_log = getattr(args, 'pkt_log', 'text')
+        self.batch_io = getattr(args, 'batch_io', False)
+        self.shards = getattr(args, 'shards', 1)
+        # host-wide chunk cache shared with the other peers on this machine, see util/blob_cache.py
+        self.cache = None
+        cache_dir = getattr(args, 'cache', None)
+        if cache_dir is not None:
+            self.cache = blob_cache.BlobCache(cache_dir, getattr(args, 'cache_size', DEFAULT_CACHE_SIZE) * 2 ** 20)
 
         self.bt_parse_peer_list()
         self.bt_parse_haschunk_list()
@@ -39,8 +60,19 @@ class BtConfig:
 
 
     def bt_parse_haschunk_list(self):
+        if chunk_store.is_chunk_store(self.has_chunk_file):
+            # index + mmap'ed data file, chunk bytes are paged in on demand
+            self.haschunks = chunk_store.ChunkStore(self.has_chunk_file)
+            return
         with open(self.has_chunk_file, 'rb') as file:
             self.haschunks = pickle.load(file)
+        if self.cache is not None:
+            # served from the shared blobs, the copies pickle made are freed. put checks a blob that was
+            # there already against the hash and writes our copy over it if it does not match
+            for chunk_hash, chunk_data in self.haschunks.items():
+                cached = self.cache.put(chunk_hash, chunk_data)
+                if cached is not None:
+                    self.haschunks[chunk_hash] = cached
 
     def bt_peer_info(self, identity):
         for item in self.peers:
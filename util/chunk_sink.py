@@ -0,0 +1,166 @@
+import os
+import mmap
+import shutil
+import struct
+import hashlib
+
+"""
+Output file of a download, written one chunk at a time.
+
+Verified chunks are appended to <output>.part as they complete, so only the chunks in flight are
+held in memory. The .part file is a pickle of {chunkhash: chunkdata} without its final STOP
+opcode:
+
+    PROTO 3, EMPTY_DICT, then per chunk BINUNICODE hash, BINBYTES data, SETITEM
+
+finish() appends STOP and renames it to <output>, which pickle.load reads like the old single
+pickle.dump; the output never exists half-written. Every chunk written gets an entry in
+<output>.journal, flushed after the chunk itself. A sink opened on an output whose .part and
+journal exist resumes: the chunks in the journal that are whole and match their hash are kept, the
+rest of the .part is cut off, and the peer only downloads what is missing. This survives a crash
+of the peer, not of the machine, nothing is fsync'ed before finish().
+
+Chunks written are served back through read-only mmaps of the .part file, not from the heap.
+
+The pkts of chunks still in progress are saved now and then to <output>.partial/<chunkhash>, a
+sparse file of the chunk data followed by one byte per pkt that is 1 once the pkt was saved. A chunk
+asked for again, after a restart or after its source failed, is loaded from it and starts with the
+pkts already there. Data is written before the map, but as with the journal only a crash of the peer
+is covered: after an OS crash a chunk may come back with bad pkts, which then fail its hash.
+"""
+
+PART_SUFFIX = '.part'
+JOURNAL_SUFFIX = '.journal'
+PARTIAL_SUFFIX = '.partial'
+PICKLE_HEAD = b'\x80\x03}'  # PROTO 3, EMPTY_DICT
+PICKLE_STOP = b'.'
+SETITEM = b's'
+KEY_HEAD = struct.Struct('<cI')  # BINUNICODE and the length of the hex hash
+DATA_HEAD = struct.Struct('<cI')  # BINBYTES and the length of the chunk
+JOURNAL_ENTRY = struct.Struct('!20sQI')  # hash, offset of the chunk data in the .part file, length
+
+
+def write_entry(f, chunk_hash, data):
+    # one chunk of the dict pickle (BINUNICODE hash, BINBYTES data, SETITEM) at the position of f,
+    # returns the offset of the data in f
+    key = chunk_hash.encode()
+    f.write(KEY_HEAD.pack(b'X', len(key)) + key + DATA_HEAD.pack(b'B', len(data)))
+    offset = f.tell()
+    f.write(data)
+    f.write(SETITEM)
+    return offset
+
+
+class ChunkSink:
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.part_file = output_file + PART_SUFFIX
+        self.journal_file = output_file + JOURNAL_SUFFIX
+        self.partial_dir = output_file + PARTIAL_SUFFIX
+        self.offsets = dict()  # {chunkhash: (offset, length)} of the chunks in the .part file
+        self.resumed = []  # hashes recovered from an earlier run
+        self.__views = dict()  # {chunkhash: memoryview of its mmap}
+
+        if os.path.exists(self.part_file) and os.path.exists(self.journal_file):
+            self.part = open(self.part_file, 'r+b')
+            self.journal = open(self.journal_file, 'r+b')
+            self.__resume()
+        else:
+            self.part = open(self.part_file, 'w+b')
+            self.journal = open(self.journal_file, 'w+b')
+            self.part.write(PICKLE_HEAD)
+            self.part.flush()
+
+    def __resume(self):
+        # keep the journaled chunks up to the first one that is missing or corrupt
+        entries = self.journal.read()
+        end = len(PICKLE_HEAD)
+        kept = 0
+        with open(self.part_file, 'rb') as f:
+            if f.read(len(PICKLE_HEAD)) == PICKLE_HEAD:
+                for raw_hash, offset, length in JOURNAL_ENTRY.iter_unpack(entries[:len(entries) - len(entries) % JOURNAL_ENTRY.size]):
+                    f.seek(offset)
+                    data = f.read(length)
+                    if len(data) != length or f.read(1) != SETITEM or hashlib.sha1(data).digest() != raw_hash:
+                        break
+                    chunk_hash = raw_hash.hex()
+                    self.offsets[chunk_hash] = (offset, length)
+                    self.resumed.append(chunk_hash)
+                    end = offset + length + len(SETITEM)
+                    kept += 1
+        self.part.truncate(end)
+        self.part.seek(0)
+        self.part.write(PICKLE_HEAD)
+        self.part.seek(end)
+        self.journal.truncate(kept * JOURNAL_ENTRY.size)
+        self.journal.seek(kept * JOURNAL_ENTRY.size)
+
+    def __contains__(self, chunk_hash):
+        return chunk_hash in self.offsets
+
+    def __getitem__(self, chunk_hash):
+        # the chunk as a memoryview of the .part file, mapped on first use
+        view = self.__views.get(chunk_hash)
+        if view is None:
+            offset, length = self.offsets[chunk_hash]
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            mm = mmap.mmap(self.part.fileno(), offset + length - start, access=mmap.ACCESS_READ, offset=start)
+            view = memoryview(mm)[offset - start:]
+            self.__views[chunk_hash] = view
+        return view
+
+    def add(self, chunk_hash, data):
+        if chunk_hash in self.offsets:
+            return
+        offset = write_entry(self.part, chunk_hash, data)
+        self.part.flush()
+        # the journal entry only once the chunk is in the file
+        self.journal.write(JOURNAL_ENTRY.pack(bytes.fromhex(chunk_hash), offset, len(data)))
+        self.journal.flush()
+        self.offsets[chunk_hash] = (offset, len(data))
+
+    def load_partial(self, chunk_hash, data, received_map):
+        # fill the buffers of a chunk with what an earlier attempt saved, they are left as they are without it
+        try:
+            fd = os.open(os.path.join(self.partial_dir, chunk_hash), os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            if os.fstat(fd).st_size == len(data) + len(received_map):
+                os.preadv(fd, [data, received_map], 0)
+        finally:
+            os.close(fd)
+
+    def save_partial(self, chunk_hash, data, ranges, received_map):
+        # write the (start, end) byte ranges of data, then the whole map
+        os.makedirs(self.partial_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.partial_dir, chunk_hash), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != len(data) + len(received_map):
+                # new, or not a file this layout wrote: holes everywhere until written
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, len(data) + len(received_map))
+            for start, end in ranges:
+                os.pwrite(fd, data[start:end], start)
+            os.pwrite(fd, received_map, len(data))
+        finally:
+            os.close(fd)
+
+    def drop_partial(self, chunk_hash):
+        # the chunk is complete or was bad
+        try:
+            os.remove(os.path.join(self.partial_dir, chunk_hash))
+        except FileNotFoundError:
+            pass
+
+    def finish(self):
+        # complete the pickle and move it to the output file
+        self.part.write(PICKLE_STOP)
+        self.part.flush()
+        os.fsync(self.part.fileno())
+        os.replace(self.part_file, self.output_file)
+        # the mmaps handed out stay valid
+        self.part.close()
+        self.journal.close()
+        os.remove(self.journal_file)
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
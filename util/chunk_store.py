@@ -0,0 +1,112 @@
+import argparse
+import mmap
+import os
+import pickle
+import struct
+
+"""
+On-disk chunk store: a small index file plus a flat data file.
+
+index file:  |8byte magic|4byte chunk size|4byte count|  then count * |20byte hash|8byte offset|
+data file:   <index file>.data, the chunks concatenated back to back
+
+The data file is mmap'ed read-only, so a chunk is only paged in when it is sent.
+"""
+
+STORE_MAGIC = b'BTCSIDX1'
+STORE_HEADER = struct.Struct('!8sII')
+STORE_ENTRY = struct.Struct('!20sQ')
+BT_CHUNK_SIZE = 512 * 1024
+DATA_SUFFIX = '.data'
+
+
+def is_chunk_store(path):
+    with open(path, 'rb') as f:
+        return f.read(len(STORE_MAGIC)) == STORE_MAGIC
+
+
+class ChunkStore:
+    def __init__(self, index_file):
+        self.index_file = index_file
+        self.data_file = index_file + DATA_SUFFIX
+        self.offsets = dict()  # {chunkhash: offset in data file}
+        self.downloaded = dict()  # chunks added at runtime, kept in memory
+        self.mm = None
+
+        with open(index_file, 'rb') as f:
+            magic, self.chunk_size, count = STORE_HEADER.unpack(f.read(STORE_HEADER.size))
+            if magic != STORE_MAGIC:
+                raise ValueError(f"{index_file} is not a chunk store index")
+            entries = f.read(count * STORE_ENTRY.size)
+        for raw_hash, offset in STORE_ENTRY.iter_unpack(entries):
+            self.offsets[raw_hash.hex()] = offset
+
+        if os.path.getsize(self.data_file) > 0:
+            with open(self.data_file, 'rb') as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mm)
+
+    def __contains__(self, chunk_hash):
+        return chunk_hash in self.offsets or chunk_hash in self.downloaded
+
+    def __getitem__(self, chunk_hash):
+        # A memoryview over the mapped pages, slicing it does not copy
+        if chunk_hash in self.downloaded:
+            return self.downloaded[chunk_hash]
+        offset = self.offsets[chunk_hash]
+        return self.view[offset:offset + self.chunk_size]
+
+    def __setitem__(self, chunk_hash, chunk_data):
+        self.downloaded[chunk_hash] = chunk_data
+
+    def __len__(self):
+        return len(self.offsets) + len(self.downloaded)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self.offsets.keys()) + list(self.downloaded.keys())
+
+    def get(self, chunk_hash, default=None):
+        if chunk_hash in self:
+            return self[chunk_hash]
+        return default
+
+    def close(self):
+        if self.mm is not None:
+            self.view.release()
+            self.mm.close()
+            self.mm = None
+
+
+def write_store(chunks, index_file, chunk_size=BT_CHUNK_SIZE):
+    # chunks: iterable of (chunkhash, chunkdata)
+    entries = []
+    offset = 0
+    with open(index_file + DATA_SUFFIX, 'wb') as df:
+        for chunk_hash, chunk_data in chunks:
+            if len(chunk_data) != chunk_size:
+                raise ValueError(f"chunk {chunk_hash} has {len(chunk_data)} bytes, expected {chunk_size}")
+            df.write(chunk_data)
+            entries.append(STORE_ENTRY.pack(bytes.fromhex(chunk_hash), offset))
+            offset += chunk_size
+    with open(index_file, 'wb') as f:
+        f.write(STORE_HEADER.pack(STORE_MAGIC, chunk_size, len(entries)))
+        f.write(b''.join(entries))
+
+
+def convert(fragment_file, index_file):
+    with open(fragment_file, 'rb') as f:
+        chunks = pickle.load(f)
+    write_store(chunks.items(), index_file)
+    return list(chunks.keys())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', type=str, help='The pickled .fragment file to convert.')
+    parser.add_argument('output', type=str, help='The chunk store index file, data goes to <output>.data')
+    args = parser.parse_args()
+
+    print(convert(args.input, args.output))
@@ -0,0 +1,257 @@
+import math
+
+"""
+Congestion controllers for the DATA sender.
+
+One controller per receiver sets the cwnd, ssthresh, mode and duplicated_ack of the upload
+(Ack_Record) in progress; the peer only sends up to ack + cwnd and retransmits. The peer calls
+    start(record)                     when an upload begins, a fresh record has Reno's initial state,
+    on_rtt(record, sample_rtt, now)   with every RTT sample of a first transmission,
+    on_ack(record, newly_acked, now)  when the cumulative ack advanced by newly_acked pkts,
+    on_dup_ack(record, now)           on a duplicate ACK, True means fast retransmit ack + 1,
+    on_timeout(record, now)           when a DATA timer fired,
+and with --pace asks pacing_rate(record, srtt) for the pkts/s to spread new DATA at.
+cwnd is in pkts and times are in seconds of whatever clock the peer uses.
+
+Reno is the classic slow start / congestion avoidance / fast recovery (mode 0/1/2). Cubic keeps
+Reno's slow start and recovery but grows the window as a cubic of the time since the last loss
+(RFC 8312), so it refills a long pipe in seconds instead of one pkt per RTT. Bbr estimates the
+bottleneck bandwidth from the delivery rate per round and the min RTT, and keeps the window at
+BBR_CWND_GAIN times their product, probing for more every few rounds. Without --pace it is a
+window-only approximation of BBR. Loss does not shrink the model, but as in BBRv2 it ends
+startup and caps the window (inflight_hi), since a queue shorter than the BDP drops on every round
+otherwise; probing rounds lift the cap again.
+"""
+
+ABC_LIMIT = 2  # slow start grows by at most this many pkts per ACK however many it acks (RFC 3465)
+INIT_SSTHRESH = 64
+
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+BBR_CWND_GAIN = 2
+BBR_MIN_CWND = 4
+BBR_BW_ROUNDS = 10  # the bandwidth estimate is the max delivery rate over this many rounds
+BBR_FULL_BW_GROWTH = 1.25  # startup ends after 3 rounds that grew the bandwidth by less than this
+BBR_MIN_RTT_EXPIRY = 10
+BBR_PROBE_GAINS = [1.25, 0.75, 1, 1, 1, 1, 1, 1]
+BBR_LOSS_BETA = 0.7  # inflight_hi after a loss, relative to the window that lost
+BBR_STARTUP_GAIN = 2.89
+
+# a window is paced out a bit faster than one per RTT so that the window, not the pacer, stays the limit
+PACING_GAIN_SLOW_START = 2
+PACING_GAIN = 1.2
+
+
+class Reno:
+    name = "reno"
+
+    def start(self, record):
+        pass
+
+    def on_rtt(self, record, sample_rtt, now):
+        pass
+
+    def on_ack(self, record, newly_acked, now):
+        record.duplicated_ack = 0
+        if record.mode == 0:
+            record.cwnd += min(newly_acked, ABC_LIMIT)
+            if record.cwnd >= record.ssthresh:
+                record.mode = 1
+                self.enter_avoidance(record, now)
+        elif record.mode == 1:
+            self.avoid(record, newly_acked, now)
+        else:
+            # fast recovery is over
+            record.cwnd = record.ssthresh
+            record.mode = 1
+            self.enter_avoidance(record, now)
+
+    def on_dup_ack(self, record, now):
+        if record.mode == 2:
+            # every further duplicate means one more pkt left the network
+            record.cwnd += 1
+            return False
+        record.duplicated_ack += 1
+        if record.duplicated_ack != 3:
+            return False
+        record.ssthresh = self.reduce(record, now)
+        record.cwnd = record.ssthresh + 3
+        record.mode = 2
+        return True
+
+    def on_timeout(self, record, now):
+        record.ssthresh = self.reduce(record, now)
+        record.cwnd = 1
+        record.duplicated_ack = 0
+        record.mode = 0
+
+    def pacing_rate(self, record, srtt):
+        gain = PACING_GAIN_SLOW_START if record.mode == 0 else PACING_GAIN
+        return gain * record.cwnd / srtt
+
+    def enter_avoidance(self, record, now):
+        pass
+
+    def avoid(self, record, newly_acked, now):
+        record.cwnd += newly_acked / record.cwnd
+
+    def reduce(self, record, now):
+        # the ssthresh after a loss
+        return max(math.floor(record.cwnd / 2), 2)
+
+
+class Cubic(Reno):
+    name = "cubic"
+
+    def __init__(self):
+        self.w_max = None  # cwnd at the last loss
+        self.epoch_start = None  # start of the current avoidance epoch
+        self.k = 0  # seconds from epoch_start until the cubic is back at w_max
+        self.origin = 0
+        self.w_est = 0  # what Reno would have reached since epoch_start
+        self.rtt = None
+
+    def on_rtt(self, record, sample_rtt, now):
+        self.rtt = sample_rtt if self.rtt is None else 0.875 * self.rtt + 0.125 * sample_rtt
+
+    def enter_avoidance(self, record, now):
+        self.epoch_start = now
+        self.w_est = record.cwnd
+        if self.w_max is None or record.cwnd >= self.w_max:
+            # no loss yet, or the window already passed the last loss point: grow from here
+            self.k = 0
+            self.origin = record.cwnd
+        else:
+            self.k = ((self.w_max - record.cwnd) / CUBIC_C) ** (1 / 3)
+            self.origin = self.w_max
+
+    def avoid(self, record, newly_acked, now):
+        if self.epoch_start is None:
+            self.enter_avoidance(record, now)
+        # where the cubic is one RTT ahead, as in RFC 8312
+        t = now - self.epoch_start + (self.rtt or 0)
+        target = self.origin + CUBIC_C * (t - self.k) ** 3
+        # TCP-friendly region: never slower than Reno with the same beta
+        self.w_est += 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * newly_acked / record.cwnd
+        target = max(target, self.w_est)
+        if target > record.cwnd:
+            # at most 1.5x per RTT, the increase is spread over the ACKs of one window
+            record.cwnd += min(target - record.cwnd, record.cwnd / 2) * newly_acked / record.cwnd
+        else:
+            record.cwnd += 0.01 * newly_acked / record.cwnd
+
+    def reduce(self, record, now):
+        # fast convergence: a flow losing below its last w_max leaves room for the others
+        if self.w_max is not None and record.cwnd < self.w_max:
+            self.w_max = record.cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.w_max = record.cwnd
+        self.epoch_start = None
+        return max(math.floor(record.cwnd * CUBIC_BETA), 2)
+
+
+class Bbr(Reno):
+    name = "bbr"
+
+    def __init__(self):
+        self.min_rtt = None
+        self.min_rtt_stamp = 0
+        self.delivered = 0
+        self.round_start = None
+        self.round_delivered = 0
+        self.bw_samples = []  # delivery rate in pkts/s of the last BBR_BW_ROUNDS rounds
+        self.full_bw = 0
+        self.full_bw_rounds = 0
+        self.probe_index = 0
+        self.inflight_hi = None  # window cap learned from loss
+        self.rounds = 0
+        self.loss_round = -1  # the cap is lowered once per round however many pkts it lost
+
+    def on_rtt(self, record, sample_rtt, now):
+        # without a PROBE_RTT phase an expired min is replaced by the next sample
+        if self.min_rtt is None or sample_rtt <= self.min_rtt or now - self.min_rtt_stamp > BBR_MIN_RTT_EXPIRY:
+            self.min_rtt = sample_rtt
+            self.min_rtt_stamp = now
+
+    def start(self, record):
+        # a receiver already measured starts at its modelled window instead of from one pkt
+        self.round_start = None
+        if self.bdp() is not None:
+            record.mode = 1
+            record.cwnd = max(BBR_MIN_CWND, self.bdp())
+
+    def bdp(self):
+        # pkts in flight that fill the pipe, None until a round was measured
+        if len(self.bw_samples) == 0 or self.min_rtt is None:
+            return None
+        return max(self.bw_samples) * self.min_rtt
+
+    def pacing_rate(self, record, srtt):
+        # the measured bandwidth times the gain of the phase, until there is a model like Reno
+        if self.bdp() is None:
+            return super().pacing_rate(record, srtt)
+        gain = BBR_STARTUP_GAIN if record.mode == 0 else BBR_PROBE_GAINS[self.probe_index]
+        return gain * max(self.bw_samples)
+
+    def on_ack(self, record, newly_acked, now):
+        record.duplicated_ack = 0
+        self.delivered += newly_acked
+        if self.round_start is None:
+            self.round_start = now
+            self.round_delivered = self.delivered - newly_acked
+        elif self.min_rtt is not None and now - self.round_start >= self.min_rtt:
+            self.end_round(record, now)
+        if record.mode == 0:
+            # startup: the window doubles every round until the bandwidth stops growing
+            record.cwnd += newly_acked
+            return
+        cwnd = BBR_PROBE_GAINS[self.probe_index] * BBR_CWND_GAIN * self.bdp()
+        if self.inflight_hi is not None:
+            cwnd = min(cwnd, self.inflight_hi)
+        record.cwnd = max(BBR_MIN_CWND, cwnd)
+
+    def end_round(self, record, now):
+        self.bw_samples.append((self.delivered - self.round_delivered) / (now - self.round_start))
+        del self.bw_samples[:-BBR_BW_ROUNDS]
+        self.round_start = now
+        self.round_delivered = self.delivered
+        self.rounds += 1
+        if record.mode == 0:
+            bw = max(self.bw_samples)
+            if bw >= self.full_bw * BBR_FULL_BW_GROWTH:
+                self.full_bw = bw
+                self.full_bw_rounds = 0
+            else:
+                self.full_bw_rounds += 1
+                if self.full_bw_rounds >= 3:
+                    record.mode = 1
+        else:
+            self.probe_index = (self.probe_index + 1) % len(BBR_PROBE_GAINS)
+            if self.inflight_hi is not None:
+                # the cap creeps up every round and jumps on the probing ones
+                self.inflight_hi = self.inflight_hi * max(1, BBR_PROBE_GAINS[self.probe_index]) + 1
+
+    def on_dup_ack(self, record, now):
+        record.duplicated_ack += 1
+        if record.duplicated_ack != 3:
+            return False
+        self.on_loss(record)
+        return True
+
+    def on_timeout(self, record, now):
+        # fall back to one pkt until the next ACK, the model itself is kept
+        self.on_loss(record)
+        record.cwnd = 1
+        record.duplicated_ack = 0
+
+    def on_loss(self, record):
+        # once per round, and not for the timers of a window that already fell back to one pkt
+        if self.bdp() is None or self.loss_round == self.rounds or record.cwnd <= 1:
+            return
+        self.loss_round = self.rounds
+        record.mode = 1
+        self.inflight_hi = max(BBR_MIN_CWND, record.cwnd * BBR_LOSS_BETA)
+
+
+CONTROLLERS = {controller.name: controller for controller in (Reno, Cubic, Bbr)}
@@ -2,45 +2,87 @@ import argparse
 import os
 import math
 import hashlib
-import pickle
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.chunk_sink as chunk_sink
+
+"""
+Chunk an input file into fragments in one streaming pass.
+
+Chunks are read in order and hashed on a thread pool (hashlib releases the GIL on large buffers),
+at most a few per worker in flight, so memory stays flat whatever the size of the input. Each hash
+goes to master.chunkhash as it is known, and each chunk is appended to every fragment that wants
+it, in the streamed pickle layout of util/chunk_sink.py: the fragments load with pickle like the
+old single pickle.dump of {chunkhash: chunkdata}.
+"""
 
 BT_CHUNK_SIZE = 512*1024  # 512K
 SHA1_HASH_SIZE = 20
+IN_FLIGHT_PER_WORKER = 4
 
 def chunk_hash(chunk_btyes):
     sha1_hash = hashlib.sha1()
     sha1_hash.update(chunk_btyes)
     return sha1_hash.hexdigest()
 
-def parse_file(file_dir, chunk_num):
+def chunk_count(file_dir, chunk_num):
     file_size = os.path.getsize(file_dir)
     num_max = math.floor(file_size/BT_CHUNK_SIZE)
     if num_max < chunk_num:
         print(f"Requested {chunk_num} chunks out of max number of chunks: {num_max}, using {num_max} instead of {chunk_num}", file=sys.stderr)
-    num = min(num_max, chunk_num)
-
-    data_chunk = []
-    data_hash = []
+    return min(num_max, chunk_num)
 
-    with open(file_dir, 'rb') as file:
-        for i in range(num):
+def iter_chunks(file_dir, num, workers):
+    # (index from 1, hash, data) in file order, hashed ahead on the pool
+    pending = deque()
+    with open(file_dir, 'rb') as file, ThreadPoolExecutor(max_workers=workers) as pool:
+        for i in range(1, num + 1):
             chunk_byte = file.read(BT_CHUNK_SIZE)
-            data_chunk.append(chunk_byte)
-            data_hash.append(chunk_hash(chunk_byte))
+            pending.append((i, pool.submit(chunk_hash, chunk_byte), chunk_byte))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                index, future, data = pending.popleft()
+                yield index, future.result(), data
+        while len(pending) > 0:
+            index, future, data = pending.popleft()
+            yield index, future.result(), data
+
+class FragmentWriter:
+    def __init__(self, output_file):
+        self.file = open(output_file, 'wb')
+        self.file.write(chunk_sink.PICKLE_HEAD)
 
-    with open("master.chunkhash", 'w') as f:
-        for j in range(len(data_hash)):
-            print(f"{j+1} {data_hash[j]}", file=f)
+    def add(self, chunk_hash, data):
+        chunk_sink.write_entry(self.file, chunk_hash, data)
 
-    return data_chunk, data_hash
+    def close(self):
+        self.file.write(chunk_sink.PICKLE_STOP)
+        self.file.close()
+
+def make_fragments(input_file, chunk_num, fragments, workers=os.cpu_count(), master_file="master.chunkhash"):
+    # fragments: [(output_file, [chunk index from 1])], returns the hashes of each one's chunks in index order
+    num = chunk_count(input_file, chunk_num)
+    for output_file, my_index in fragments:
+        for i in my_index:
+            if not 1 <= i <= num:
+                raise ValueError(f"chunk index {i} of {output_file} is not in 1..{num}")
+    writers = [(FragmentWriter(output_file), set(my_index)) for output_file, my_index in fragments]
+    data_hash = []
+    with open(master_file, 'w') as f:
+        for i, hash_str, data in iter_chunks(input_file, num, workers):
+            print(f"{i} {hash_str}", file=f)
+            data_hash.append(hash_str)
+            for writer, wanted in writers:
+                if i in wanted:
+                    writer.add(hash_str, data)
+    for writer, _ in writers:
+        writer.close()
+    return [[data_hash[i-1] for i in my_index] for _, my_index in fragments]
 
-def make_data(input_file, output_file, chunk_num, my_index):
-    data_chunk, data_hash = parse_file(input_file, chunk_num)
-    my_data = dict(zip([data_hash[i-1] for i in my_index], [data_chunk[i-1] for i in my_index]))
-    with open(output_file, "wb") as wf:
-        pickle.dump(my_data, wf)
-    print([data_hash[i-1] for i in my_index])
+def make_data(input_file, output_file, chunk_num, my_index, workers=os.cpu_count()):
+    print(make_fragments(input_file, chunk_num, [(output_file, my_index)], workers)[0])
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -48,9 +90,11 @@ if __name__ == '__main__':
     parser.add_argument('output', type=str, help='The location of the output file.')
     parser.add_argument("num", type=int, help='Splitted to how many chunks')
     parser.add_argument('index', type=str, help='index of chunks to be included in the output file')
+    parser.add_argument('--fragment', nargs=2, action='append', default=[], metavar=('OUTPUT', 'INDEX'),
+                        help='another output file and its chunk indexes, made in the same pass')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='threads hashing chunks')
     args = parser.parse_args()
 
-    my_input = args.input
-    my_output = args.output
-    my_index = [int(i) for i in args.index.split(",")]
-    make_data(my_input, my_output, args.num, my_index)
\ No newline at end of file
+    fragments = [(output, [int(i) for i in index.split(",")]) for output, index in [(args.output, args.index)] + args.fragment]
+    for hashes in make_fragments(args.input, args.num, fragments, args.workers):
+        print(hashes)
@@ -0,0 +1,195 @@
+import os
+import errno
+import socket
+import struct
+import ctypes
+import ctypes.util
+
+"""
+sendmmsg/recvmmsg through ctypes: many UDP datagrams per syscall.
+
+A Sender sends a list of (head, body, address) in one sendmmsg, a Receiver pulls up to its
+capacity of datagrams in one recvmmsg. Both set up their message arrays once, each message owning
+a fixed slot of one buffer, and touch them per pkt only through memoryviews and pack_into: going
+through ctypes fields per pkt costs more than the syscalls saved (test/batch_io_benchmark.py).
+available() is False off Linux/glibc, callers then stay with one sendto/recvfrom per pkt.
+"""
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+
+class Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class Msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(Iovec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", Msghdr), ("msg_len", ctypes.c_uint)]
+
+
+class SockaddrIn(ctypes.Structure):
+    # sin_port and sin_addr in network byte order
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_uint8 * 4), ("sin_zero", ctypes.c_uint8 * 8)]
+
+
+def _load():
+    if not hasattr(socket, "AF_INET") or os.name != "posix":
+        return None, None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        sendmmsg = libc.sendmmsg
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None, None
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return sendmmsg, recvmmsg
+
+
+_sendmmsg, _recvmmsg = _load()
+
+
+def available():
+    return _sendmmsg is not None and _recvmmsg is not None
+
+
+MSGHDR_SIZE = ctypes.sizeof(Mmsghdr)
+MSG_LEN = struct.Struct("I")  # Mmsghdr.msg_len
+NAMELEN = struct.Struct("I")  # Msghdr.msg_namelen
+IOV_LEN = struct.Struct("N")  # Iovec.iov_len
+ADDR_SIZE = ctypes.sizeof(SockaddrIn)
+
+
+def byte_view(obj):
+    return memoryview(obj).cast("B")
+
+
+class Sender:
+    def __init__(self, fd, capacity=64, slot=2048):
+        self.fd = fd
+        self.capacity = capacity
+        self.slot = slot
+        self.calls = 0  # sendmmsg syscalls made
+        self.__msgs = (Mmsghdr * capacity)()
+        self.__iovs = (Iovec * capacity)()
+        self.__addrs = (SockaddrIn * capacity)()
+        self.__buf = ctypes.create_string_buffer(capacity * slot)
+        for i in range(capacity):
+            self.__iovs[i].iov_base = ctypes.addressof(self.__buf) + i * slot
+            hdr = self.__msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.__addrs[i])
+            hdr.msg_namelen = ADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self.__iovs[i])
+            hdr.msg_iovlen = 1
+        self.__buf_view = byte_view(self.__buf)
+        self.__iov_view = byte_view(self.__iovs)
+        self.__addr_view = byte_view(self.__addrs)
+        self.__sockaddrs = dict()  # {(ip, port): packed sockaddr_in}
+        self.__slot_addrs = [None] * capacity  # the address each slot's sockaddr holds now
+        self.__iov_lens = [i * ctypes.sizeof(Iovec) + Iovec.iov_len.offset for i in range(capacity)]
+
+    def send(self, pkts):
+        # pkts: [(head bytes, body bytes, (ip, port))], head may be b''. Blocks like sendto when the buffer is full
+        buf = self.__buf_view
+        iovs = self.__iov_view
+        slot = self.slot
+        slot_addrs = self.__slot_addrs
+        iov_lens = self.__iov_lens
+        pack_len = IOV_LEN.pack_into
+        for start in range(0, len(pkts), self.capacity):
+            batch = pkts[start:start + self.capacity]
+            offset = 0
+            for i, (head, body, address) in enumerate(batch):
+                mid = offset + len(head)
+                end = mid + len(body)
+                if end - offset > slot:
+                    raise ValueError(f"datagram of {end - offset} bytes does not fit a {slot} byte slot")
+                buf[offset:mid] = head
+                buf[mid:end] = body
+                pack_len(iovs, iov_lens[i], end - offset)
+                if slot_addrs[i] != address:
+                    self.__set_address(i, address)
+                offset += slot
+            sent = 0
+            while sent < len(batch):
+                ret = _sendmmsg(self.fd, ctypes.addressof(self.__msgs) + sent * MSGHDR_SIZE, len(batch) - sent, 0)
+                self.calls += 1
+                if ret < 0:
+                    code = ctypes.get_errno()
+                    raise OSError(code, os.strerror(code))
+                sent += ret
+
+    def __set_address(self, i, address):
+        sockaddr = self.__sockaddrs.get(address)
+        if sockaddr is None:
+            sockaddr = bytes(SockaddrIn(socket.AF_INET, socket.htons(address[1]),
+                                        (ctypes.c_uint8 * 4)(*socket.inet_aton(address[0]))))
+            self.__sockaddrs[address] = sockaddr
+        self.__addr_view[i * ADDR_SIZE:(i + 1) * ADDR_SIZE] = sockaddr
+        self.__slot_addrs[i] = address
+
+
+class Receiver:
+    def __init__(self, fd, capacity=64, bufsize=2048):
+        self.fd = fd
+        self.capacity = capacity
+        self.bufsize = bufsize
+        self.calls = 0  # recvmmsg syscalls made
+        self.__msgs = (Mmsghdr * capacity)()
+        self.__iovs = (Iovec * capacity)()
+        self.__addrs = (SockaddrIn * capacity)()
+        self.__buf = ctypes.create_string_buffer(capacity * bufsize)
+        for i in range(capacity):
+            self.__iovs[i].iov_base = ctypes.addressof(self.__buf) + i * bufsize
+            self.__iovs[i].iov_len = bufsize
+            hdr = self.__msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self.__addrs[i])
+            hdr.msg_namelen = ADDR_SIZE
+            hdr.msg_iov = ctypes.pointer(self.__iovs[i])
+            hdr.msg_iovlen = 1
+        self.__buf_view = byte_view(self.__buf)
+        self.__msg_view = byte_view(self.__msgs)
+        self.__addr_view = byte_view(self.__addrs)
+        self.__senders = dict()  # {sockaddr_in port and address bytes: (ip, port)}
+        self.__msg_lens = [i * MSGHDR_SIZE + Mmsghdr.msg_len.offset for i in range(capacity)]
+        self.__filled = 0  # messages whose msg_namelen the kernel rewrote last time
+
+    def recv(self, count, flags=MSG_DONTWAIT):
+        # [(datagram, (ip, port))], [] when nothing is queued
+        msgs = self.__msg_view
+        for i in range(self.__filled):
+            NAMELEN.pack_into(msgs, i * MSGHDR_SIZE + Msghdr.msg_namelen.offset, ADDR_SIZE)
+        self.__filled = 0
+        ret = _recvmmsg(self.fd, ctypes.addressof(self.__msgs), min(count, self.capacity), flags, None)
+        self.calls += 1
+        if ret < 0:
+            code = ctypes.get_errno()
+            if code in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(code, os.strerror(code))
+        self.__filled = ret
+        buf = self.__buf_view
+        addrs = self.__addr_view
+        senders = self.__senders
+        msg_lens = self.__msg_lens
+        unpack_len = MSG_LEN.unpack_from
+        pkts = []
+        offset = 0
+        for i in range(ret):
+            key = addrs[i * ADDR_SIZE + 2:i * ADDR_SIZE + 8].tobytes()
+            sender = senders.get(key)
+            if sender is None:
+                sender = (socket.inet_ntoa(key[2:]), int.from_bytes(key[:2], "big"))
+                senders[key] = sender
+            pkts.append((buf[offset:offset + unpack_len(msgs, msg_lens[i])[0]].tobytes(), sender))
+            offset += self.bufsize
+        return pkts
@@ -0,0 +1,226 @@
+import sys
+import heapq
+import select
+import socket
+import struct
+import argparse
+from collections import deque
+from itertools import count
+from time import time
+
+"""
+Network simulator in Python, a drop-in for util/hupsim.pl.
+
+It reads the same topo map (src dst bw delay queue-size) and nodes map, and speaks the same
+spiffy header as SimSocket. Packets are routed along the fewest hops, as hupsim does. Every
+direction of a link is a drop-tail queue that follows hupsim's timing: a pkt leaves the
+queue latency + (its bytes + bytes queued ahead of it) / rate after it arrived, and it keeps
+its slot in the queue until then.
+
+Network is the event-driven core. It is given the current time by the caller and never reads
+a clock, so it runs just as well on virtual time. Simulator binds it to a UDP socket and the
+wall clock, and the grader can run it in a thread instead of starting perl.
+
+python3 util/netsim.py -m test/tmp4/topo4.map -n test/tmp4/nodes4.map -p 52305
+"""
+
+SPIFFY_HEADER = struct.Struct('!I4s4sHH')  # node id, src ip, dst ip, src port, dst port
+PACKET_SIZE_MAX = 2048
+QUEUE_MAX = 10
+
+
+def read_nodes(path):
+    # {node id: (ip, port)}
+    nodes = dict()
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            node, ip, port = line.split()[:3]
+            nodes[int(node)] = (ip, int(port))
+    return nodes
+
+
+def read_topo(path):
+    # [(src, dst, bits per second, delay in s, queue size in pkts)]
+    links = []
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.split()
+            queue_max = int(fields[4]) if len(fields) > 4 else QUEUE_MAX
+            links.append((int(fields[0]), int(fields[1]), float(fields[2]), float(fields[3]), queue_max))
+    return links
+
+
+class Link:
+    # one direction of a link
+    def __init__(self, dst, bps, delay, queue_max):
+        self.dst = dst
+        self.rate = bps / 8  # bytes per second
+        self.delay = delay
+        self.queue_max = queue_max
+        self.queue = deque()  # [(departure time, pkt)]
+        self.size = 0  # bytes in queue
+        self.dropped = 0
+        self.sent = 0
+
+    def enqueue(self, pkt, now):
+        # returns the departure time, or None if the queue is full
+        if len(self.queue) >= self.queue_max:
+            self.dropped += 1
+            return None
+        departure = now + self.delay + len(pkt) / self.rate
+        if len(self.queue) > 0:
+            departure += self.size / self.rate
+        self.queue.append((departure, pkt))
+        self.size += len(pkt)
+        return departure
+
+    def dequeue(self, now):
+        # the pkts at the head of the queue that are due
+        due = []
+        while len(self.queue) > 0 and self.queue[0][0] <= now:
+            _, pkt = self.queue.popleft()
+            self.size -= len(pkt)
+            self.sent += 1
+            due.append(pkt)
+        return due
+
+
+class Network:
+    def __init__(self, topo, nodes, deliver):
+        # deliver(pkt, addr) is called when a pkt reaches the node it is addressed to
+        self.nodes = nodes
+        self.node_of = {addr: node for node, addr in nodes.items()}
+        self.deliver = deliver
+        self.links = dict()  # {src: {neighbour: Link}}
+        for src, dst, bps, delay, queue_max in topo:
+            self.links.setdefault(src, dict())[dst] = Link(dst, bps, delay, queue_max)
+            self.links.setdefault(dst, dict())[src] = Link(src, bps, delay, queue_max)
+        self.next_hop = {node: self.__route_from(node) for node in self.links}
+        self.__events = []  # [(time, tie breaker, Link)], one per queued pkt
+        self.__tie = count()
+        self.injected = 0  # pkts sent by peers
+
+    def __route_from(self, src):
+        # Dijkstra with unit weights, ties broken by the lowest node id like hupsim
+        distance = {node: (0 if node == src else float('inf')) for node in self.links}
+        predecessor = dict()
+        done = set()
+        while len(done) < len(distance):
+            node = min((n for n in distance if n not in done), key=lambda n: (distance[n], n))
+            if distance[node] == float('inf'):
+                break
+            done.add(node)
+            for neighbour in sorted(self.links[node]):
+                if distance[neighbour] > distance[node] + 1:
+                    distance[neighbour] = distance[node] + 1
+                    predecessor[neighbour] = node
+        next_hop = dict()
+        for node in predecessor:
+            hop = node
+            while predecessor[hop] != src:
+                hop = predecessor[hop]
+            next_hop[node] = hop
+        return next_hop
+
+    def inject(self, pkt, now):
+        # a pkt sent by a peer enters the network at the node named in its spiffy header
+        if len(pkt) < SPIFFY_HEADER.size:
+            return
+        node = SPIFFY_HEADER.unpack_from(pkt)[0]
+        if node not in self.links:
+            return
+        self.injected += 1
+        self.forward(pkt, node, now)
+
+    def forward(self, pkt, node, now):
+        _, _, dst_ip, _, dst_port = SPIFFY_HEADER.unpack_from(pkt)
+        ip = socket.inet_ntoa(dst_ip)
+        dst = self.node_of.get(("127.0.0.1" if ip == "0.0.0.0" else ip, dst_port))
+        if dst is None:
+            return
+        if dst == node:
+            self.deliver(pkt, self.nodes[dst])
+            return
+        hop = self.next_hop[node].get(dst)
+        if hop is None:
+            return
+        link = self.links[node][hop]
+        departure = link.enqueue(pkt, now)
+        if departure is not None:
+            heapq.heappush(self.__events, (departure, next(self.__tie), link))
+
+    def next_event(self):
+        return self.__events[0][0] if self.__events else None
+
+    def run(self, now):
+        # move every pkt whose departure time has come to the next node
+        events = self.__events
+        while events and events[0][0] <= now:
+            departure, _, link = heapq.heappop(events)
+            for pkt in link.dequeue(departure):
+                self.forward(pkt, link.dst, departure)
+
+    def dropped(self):
+        return sum(link.dropped for links in self.links.values() for link in links.values())
+
+
+class Simulator:
+    # Network on a UDP socket and the wall clock, peers point SIMULATOR at address
+    def __init__(self, topo_map, nodes_map, address, clock=time, tap=None):
+        self.clock = clock
+        self.tap = tap  # tap(pkt, now) sees every pkt a peer sends, spiffy header included
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.network = Network(read_topo(topo_map), read_nodes(nodes_map), self.sock.sendto)
+        self.__running = False
+
+    def serve(self):
+        self.__running = True
+        while self.__running:
+            next_event = self.network.next_event()
+            # wake up at least every 0.1 s to notice stop()
+            wait = 0.1 if next_event is None else min(max(next_event - self.clock(), 0), 0.1)
+            ready, _, _ = select.select([self.sock], [], [], wait)
+            if ready:
+                while True:
+                    try:
+                        pkt, _ = self.sock.recvfrom(PACKET_SIZE_MAX, socket.MSG_DONTWAIT)
+                    except BlockingIOError:
+                        break
+                    now = self.clock()
+                    if self.tap is not None:
+                        self.tap(pkt, now)
+                    self.network.inject(pkt, now)
+            self.network.run(self.clock())
+
+    def stop(self):
+        self.__running = False
+
+    def close(self):
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', type=str, default='topo.map', help='topology map')
+    parser.add_argument('-n', type=str, default='nodes.map', help='nodes map')
+    parser.add_argument('-p', type=int, default=30148, help='port to listen on')
+    parser.add_argument('-i', type=str, default='127.0.0.1', help='address to listen on')
+    parser.add_argument('-v', type=int, default=0, help='verbose level')
+    args = parser.parse_args()
+
+    simulator = Simulator(args.m, args.n, (args.i, args.p))
+    print(f"Listening on {args.p}...")
+    try:
+        simulator.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.v > 0:
+            print(f"{simulator.network.dropped()} packets dropped")
+        simulator.close()
+        sys.exit(0)
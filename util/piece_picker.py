@@ -0,0 +1,68 @@
+import heapq
+from itertools import count
+
+"""
+Availability index for rarest-first piece selection.
+
+hash -> holders and peer -> hashes are kept as sets. Each peer also has a heap of the wanted
+hashes it holds, keyed by the replica count of the hash. Entries are never updated in place:
+when a count changes a new entry is pushed and stale ones are skipped when they reach the top,
+so picking the rarest wanted hash of a peer is O(log n) amortized.
+"""
+
+
+class PiecePicker:
+    def __init__(self):
+        self.holders = dict()  # {chunkhash: set of peer addr}
+        self.peer_hashes = dict()  # {peer addr: set of chunkhash}
+        self.wanted = set()  # hashes to be fetched that have no download in progress
+        self.__heaps = dict()  # {peer addr: [(replica count, tie breaker, chunkhash)]}
+        self.__tie = count()
+
+    def __push(self, chunk_hash):
+        holders = self.holders.get(chunk_hash)
+        if chunk_hash not in self.wanted or not holders:
+            return
+        entry = (len(holders), next(self.__tie), chunk_hash)
+        for addr in holders:
+            heapq.heappush(self.__heaps[addr], entry)
+
+    def add_holder(self, chunk_hash, addr):
+        holders = self.holders.setdefault(chunk_hash, set())
+        if addr in holders:
+            return
+        holders.add(addr)
+        self.peer_hashes.setdefault(addr, set()).add(chunk_hash)
+        self.__heaps.setdefault(addr, [])
+        self.__push(chunk_hash)
+
+    def remove_peer(self, addr):
+        for chunk_hash in self.peer_hashes.pop(addr, set()):
+            self.holders[chunk_hash].discard(addr)
+            self.__push(chunk_hash)
+        self.__heaps.pop(addr, None)
+
+    def want(self, chunk_hash):
+        if chunk_hash in self.wanted:
+            return
+        self.wanted.add(chunk_hash)
+        self.__push(chunk_hash)
+
+    def unwant(self, chunk_hash):
+        self.wanted.discard(chunk_hash)
+
+    def replicas(self, chunk_hash):
+        return len(self.holders.get(chunk_hash, ()))
+
+    def peers(self):
+        return list(self.peer_hashes.keys())
+
+    def pick(self, addr):
+        # the rarest wanted hash that addr holds, or None
+        heap = self.__heaps.get(addr)
+        while heap:
+            replicas, _, chunk_hash = heap[0]
+            if chunk_hash in self.wanted and addr in self.holders[chunk_hash] and replicas == len(self.holders[chunk_hash]):
+                return chunk_hash
+            heapq.heappop(heap)
+        return None
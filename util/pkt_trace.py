@@ -0,0 +1,74 @@
+import sys
+import queue
+import socket
+import struct
+import threading
+from time import time
+
+"""
+Binary per-pkt trace for SimSocket, the cheap alternative to one DEBUG text line per pkt.
+
+Each pkt is one fixed-size record packed straight into a preallocated ring of two halves. When
+a half is full it is handed to a writer thread and the socket goes on filling the other half, so
+the peer never waits on the disk. close() writes what is left.
+
+python3 util/pkt_trace.py log/peer1.trace  # the records as text, like the old log lines
+"""
+
+# time, direction, pkt type, seq, ack, pkt len, remote ip, remote port
+RECORD = struct.Struct('!dBBIIH4sH')
+SENT = 0
+RECEIVED = 1
+RECORDS_PER_HALF = 4096
+
+
+class PktTrace:
+    def __init__(self, path, records_per_half=RECORDS_PER_HALF):
+        self.__half_size = records_per_half * RECORD.size
+        self.__ring = bytearray(2 * self.__half_size)
+        self.__view = memoryview(self.__ring)
+        self.__start = 0  # first byte of the half being filled
+        self.__offset = 0
+        self.__file = open(path, 'wb')
+        self.__queue = queue.Queue()
+        self.__writer = threading.Thread(target=self.__write, daemon=True)
+        self.__writer.start()
+
+    def record(self, direction, pkt_type, seq, ack, pkt_len, address):
+        RECORD.pack_into(self.__ring, self.__offset, time(), direction, pkt_type, seq, ack, pkt_len,
+                         socket.inet_aton(address[0]), address[1])
+        self.__offset += RECORD.size
+        if self.__offset - self.__start == self.__half_size:
+            self.__queue.put(bytes(self.__view[self.__start:self.__offset]))
+            self.__start = self.__half_size - self.__start
+            self.__offset = self.__start
+
+    def __write(self):
+        while True:
+            chunk = self.__queue.get()
+            if chunk is None:
+                return
+            self.__file.write(chunk)
+
+    def close(self):
+        if self.__offset > self.__start:
+            self.__queue.put(bytes(self.__view[self.__start:self.__offset]))
+        self.__queue.put(None)
+        self.__writer.join()
+        self.__file.close()
+
+
+def read_trace(path):
+    # (time, direction, pkt type, seq, ack, pkt len, (ip, port)) per record
+    with open(path, 'rb') as f:
+        data = f.read()
+    for fields in RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]):
+        timestamp, direction, pkt_type, seq, ack, pkt_len, ip, port = fields
+        yield timestamp, direction, pkt_type, seq, ack, pkt_len, (socket.inet_ntoa(ip), port)
+
+
+if __name__ == '__main__':
+    for timestamp, direction, pkt_type, seq, ack, pkt_len, address in read_trace(sys.argv[1]):
+        verb = "sending" if direction == SENT else "Receiving"
+        prep = "to" if direction == SENT else "from"
+        print(f"{timestamp:.6f} {verb} a type{pkt_type} pkt {prep} {address}, seq{seq}, ack{ack}, pkt_len{pkt_len}")
@@ -3,6 +3,19 @@ import socket
 import logging
 import os
 import sys
+import util.pkt_trace as pkt_trace
+import util.packet as packet
+import util.mmsg as mmsg
+
+# per-pkt logging: one DEBUG text line per pkt in log/peerN.log (the default, the concurrency
+# visualizer reads it), binary records in log/peerN.trace, or nothing
+PKT_LOG_TEXT = "text"
+PKT_LOG_TRACE = "trace"
+PKT_LOG_OFF = "off"
+PKT_LOG_MODES = (PKT_LOG_TEXT, PKT_LOG_TRACE, PKT_LOG_OFF)
+
+SPIFFY_HEADER = struct.Struct("I4s4sHH")
+
 
 class SimSocket():
     __glSrcAddr = 0
@@ -10,14 +23,19 @@ class SimSocket():
     __giSpiffyEnabled = False
     __glNodeID = 0
     __gsSpiffyAddr = 0
-    __spiffyHeaderLen = struct.calcsize("I4s4sHH")
-    __stdHeaderLen = struct.calcsize("HBBHHII")
+    __spiffyHeaderLen = SPIFFY_HEADER.size
+    __stdHeaderLen = packet.HEADER_LEN
     
-    def __init__(self, id, address, verbose = 2) -> None:
+    def __init__(self, id, address, verbose = 2, pkt_log = PKT_LOG_TEXT, batch = False, shard = None) -> None:
         self.__address = address
         self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # one of several sockets of a sharded peer on the same port, each shard logs to files of its own
+        log_name = str(id)
+        if shard is not None:
+            self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            log_name = f"{id}.{shard}"
         self.__sock.bind(address)
-        self.__logger = logging.getLogger(f"PEER{id}_LOGGER")
+        self.__logger = logging.getLogger(f"PEER{log_name}_LOGGER")
         self.__logger.setLevel(logging.DEBUG)
         formatter = logging.Formatter(fmt="%(asctime)s -+- %(name)s -+- %(levelname)s -+- %(message)s")
         if verbose > 0:
@@ -34,70 +52,151 @@ class SimSocket():
             sh.setFormatter(formatter)
             self.__logger.addHandler(sh)
 
+        self.__formatter = formatter
+        self.__pkt_log = pkt_log
+        self.__open_logs(log_name)
+        self.__log_pkts = pkt_log == PKT_LOG_TEXT or (verbose == 3)
+        self.__spiffy_heads = dict()  # {address: spiffy header}, the header only depends on the destination
+        self.__logger.info("Start logging")
+        self.__simulator_init(id)
+
+        # batched I/O: sendto only queues, flush() sends the queue with one sendmmsg and
+        # recvfrom_many reads with recvmmsg
+        self.__queue = None
+        if batch:
+            if mmsg.available():
+                self.__queue = []
+                self.__sender = mmsg.Sender(self.__sock.fileno())
+                self.__receiver = mmsg.Receiver(self.__sock.fileno())
+            else:
+                self.__logger.warning("sendmmsg/recvmmsg not available, using one syscall per pkt.")
+
+    def __open_logs(self, log_name):
         # check log dir
         log_dir = "log"
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        fh = logging.FileHandler(filename=os.path.join(log_dir, f"peer{id}.log"), mode="w")
-
-        fh.setLevel(level=logging.DEBUG)
-        fh.setFormatter(formatter)
-        self.__logger.addHandler(fh)
+        os.makedirs(log_dir, exist_ok=True)
+        self.__fh = logging.FileHandler(filename=os.path.join(log_dir, f"peer{log_name}.log"), mode="w")
+
+        # without text pkt logs nothing at DEBUG reaches the file, the pkt path then skips the header
+        # unpack and the message formatting altogether
+        self.__fh.setLevel(level=logging.DEBUG if self.__pkt_log == PKT_LOG_TEXT else logging.INFO)
+        self.__fh.setFormatter(self.__formatter)
+        self.__logger.addHandler(self.__fh)
+        self.__trace = None
+        if self.__pkt_log == PKT_LOG_TRACE:
+            self.__trace = pkt_trace.PktTrace(os.path.join(log_dir, f"peer{log_name}.trace"))
+
+    def worker_logs(self, id, shard):
+        # in a process forked to send on this socket: log to peerN.shard.log/.trace from now on. The parent's
+        # files are left to the parent, a trace buffer inherited from it is dropped unwritten
+        log_name = f"{id}.{shard}"
+        logger = logging.getLogger(f"PEER{log_name}_LOGGER")
+        logger.setLevel(logging.DEBUG)
+        for handler in self.__logger.handlers:
+            if handler is not self.__fh:
+                logger.addHandler(handler)
+        self.__logger = logger
+        self.__open_logs(log_name)
         self.__logger.info("Start logging")
-        self.__simulator_init(id)
 
     def fileno(self):
         return self.__sock.fileno()
     
     def sendto(self, data_bytes, address, flags = 0) -> int:
-        ip, port = address
-        magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("!HBBHHII", data_bytes[:self.__stdHeaderLen])
+        if self.__log_pkts or self.__trace is not None:
+            self.__log_pkt(pkt_trace.SENT, data_bytes, address)
+        if self.__queue is not None:
+            # kept until flush(), so it must not be a view of a buffer the caller reuses
+            body = data_bytes if type(data_bytes) is bytes else bytes(data_bytes)
+            if self.__giSpiffyEnabled:
+                self.__queue.append((self.__spiffy_head(address), body, self.__gsSpiffyAddr))
+            else:
+                self.__queue.append((b"", body, address))
+            return len(body)
         if not self.__giSpiffyEnabled:
-            self.__logger.debug(f"sending a type{pkt_type} pkt to {address} via normal socket, seq{seq}, ack{ack}, pkt_len{pkt_len}")
             return self.__sock.sendto(data_bytes, flags, address)
-        
-        s_head_lDestAddr = socket.inet_aton(ip)
-        s_head_lDestPort = socket.htons(port)
-        s_head_ID = socket.htonl(self.__glNodeID)
-        s_head_lSrcAddr = socket.inet_aton(self.__glSrcAddr)
-        s_head_lSrcPort = socket.htons(self.__gsSrcPort)
-
-        s_head = struct.pack("I4s4sHH", s_head_ID, s_head_lSrcAddr, s_head_lDestAddr, s_head_lSrcPort, s_head_lDestPort)
-
-        s_bytes= s_head + data_bytes
 
-        self.__logger.debug(f"sending a type{pkt_type} pkt to {address} via spiffy, seq{seq}, ack{ack}, pkt_len{pkt_len}")
-        ret = self.__sock.sendto(s_bytes, flags, self.__gsSpiffyAddr)
+        s_head = self.__spiffy_head(address)
+        ret = self.__sock.sendto(s_head + data_bytes, flags, self.__gsSpiffyAddr)
         return ret - len(s_head)
 
+    def __spiffy_head(self, address):
+        s_head = self.__spiffy_heads.get(address)
+        if s_head is None:
+            ip, port = address
+            s_head = SPIFFY_HEADER.pack(socket.htonl(self.__glNodeID), socket.inet_aton(self.__glSrcAddr), socket.inet_aton(ip),
+                                        socket.htons(self.__gsSrcPort), socket.htons(port))
+            self.__spiffy_heads[address] = s_head
+        return s_head
+
+    def flush(self):
+        # send what sendto queued, a no-op without batching
+        if self.__queue:
+            pkts, self.__queue = self.__queue, []
+            self.__sender.send(pkts)
+
     def recvfrom(self, bufsize, flags=0):
         if not self.__giSpiffyEnabled:
             ret = self.__sock.recvfrom(bufsize, flags)
-            magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("!HBBHHII", ret[0][:self.__stdHeaderLen])
-            self.__logger.debug(f"Receiving a type{pkt_type} pkt from {ret[1]} via normal socket, seq{seq}, ack{ack}, pkt_len{pkt_len}")
+            if self.__log_pkts or self.__trace is not None:
+                self.__log_pkt(pkt_trace.RECEIVED, ret[0], ret[1])
             return ret
 
         ret = self.__sock.recvfrom(bufsize+self.__spiffyHeaderLen, flags)
 
-        if ret is not None:
-            simu_bytes, addr = ret
-            _, s_head_lSrcAddr, s_head_lDestAddr, s_head_lSrcPort, s_head_lDestPort = struct.unpack("I4s4sHH", simu_bytes[:self.__spiffyHeaderLen])
-            from_addr = (socket.inet_ntoa(s_head_lSrcAddr), socket.ntohs(s_head_lSrcPort))
-            to_addr = (socket.inet_ntoa(s_head_lDestAddr), socket.ntohs(s_head_lDestPort))
-            data_bytes = simu_bytes[self.__spiffyHeaderLen:]
-
-            magic, team, pkt_type, header_len, pkt_len, seq, ack = struct.unpack("!HBBHHII", data_bytes[:self.__stdHeaderLen])
-            self.__logger.debug(f"Receiving a type{pkt_type} pkt from {from_addr} via spiffy, seq{seq}, ack{ack}, pkt_len{pkt_len}")
-            # check if spiffy header intact
-            if not to_addr == self.__address:
-                self.__logger.error("Packet header corrupted, please check bytes read.")
-                raise Exception("Packet header corrupted!")
-
-        else:
+        if ret is None:
             self.__logger.error("Error on simulator recvfrom")
-        
+        return self.__unwrap(ret[0])
+
+    def recvfrom_many(self, bufsize, count):
+        # up to count pkts that are already queued on the socket, without blocking
+        if self.__queue is None:
+            pkts = []
+            for _ in range(count):
+                try:
+                    pkts.append(self.recvfrom(bufsize, mmsg.MSG_DONTWAIT))
+                except BlockingIOError:
+                    break
+            return pkts
+        pkts = self.__receiver.recv(count)
+        if self.__giSpiffyEnabled:
+            return [self.__unwrap(simu_bytes) for simu_bytes, _ in pkts]
+        if self.__log_pkts or self.__trace is not None:
+            for data_bytes, from_addr in pkts:
+                self.__log_pkt(pkt_trace.RECEIVED, data_bytes, from_addr)
+        return pkts
+
+    def __unwrap(self, simu_bytes):
+        _, s_head_lSrcAddr, s_head_lDestAddr, s_head_lSrcPort, s_head_lDestPort = SPIFFY_HEADER.unpack_from(simu_bytes)
+        from_addr = (socket.inet_ntoa(s_head_lSrcAddr), socket.ntohs(s_head_lSrcPort))
+        to_addr = (socket.inet_ntoa(s_head_lDestAddr), socket.ntohs(s_head_lDestPort))
+        data_bytes = simu_bytes[self.__spiffyHeaderLen:]
+
+        if self.__log_pkts or self.__trace is not None:
+            self.__log_pkt(pkt_trace.RECEIVED, data_bytes, from_addr)
+        # check if spiffy header intact
+        if not to_addr == self.__address:
+            self.__logger.error("Packet header corrupted, please check bytes read.")
+            raise Exception("Packet header corrupted!")
         return (data_bytes, from_addr)
 
+    def io_calls(self):
+        # (sendmmsg, recvmmsg) syscalls so far, None without batching
+        if self.__queue is None:
+            return None
+        return self.__sender.calls, self.__receiver.calls
+
+    def __log_pkt(self, direction, data_bytes, address):
+        magic, team, pkt_type, header_len, pkt_len, seq, ack = packet.HEADER.unpack_from(data_bytes)
+        if self.__trace is not None:
+            self.__trace.record(direction, pkt_type, seq, ack, pkt_len, address)
+        if self.__log_pkts:
+            via = "spiffy" if self.__giSpiffyEnabled else "normal socket"
+            if direction == pkt_trace.SENT:
+                self.__logger.debug(f"sending a type{pkt_type} pkt to {address} via {via}, seq{seq}, ack{ack}, pkt_len{pkt_len}")
+            else:
+                self.__logger.debug(f"Receiving a type{pkt_type} pkt from {address} via {via}, seq{seq}, ack{ack}, pkt_len{pkt_len}")
+
     def __simulator_init(self, nodeid):
         simulator_env = os.getenv("SIMULATOR")
         if simulator_env is None:
@@ -125,5 +224,8 @@ class SimSocket():
         self.__logger.info(msg)
 
     def close(self):
+        self.flush()
         self.__logger.info("socket closed")
+        if self.__trace is not None:
+            self.__trace.close()
         self.__sock.close()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import heapq
+from itertools import count
+
+"""
+Deadline timers for the peer event loop.
+
+Timers live in one heap ordered by deadline. Cancelling only marks the timer and it is dropped
+when it reaches the top, so schedule and cancel are O(log n) and O(1), and the event loop can
+sleep until next_deadline() instead of scanning every in-flight packet on each tick.
+Times are plain floats from whatever clock the caller uses, the queue never reads a clock itself.
+"""
+
+
+class Timer:
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled')
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerQueue:
+    def __init__(self):
+        self.__heap = []  # [(deadline, tie breaker, Timer)]
+        self.__tie = count()
+
+    def __len__(self):
+        return len(self.__heap)
+
+    def schedule(self, deadline, callback, *args):
+        timer = Timer(deadline, callback, args)
+        heapq.heappush(self.__heap, (deadline, next(self.__tie), timer))
+        return timer
+
+    def cancel(self, timer):
+        if timer is not None:
+            timer.cancelled = True
+
+    def next_deadline(self):
+        # the earliest deadline of a live timer, or None
+        heap = self.__heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def run(self, now):
+        # call every timer due at now, in deadline order, and return how many were called.
+        # Timers scheduled by the callbacks run on the next call at the earliest, so a callback
+        # that keeps rescheduling itself into the past cannot hang the loop.
+        heap = self.__heap
+        fired = 0
+        limit = next(self.__tie)
+        while heap and heap[0][0] <= now and heap[0][1] < limit:
+            _, _, timer = heapq.heappop(heap)
+            if timer.cancelled:
+                continue
+            timer.cancelled = True
+            timer.callback(*timer.args)
+            fired += 1
+        return fired
+
+
+class LoopTimers:
+    # the TimerQueue interface on an asyncio loop, every timer is a loop.call_at handle.
+    # Deadlines are given on clock (time.time for the peer) and converted to loop.time().
+    def __init__(self, loop, clock, after=None):
+        self.loop = loop
+        self.clock = clock
+        self.after = after  # called after each timer callback, like the select loop does per iteration
+
+    def schedule(self, deadline, callback, *args):
+        when = self.loop.time() + (deadline - self.clock())
+        return self.loop.call_at(when, self.__fire, callback, args)
+
+    def __fire(self, callback, args):
+        callback(*args)
+        if self.after is not None:
+            self.after()
+
+    def cancel(self, timer):
+        if timer is not None:
+            timer.cancel()
+
+    def next_deadline(self):
+        # the loop sleeps until its own next deadline
+        return None
+
+    def run(self, now):
+        return 0
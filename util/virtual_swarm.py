@@ -0,0 +1,172 @@
+import os
+import sys
+import socket
+import argparse
+import importlib.util
+from time import perf_counter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+import util.bt_utils as bt_utils
+import util.netsim as netsim
+
+"""
+Whole swarms in one process on a virtual clock.
+
+Every peer is its own instance of src/peer.py (the module is executed once per peer, so the
+globals of one peer are not seen by another). Its clock is replaced by the swarm's virtual
+clock and its socket by a VirtualSocket that puts pkts straight into a netsim.Network, the same
+core util/netsim.py runs on the wall clock. The swarm then jumps from one event to the next,
+a network departure or a peer timer, whichever is first, so nothing ever sleeps and a transfer
+that takes minutes on hupsim finishes in seconds.
+
+    swarm = VirtualSwarm("test/tmp5/topo5.map", "test/tmp5/nodes5.map")
+    swarm.add_peer(1, "test/tmp5/fragments/data5-1.fragment", 100)
+    ...
+    swarm.download(1, "test/tmp5/targets/target1.chunkhash", "test/tmp5/results/result1.fragment")
+    swarm.run()  # until every download is done, returns the virtual time
+"""
+
+PEER_SOURCE = os.path.join(os.path.dirname(__file__), "..", "src", "peer.py")
+
+
+class VirtualSocket:
+    # the part of SimSocket the peer uses, sendto enters the network at the peer's node
+    def __init__(self, swarm, identity, address):
+        self.swarm = swarm
+        self.identity = identity
+        self.address = address
+        self.__src = (socket.inet_aton(address[0]), address[1])
+
+    def sendto(self, data, address):
+        header = netsim.SPIFFY_HEADER.pack(self.identity, self.__src[0], socket.inet_aton(address[0]),
+                                           self.__src[1], address[1])
+        self.swarm.network.inject(header + data, self.swarm.now)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class VirtualPeer:
+    def __init__(self, swarm, identity, module, config):
+        self.identity = identity
+        self.module = module
+        self.config = config
+        self.sock = VirtualSocket(swarm, identity, (config.ip, config.port))
+        self.alive = True
+
+
+class VirtualSwarm:
+    def __init__(self, topo_map, nodes_map, peer_source=PEER_SOURCE):
+        self.nodes_map = nodes_map
+        self.peer_source = peer_source
+        self.now = 0.0
+        self.network = netsim.Network(netsim.read_topo(topo_map), netsim.read_nodes(nodes_map), self.__deliver)
+        self.peers = dict()  # {identity: VirtualPeer}
+        self.__by_addr = dict()  # {(ip, port): VirtualPeer}
+        self.__touched = []  # peers that got a pkt in the current step
+
+    def clock(self):
+        return self.now
+
+    def add_peer(self, identity, chunk_file, max_conn, timeout=None, **options):
+        # options are the peer's long flags, e.g. multi_source=True, endgame=2, ack_every=4
+        args = argparse.Namespace(p=self.nodes_map, c=chunk_file, m=max_conn, i=identity, v=0, t=timeout, **options)
+        config = bt_utils.BtConfig(args)
+        spec = importlib.util.spec_from_file_location(f"virtual_peer_{identity}", self.peer_source)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.time = self.clock
+        module.config = config
+        module.init_peers(config)
+        peer = VirtualPeer(self, identity, module, config)
+        self.peers[identity] = peer
+        self.__by_addr[(config.ip, config.port)] = peer
+        return peer
+
+    def download(self, identity, chunkhash_file, output_file):
+        peer = self.peers[identity]
+        peer.module.process_download(peer.sock, chunkhash_file, output_file)
+        peer.module.after_events(peer.sock)
+
+    def crash(self, identity):
+        # the peer stops at once, pkts to it are lost and its timers never fire
+        self.peers[identity].alive = False
+
+    def downloading(self):
+        return any(peer.alive and peer.module.downloading for peer in self.peers.values())
+
+    def __deliver(self, pkt, address):
+        peer = self.__by_addr.get(address)
+        if peer is None or not peer.alive:
+            return
+        _, src_ip, _, src_port, _ = netsim.SPIFFY_HEADER.unpack_from(pkt)
+        peer.module.process_pkt(peer.sock, pkt[netsim.SPIFFY_HEADER.size:], (socket.inet_ntoa(src_ip), src_port))
+        self.__touched.append(peer)
+
+    def next_event(self):
+        deadlines = [self.network.next_event()]
+        deadlines.extend(peer.module.timers.next_deadline() for peer in self.peers.values() if peer.alive)
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def step(self):
+        # advance to the next event and handle everything due then, False once nothing is left to do
+        deadline = self.next_event()
+        if deadline is None:
+            return False
+        self.now = max(self.now, deadline)
+        self.__touched = []
+        self.network.run(self.now)
+        touched = self.__touched
+        for peer in self.peers.values():
+            if peer.alive and peer.module.timers.run(self.now) > 0:
+                touched.append(peer)
+        for peer in dict.fromkeys(touched):
+            if peer.alive:
+                peer.module.after_events(peer.sock)
+        return True
+
+    def run(self, until=None, stop=None):
+        # until is a virtual deadline, stop() is checked after each step, it defaults to "all downloads done"
+        if stop is None:
+            stop = lambda: not self.downloading()
+        while not stop():
+            deadline = self.next_event()
+            if deadline is None or (until is not None and deadline > until):
+                break
+            self.step()
+        return self.now
+
+
+if __name__ == '__main__':
+    """
+    python3 util/virtual_swarm.py -m test/tmp5/topo5.map -n test/tmp5/nodes5.map \
+        -c 1:test/tmp5/fragments/data5-1.fragment -c 2:test/tmp5/fragments/data5-2.fragment ... \
+        -d 1:test/tmp5/targets/target1.chunkhash:test/tmp5/results/result1.fragment
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', type=str, required=True, help='topology map')
+    parser.add_argument('-n', type=str, required=True, help='nodes map')
+    parser.add_argument('-c', action='append', default=[], help='<id>:<chunkfile> of one peer, repeat per peer')
+    parser.add_argument('-d', action='append', default=[], help='<id>:<chunkhash file>:<output file> to download')
+    parser.add_argument('--max-conn', type=int, default=100)
+    parser.add_argument('-t', type=int, default=None, help='pre-defined timeout')
+    parser.add_argument('--until', type=float, default=None, help='virtual seconds to run at most')
+    args = parser.parse_args()
+
+    swarm = VirtualSwarm(args.m, args.n)
+    for item in args.c:
+        identity, chunk_file = item.split(':', 1)
+        swarm.add_peer(int(identity), chunk_file, args.max_conn, timeout=args.t)
+    for item in args.d:
+        identity, chunkhash_file, output_file = item.split(':', 2)
+        swarm.download(int(identity), chunkhash_file, output_file)
+    stime = perf_counter()
+    finish = swarm.run(until=args.until)
+    wall = perf_counter() - stime
+    print(f"virtual {finish:.2f} s in {wall:.2f} s wall, {finish / wall if wall > 0 else float('inf'):.1f}x, "
+          f"{swarm.network.dropped()} pkts dropped")